@@ -14,11 +14,38 @@ __author__ = "dsmirnov@wildapricot.com"
 
 import base64
 import datetime
+import http.client
+import io
 import json
+import logging
+import threading
 import urllib.error
 import urllib.parse
-import urllib.request
-import urllib.response
+from collections.abc import Sequence
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+request_seconds = metrics.histogram(
+    "nametag_wa_api_request_seconds", "Time spent on Wild Apricot API requests", ["kind"]
+)
+request_errors = metrics.counter(
+    "nametag_wa_api_errors_total", "Failed Wild Apricot API requests", ["kind", "reason"]
+)
+
+
+def _timed_request(kind, transport, *args):
+    """Perform a request, recording how long it took and whether it failed."""
+    try:
+        with request_seconds.labels(kind).time():
+            return transport.request(*args)
+    except urllib.error.HTTPError as e:
+        request_errors.labels(kind, e.code).inc()
+        raise
+    except Exception as e:
+        request_errors.labels(kind, type(e).__name__).inc()
+        raise
 
 
 class WaApiClient(object):
@@ -30,15 +57,30 @@ class WaApiClient(object):
     client_id = None
     client_secret = None
 
-    def __init__(self, client_id, client_secret):
+    # Refresh the token this many seconds before it expires
+    refresh_margin = 300
+
+    def __init__(self, client_id, client_secret, timeout=10, refresh_in_background=True):
+        """
+        client_id, client_secret -- credentials of the authorized application
+        timeout -- seconds to wait when connecting to or reading from the API
+        refresh_in_background -- refresh the access token before it expires, rather than
+            on the first request after it expired
+        """
         self.client_id = client_id
         self.client_secret = client_secret
+        self.timeout = timeout
+        self.refresh_in_background = refresh_in_background
+        self._transport = _HttpTransport(timeout)
+        self._token_lock = threading.RLock()
+        self._refresh_timer = None
 
-    def authenticate_with_apikey(self, api_key, scope=None):
+    def authenticate_with_apikey(self, api_key, scope=None, timeout=None):
         """perform authentication by api key and store result for execute_request method
 
         api_key -- secret api key from account settings
         scope -- optional scope of authentication request. If None full list of API scopes will be used.
+        timeout -- seconds to wait when connecting or reading, instead of the client's timeout
         """
         scope = "auto" if scope is None else scope
         data = {
@@ -46,19 +88,8 @@ class WaApiClient(object):
             "scope": scope,
             "obtain_refresh_token": "true",
         }
-        encoded_data = urllib.parse.urlencode(data).encode()
-        request = urllib.request.Request(
-            self.auth_endpoint, encoded_data, method="POST"
-        )
-        request.add_header("ContentType", "application/x-www-form-urlencoded")
-        request.add_header(
-            "Authorization",
-            "Basic "
-            + base64.standard_b64encode(("APIKEY:" + api_key).encode()).decode(),
-        )
-        response = urllib.request.urlopen(request)
-        self._token = WaApiClient._parse_response(response)
-        self._token.retrieved_at = datetime.datetime.now()
+        auth_header = base64.standard_b64encode(("APIKEY:" + api_key).encode()).decode()
+        self._request_token(data, auth_header, timeout)
 
     def authenticate_with_contact_credentials(self, username, password, scope=None):
         """perform authentication by contact credentials and store result for execute_request method
@@ -74,26 +105,19 @@ class WaApiClient(object):
             "password": password,
             "scope": scope,
         }
-        encoded_data = urllib.parse.urlencode(data).encode()
-        request = urllib.request.Request(
-            self.auth_endpoint, encoded_data, method="POST"
-        )
-        request.add_header("ContentType", "application/x-www-form-urlencoded")
         auth_header = base64.standard_b64encode(
             (self.client_id + ":" + self.client_secret).encode()
         ).decode()
-        request.add_header("Authorization", "Basic " + auth_header)
-        response = urllib.request.urlopen(request)
-        self._token = WaApiClient._parse_response(response)
-        self._token.retrieved_at = datetime.datetime.now()
+        self._request_token(data, auth_header)
 
-    def execute_request(self, api_url, api_request_object=None, method=None):
+    def execute_request(self, api_url, api_request_object=None, method=None, timeout=None):
         """
         perform api request and return result as an instance of ApiObject or list of ApiObjects
 
         api_url -- absolute or relative api resource url
         api_request_object -- any json serializable object to send to API
         method -- HTTP method of api request. Default: GET if api_request_object is None else POST
+        timeout -- seconds to wait when connecting or reading, instead of the client's timeout
         """
         if self._token is None:
             raise ApiException(
@@ -110,18 +134,20 @@ class WaApiClient(object):
             else:
                 method = "POST"
 
-        request = urllib.request.Request(api_url, method=method)
+        body = None
         if api_request_object is not None:
-            request.data = json.dumps(
+            body = json.dumps(
                 api_request_object, cls=_ApiObjectEncoder
             ).encode()
 
-        request.add_header("Content-Type", "application/json")
-        request.add_header("Accept", "application/json")
-        request.add_header("Authorization", "Bearer " + self._get_access_token())
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Authorization": "Bearer " + self._get_access_token(timeout),
+        }
 
         try:
-            response = urllib.request.urlopen(request)
+            response = _timed_request("api", self._transport, method, api_url, body, headers, timeout)
             return WaApiClient._parse_response(response)
         except urllib.error.HTTPError as httpErr:
             if httpErr.code == 400:
@@ -129,31 +155,64 @@ class WaApiClient(object):
             else:
                 raise
 
-    def _get_access_token(self):
-        expires_at = self._token.retrieved_at + datetime.timedelta(
+    def close(self):
+        """Stop refreshing the token and close pooled connections."""
+        with self._token_lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+        self._transport.close()
+
+    def _request_token(self, data, auth_header, timeout=None):
+        encoded_data = urllib.parse.urlencode(data).encode()
+        headers = {
+            "ContentType": "application/x-www-form-urlencoded",
+            "Authorization": "Basic " + auth_header,
+        }
+        response = _timed_request("token", self._transport, "POST", self.auth_endpoint, encoded_data, headers, timeout)
+        with self._token_lock:
+            self._token = WaApiClient._parse_response(response)
+            self._token.retrieved_at = datetime.datetime.now(datetime.timezone.utc)
+            self._schedule_refresh()
+
+    def _token_expires_at(self):
+        return self._token.retrieved_at + datetime.timedelta(
             seconds=self._token.expires_in - 100
         )
-        if datetime.datetime.utcnow() > expires_at:
+
+    def _get_access_token(self, timeout=None):
+        with self._token_lock:
+            if datetime.datetime.now(datetime.timezone.utc) > self._token_expires_at():
+                self._refresh_auth_token(timeout)
+            return self._token.access_token
+
+    def _schedule_refresh(self):
+        if not self.refresh_in_background:
+            return
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+        # Short-lived tokens are refreshed halfway through their lifetime
+        delay = max(self._token.expires_in - self.refresh_margin, self._token.expires_in / 2)
+        self._refresh_timer = threading.Timer(delay, self._refresh_in_background)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _refresh_in_background(self):
+        try:
             self._refresh_auth_token()
-        return self._token.access_token
+        except Exception:
+            # The next request will try again once the token has expired
+            logger.exception("Failed to refresh the access token in the background.")
 
-    def _refresh_auth_token(self):
+    def _refresh_auth_token(self, timeout=None):
         data = {
             "grant_type": "refresh_token",
             "refresh_token": self._token.refresh_token,
         }
-        encoded_data = urllib.parse.urlencode(data).encode()
-        request = urllib.request.Request(
-            self.auth_endpoint, encoded_data, method="POST"
-        )
-        request.add_header("ContentType", "application/x-www-form-urlencoded")
         auth_header = base64.standard_b64encode(
             (self.client_id + ":" + self.client_secret).encode()
         ).decode()
-        request.add_header("Authorization", "Basic " + auth_header)
-        response = urllib.request.urlopen(request)
-        self._token = WaApiClient._parse_response(response)
-        self._token.retrieved_at = datetime.datetime.now()
+        self._request_token(data, auth_header, timeout)
 
     @staticmethod
     def _parse_response(http_response):
@@ -169,6 +228,117 @@ class WaApiClient(object):
             return None
 
 
+class _HttpTransport(object):
+    """Pool of keep-alive HTTP(S) connections, so requests skip the TCP and TLS handshakes"""
+
+    # Errors that mean a pooled connection was closed by the server while idle
+    _stale_connection_errors = (
+        http.client.RemoteDisconnected,
+        http.client.CannotSendRequest,
+        http.client.BadStatusLine,
+        ConnectionResetError,
+        BrokenPipeError,
+    )
+
+    def __init__(self, timeout, max_idle_per_host=4):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        perform an HTTP request and return the response, with the body already read
+
+        Raises urllib.error.HTTPError for error statuses, like urlopen does.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        parsed = urllib.parse.urlsplit(url)
+        key = (parsed.scheme, parsed.netloc)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+
+        connection = self._take(key)
+        try:
+            try:
+                response = self._send(connection, method, path, body, headers, timeout)
+            except self._stale_connection_errors:
+                # Pooled connection went away, try once more on a new one
+                connection.close()
+                connection = self._connect(key)
+                response = self._send(connection, method, path, body, headers, timeout)
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._give_back(key, connection)
+
+        if response.status >= 400:
+            raise urllib.error.HTTPError(
+                url, response.status, response.reason, response.headers, io.BytesIO(response.data)
+            )
+        return response
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    @staticmethod
+    def _send(connection, method, path, body, headers, timeout):
+        # Pooled connections keep the timeout of the request that opened them
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        response.data = response.read()
+        return _HttpResponse(response)
+
+    def _take(self, key):
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                return connections.pop()
+        return self._connect(key)
+
+    def _give_back(self, key, connection):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def _connect(self, key):
+        (scheme, netloc) = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+
+class _HttpResponse(object):
+    """Fully read HTTP response, readable like the one urlopen returns"""
+
+    def __init__(self, response):
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.will_close = response.will_close
+        self.data = response.data
+
+    def read(self):
+        return self.data
+
+
 class ApiException(Exception):
     def __init__(self, value):
         self.value = value
@@ -178,32 +348,114 @@ class ApiException(Exception):
 
 
 class ApiObject(object):
-    """Represent any api call input or output object"""
+    """Represent any api call input or output object
+
+    Wraps the decoded JSON dict as is. Nested dicts and lists are only wrapped
+    when they are accessed, so large responses cost little more than the JSON
+    itself.
+    """
+
+    __slots__ = ("_state", "_field_index")
 
     def __init__(self, state):
-        self.__dict__ = state
-        for key, value in vars(self).items():
-            if isinstance(value, dict):
-                self.__dict__[key] = ApiObject(value)
-            elif isinstance(value, list):
-                new_list = []
-                for list_item in value:
-                    if isinstance(list_item, dict):
-                        new_list.append(ApiObject(list_item))
-                    else:
-                        new_list.append(list_item)
-                self.__dict__[key] = new_list
+        object.__setattr__(self, "_state", state)
+        object.__setattr__(self, "_field_index", None)
+
+    def __getattr__(self, name):
+        # Only called for names that aren't methods or set slots. Private
+        # names are never fields, and _state is unset while unpickling.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return _wrap(self._state[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        self._state[name] = value
+        object.__setattr__(self, "_field_index", None)
+
+    def __reduce__(self):
+        # Rebuilt from the JSON object, as setting slots would go through __setattr__
+        return (ApiObject, (self._state,))
+
+    def __delattr__(self, name):
+        try:
+            del self._state[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        object.__setattr__(self, "_field_index", None)
+
+    def get_field_value(self, system_code, default=None):
+        """return the Value of the FieldValues entry with the given SystemCode
+
+        The entries are indexed on first use, so each lookup is O(1). The
+        index holds the entries themselves, so a changed Value is seen.
+        """
+        if self._field_index is None:
+            field_index = {field["SystemCode"]: field for field in self._state.get("FieldValues") or ()}
+            object.__setattr__(self, "_field_index", field_index)
+        if system_code not in self._field_index:
+            return default
+        return _wrap(self._field_index[system_code].get("Value"))
+
+    def to_dict(self):
+        """return the underlying decoded JSON object"""
+        return self._state
 
     def __str__(self):
-        return json.dumps(self.__dict__)
+        return json.dumps(self._state, cls=_ApiObjectEncoder)
+
+    def __repr__(self):
+        return json.dumps(self._state, cls=_ApiObjectEncoder)
+
+
+class ApiList(Sequence):
+    """Read-only view of a list in an api response, wrapping items on access"""
+
+    __slots__ = ("_items",)
+
+    def __init__(self, items):
+        self._items = items
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ApiList(self._items[index])
+        return _wrap(self._items[index])
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        for item in self._items:
+            yield _wrap(item)
+
+    def __eq__(self, other):
+        if isinstance(other, ApiList):
+            return self._items == other._items
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
 
     def __repr__(self):
-        return json.dumps(self.__dict__)
+        return json.dumps(self._items, cls=_ApiObjectEncoder)
+
+
+def _wrap(value):
+    if isinstance(value, dict):
+        return ApiObject(value)
+    if isinstance(value, list):
+        return ApiList(value)
+    return value
 
 
 class _ApiObjectEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, ApiObject):
-            return obj.__dict__
+            return obj._state
+        if isinstance(obj, ApiList):
+            return obj._items
+        if isinstance(obj, datetime.datetime):
+            return obj.isoformat()
         # Let the base class default method raise the TypeError
         return json.JSONEncoder.default(self, obj)
@@ -0,0 +1,358 @@
+"""
+asyncio variant of the Wild Apricot API client.
+
+AsyncWaApiClient has the same methods and request semantics as
+WaApi.WaApiClient, but they are coroutines, so many lookups can be in flight
+on one event loop without holding a thread each. It talks HTTP/1.1 over
+pooled keep-alive connections using only asyncio streams.
+
+Example:
+    api = AsyncWaApiClient(client_id, client_secret)
+    await api.authenticate_with_apikey(api_key)
+    accounts = await api.execute_request("/v2/accounts/")
+    await api.close()
+"""
+import asyncio
+import base64
+import datetime
+import http.client
+import io
+import json
+import logging
+import ssl
+import urllib.error
+import urllib.parse
+
+from .WaApi import ApiException, WaApiClient, _ApiObjectEncoder, request_errors, request_seconds
+
+logger = logging.getLogger(__name__)
+
+
+async def _timed_request(kind, transport, *args):
+    """Perform a request, recording how long it took and whether it failed."""
+    try:
+        with request_seconds.labels(kind).time():
+            return await transport.request(*args)
+    except urllib.error.HTTPError as e:
+        request_errors.labels(kind, e.code).inc()
+        raise
+    except Exception as e:
+        request_errors.labels(kind, type(e).__name__).inc()
+        raise
+
+
+class AsyncWaApiClient(object):
+    """Wild apricot API client for asyncio."""
+
+    auth_endpoint = WaApiClient.auth_endpoint
+    api_endpoint = WaApiClient.api_endpoint
+    refresh_margin = WaApiClient.refresh_margin
+
+    def __init__(self, client_id, client_secret, timeout=10, refresh_in_background=True):
+        """
+        client_id, client_secret -- credentials of the authorized application
+        timeout -- seconds to wait when connecting to or reading from the API
+        refresh_in_background -- refresh the access token before it expires, rather than
+            on the first request after it expired
+        """
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = timeout
+        self.refresh_in_background = refresh_in_background
+        self._transport = _AsyncHttpTransport(timeout)
+        self._token = None
+        self._token_lock = asyncio.Lock()
+        self._refresh_task = None
+
+    async def authenticate_with_apikey(self, api_key, scope=None, timeout=None):
+        """perform authentication by api key and store result for execute_request method
+
+        api_key -- secret api key from account settings
+        scope -- optional scope of authentication request. If None full list of API scopes will be used.
+        timeout -- seconds to wait when connecting or reading, instead of the client's timeout
+        """
+        scope = "auto" if scope is None else scope
+        data = {
+            "grant_type": "client_credentials",
+            "scope": scope,
+            "obtain_refresh_token": "true",
+        }
+        auth_header = base64.standard_b64encode(("APIKEY:" + api_key).encode()).decode()
+        await self._request_token(data, auth_header, timeout)
+
+    async def authenticate_with_contact_credentials(self, username, password, scope=None):
+        """perform authentication by contact credentials and store result for execute_request method
+
+        username -- typically a contact email
+        password -- contact password
+        scope -- optional scope of authentication request. If None full list of API scopes will be used.
+        """
+        scope = "auto" if scope is None else scope
+        data = {
+            "grant_type": "password",
+            "username": username,
+            "password": password,
+            "scope": scope,
+        }
+        await self._request_token(data, self._client_auth_header())
+
+    async def execute_request(self, api_url, api_request_object=None, method=None, timeout=None):
+        """
+        perform api request and return result as an instance of ApiObject or list of ApiObjects
+
+        api_url -- absolute or relative api resource url
+        api_request_object -- any json serializable object to send to API
+        method -- HTTP method of api request. Default: GET if api_request_object is None else POST
+        timeout -- seconds to wait when connecting or reading, instead of the client's timeout
+        """
+        if self._token is None:
+            raise ApiException(
+                "Access token is not abtained. "
+                "Call authenticate_with_apikey or authenticate_with_contact_credentials first."
+            )
+
+        if not api_url.startswith("http"):
+            api_url = self.api_endpoint + api_url
+
+        if method is None:
+            if api_request_object is None:
+                method = "GET"
+            else:
+                method = "POST"
+
+        body = None
+        if api_request_object is not None:
+            body = json.dumps(api_request_object, cls=_ApiObjectEncoder).encode()
+
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Authorization": "Bearer " + await self._get_access_token(timeout),
+        }
+
+        try:
+            response = await _timed_request("api", self._transport, method, api_url, body, headers, timeout)
+            return WaApiClient._parse_response(response)
+        except urllib.error.HTTPError as httpErr:
+            if httpErr.code == 400:
+                raise ApiException(httpErr.read())
+            else:
+                raise
+
+    async def close(self):
+        """Stop refreshing the token and close pooled connections."""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        await self._transport.close()
+
+    def _client_auth_header(self):
+        return base64.standard_b64encode(
+            (self.client_id + ":" + self.client_secret).encode()
+        ).decode()
+
+    async def _request_token(self, data, auth_header, timeout=None):
+        encoded_data = urllib.parse.urlencode(data).encode()
+        headers = {
+            "ContentType": "application/x-www-form-urlencoded",
+            "Authorization": "Basic " + auth_header,
+        }
+        response = await _timed_request(
+            "token", self._transport, "POST", self.auth_endpoint, encoded_data, headers, timeout
+        )
+        self._token = WaApiClient._parse_response(response)
+        self._token.retrieved_at = datetime.datetime.now(datetime.timezone.utc)
+        self._schedule_refresh()
+
+    async def _get_access_token(self, timeout=None):
+        async with self._token_lock:
+            expires_at = self._token.retrieved_at + datetime.timedelta(
+                seconds=self._token.expires_in - 100
+            )
+            if datetime.datetime.now(datetime.timezone.utc) > expires_at:
+                await self._refresh_auth_token(timeout)
+            return self._token.access_token
+
+    def _schedule_refresh(self):
+        if not self.refresh_in_background:
+            return
+        current = asyncio.current_task()
+        if self._refresh_task is not None and self._refresh_task is not current:
+            self._refresh_task.cancel()
+        # Short-lived tokens are refreshed halfway through their lifetime
+        delay = max(self._token.expires_in - self.refresh_margin, self._token.expires_in / 2)
+        self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_later(delay))
+
+    async def _refresh_later(self, delay):
+        await asyncio.sleep(delay)
+        try:
+            async with self._token_lock:
+                await self._refresh_auth_token()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The next request will try again once the token has expired
+            logger.exception("Failed to refresh the access token in the background.")
+
+    async def _refresh_auth_token(self, timeout=None):
+        data = {
+            "grant_type": "refresh_token",
+            "refresh_token": self._token.refresh_token,
+        }
+        await self._request_token(data, self._client_auth_header(), timeout)
+
+
+class _AsyncHttpTransport(object):
+    """Pool of keep-alive HTTP/1.1 connections over asyncio streams"""
+
+    def __init__(self, timeout, max_idle_per_host=4):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}
+        self._ssl_context = None
+
+    async def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        perform an HTTP request and return the response, with the body already read
+
+        Raises urllib.error.HTTPError for error statuses, like urlopen does,
+        and TimeoutError if connecting or the response takes over `timeout`.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        parsed = urllib.parse.urlsplit(url)
+        key = (parsed.scheme, parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80))
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+
+        request_headers = {
+            "Host": parsed.netloc,
+            "Connection": "keep-alive",
+            "Content-Length": str(len(body or b"")),
+        }
+        request_headers.update(headers or {})
+        head = f"{method} {path} HTTP/1.1\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in request_headers.items())
+        payload = head.encode("latin-1") + b"\r\n" + (body or b"")
+
+        (connection, reused) = await self._take(key, timeout)
+        try:
+            try:
+                response = await asyncio.wait_for(self._send(connection, payload), timeout)
+            except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                # Pooled connection went away, try once more on a new one
+                self._close(connection)
+                connection = await self._connect(key, timeout)
+                response = await asyncio.wait_for(self._send(connection, payload), timeout)
+        except BaseException:
+            self._close(connection)
+            raise
+
+        if response.will_close:
+            self._close(connection)
+        else:
+            self._give_back(key, connection)
+
+        if response.status >= 400:
+            raise urllib.error.HTTPError(
+                url, response.status, response.reason, response.headers, io.BytesIO(response.data)
+            )
+        return response
+
+    async def close(self):
+        """Close all idle connections."""
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                self._close(connection)
+
+    async def _send(self, connection, payload):
+        (reader, writer) = connection
+        writer.write(payload)
+        await writer.drain()
+
+        status_line = await reader.readuntil(b"\r\n")
+        (version, status, reason) = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+
+        raw_headers = b""
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            raw_headers += line
+            if line == b"\r\n":
+                break
+        headers = http.client.parse_headers(io.BytesIO(raw_headers))
+
+        will_close = headers.get("Connection", "").lower() == "close" or version == "HTTP/1.0"
+        if headers.get("Transfer-Encoding", "").lower() == "chunked":
+            data = await self._read_chunked(reader)
+        elif headers.get("Content-Length") is not None:
+            data = await reader.readexactly(int(headers["Content-Length"]))
+        else:
+            data = await reader.read()
+            will_close = True
+
+        return _AsyncHttpResponse(int(status), reason, headers, will_close, data)
+
+    @staticmethod
+    async def _read_chunked(reader):
+        data = b""
+        while True:
+            size_line = await reader.readuntil(b"\r\n")
+            size = int(size_line.split(b";")[0], 16)
+            if size == 0:
+                # Skip trailers
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return data
+            data += await reader.readexactly(size)
+            await reader.readexactly(2)
+
+    async def _take(self, key, timeout):
+        connections = self._idle.get(key)
+        while connections:
+            connection = connections.pop()
+            (reader, writer) = connection
+            if not reader.at_eof() and not writer.is_closing():
+                return (connection, True)
+            self._close(connection)
+        return (await self._connect(key, timeout), False)
+
+    def _give_back(self, key, connection):
+        connections = self._idle.setdefault(key, [])
+        if len(connections) < self.max_idle_per_host:
+            connections.append(connection)
+        else:
+            self._close(connection)
+
+    async def _connect(self, key, timeout):
+        (scheme, host, port) = key
+        ssl_context = None
+        if scheme == "https":
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        return await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context), timeout
+        )
+
+    @staticmethod
+    def _close(connection):
+        (_, writer) = connection
+        writer.close()
+
+
+class _AsyncHttpResponse(object):
+    """Fully read HTTP response, readable like the one urlopen returns"""
+
+    def __init__(self, status, reason, headers, will_close, data):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.will_close = will_close
+        self.data = data
+
+    def read(self):
+        return self.data
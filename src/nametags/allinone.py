@@ -0,0 +1,95 @@
+"""
+Run the spooler, webserver, RFID listener and keepalive in one process.
+
+Run separately, each of them imports Pillow, brother_ql and Wand, and keeps
+its own fonts, logo and API client in memory, which adds up on the 1 GB Pi.
+Here they run as threads of one interpreter and share one asset cache, one
+Wild Apricot client and one printer handle. The process's RSS is logged at
+start and once everything is running, to compare with the separate
+processes.
+
+Run it with `python -m nametags.allinone` instead of the separate programs.
+If the RFID reader stops, the whole process exits so supervisord restarts it,
+like the standalone listener.
+"""
+import argparse
+import logging
+import resource
+import threading
+
+from .logconf import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def rss_bytes() -> int:
+    """Return this process's resident set size."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024  # Reported in kB
+    except OSError:
+        pass
+    # Only the peak is available without /proc
+    return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    """Return the largest resident set size this process has had."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # kB on Linux
+
+
+def log_rss(rss_at_start: int):
+    rss = rss_bytes()
+    logger.info(
+        f"RSS is {rss / 2**20:.1f} MB, up {(rss - rss_at_start) / 2**20:.1f} MB from "
+        f"{rss_at_start / 2**20:.1f} MB at start (peak {peak_rss_bytes() / 2**20:.1f} MB)"
+    )
+
+
+def run(host: str = "0.0.0.0", port: int = 80):
+    """Start everything and serve until interrupted or the RFID reader stops."""
+    rss_at_start = rss_bytes()
+
+    import uvicorn
+
+    from .keepalive import keep_printer_awake
+    from .rfid import listen_for_rfid
+    from .spooler import Spooler, start_server
+    from .warmup import warm_up
+    from .webserver import asgi_app
+
+    # The webserver and listener find all of this already done
+    warm_up(api=True, rendering=True, printer=True)
+
+    start_server(Spooler().start())
+    threading.Thread(target=keep_printer_awake, name="keepalive", daemon=True).start()
+
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host=host, port=port))
+
+    def listen():
+        try:
+            listen_for_rfid()
+        except Exception:
+            logger.exception("The RFID listener failed.")
+        server.should_exit = True
+
+    threading.Thread(target=listen, name="rfid-listener", daemon=True).start()
+
+    log_rss(rss_at_start)
+    server.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0", help="Address for the webserver (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=80, help="Port for the webserver (default: 80)")
+    args = parser.parse_args()
+
+    setup_logging()
+    run(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Process-wide cache of loaded label assets.
+
+Rasterizing the SVG logo through ImageMagick and loading FreeType faces from
+disk are the slowest parts of rendering a nametag. Both only need to happen
+once per process, so they are memoized here. Call clear_asset_cache() if the
+files in the assets directory change while the process is running.
+"""
+import logging
+from functools import cache, lru_cache
+from io import BytesIO
+from os import path
+
+from PIL import Image, ImageFont
+
+logger = logging.getLogger(__name__)
+
+# Get the directory of the current script
+script_dir = path.dirname(path.abspath(__file__))
+asset_dir = path.join(script_dir, "assets")
+
+# Path to the font file
+font_path = path.join(asset_dir, "OpenSans-Regular.ttf")
+bold_font_path = path.join(asset_dir, "OpenSans-SemiBold.ttf")
+
+# Path to the logo file
+logo_path = path.join(asset_dir, "ps1-logo-clean-white.svg")
+
+
+def check_assets():
+    """Make sure the asset files exist."""
+    for asset_path in (logo_path, font_path, bold_font_path):
+        if not path.isfile(asset_path):
+            raise FileNotFoundError(f"Font file not found: {asset_path}")
+
+
+@lru_cache(maxsize=256)
+def load_font(font_file: str, size: int) -> ImageFont.FreeTypeFont:
+    """Load a TrueType face at the given size, reusing it on later calls."""
+    # Raises IOError if the font file is not found
+    return ImageFont.truetype(font_file, size)
+
+
+@cache
+def load_logo(logo_file: str, width: int, height: int) -> Image.Image:
+    """Rasterize an SVG logo to an RGBA image of the given size.
+
+    The returned image is shared between callers, so don't modify it.
+    """
+    # Imported here so renders that hit the cache never touch ImageMagick
+    from wand.color import Color
+    from wand.image import Image as WandImage
+
+    logger.info(f"Rasterizing {logo_file} at {width}x{height}")
+
+    # Render the SVG logo into a rasterized image using Wand
+    with WandImage(filename=logo_file, background=Color('transparent'), resolution=300) as wand_image:
+        wand_image.format = 'png'  # Convert the SVG to PNG format
+        wand_image.resize(width, height)  # Resize the image to the desired size
+        logo_png_data = wand_image.make_blob('png')  # Get the PNG data as a binary blob
+
+    logo_image = Image.open(BytesIO(logo_png_data)).convert("RGBA")  # Convert to a Pillow image
+    logo_image.load()
+    return logo_image
+
+
+def clear_asset_cache():
+    """Drop all cached fonts and logos, e.g. after the asset files change."""
+    load_font.cache_clear()
+    load_logo.cache_clear()
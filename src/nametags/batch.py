@@ -0,0 +1,210 @@
+"""
+Render or print many nametags in one go.
+
+Names are read from CSV or JSONL and rendered in a pool of worker processes,
+so a batch pays for the Pillow and brother_ql imports once per core rather
+than once per tag. Results are handled in input order. A failed item is
+reported and skipped; it doesn't stop the batch.
+
+CSV rows are `name[,second_line]`, with an optional `name,second_line`
+header. JSONL lines are objects with a "name" and an optional "second_line".
+"""
+import csv
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Iterator
+
+# Most seconds to wait for the next queued label to finish printing
+PRINT_TIMEOUT = 120.0
+
+
+@dataclass
+class BatchItem:
+    """One nametag to render."""
+
+    index: int
+    name: str
+    second_line: str | None
+    # Set if the input line couldn't be read
+    error: str | None = None
+
+
+def read_items(stream: IO[str], format: str | None = None) -> Iterator[BatchItem]:
+    """Yield items from CSV or JSONL, guessing the format if not given."""
+    lines = iter(stream)
+    first = next(lines, None)
+    if first is None:
+        return
+    if format is None:
+        format = "jsonl" if first.lstrip().startswith("{") else "csv"
+
+    def all_lines():
+        yield first
+        yield from lines
+
+    if format == "jsonl":
+        for (index, line) in enumerate(line for line in all_lines() if line.strip()):
+            try:
+                record = json.loads(line)
+                yield BatchItem(index, str(record["name"]), record.get("second_line"))
+            except (ValueError, KeyError, TypeError) as e:
+                yield BatchItem(index, line.strip(), None, error=f"Bad JSONL line: {e!r}")
+        return
+
+    rows = csv.reader(all_lines())
+    index = 0
+    while True:
+        try:
+            row = next(rows)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            # Report the row and carry on with the next one
+            yield BatchItem(index, f"line {rows.line_num}", None, error=f"Bad CSV row: {e}")
+            index += 1
+            continue
+        if not row or not any(row):
+            continue
+        if index == 0 and [cell.strip().lower() for cell in row[:2]] in (["name"], ["name", "second_line"]):
+            continue
+        name = row[0]
+        second_line = row[1] if len(row) > 1 else None
+        yield BatchItem(index, name, second_line)
+        index += 1
+
+
+def output_filename(item: BatchItem) -> str:
+    """Return a stable, filesystem-safe PNG filename for an item."""
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", item.name).strip("-").lower() or "nametag"
+    return f"{item.index:04d}-{slug[:40]}.png"
+
+
+def render_item(item: BatchItem, output_path: str | None, rotate: bool, to_raster: bool) -> tuple[bytes | None, float]:
+    """Render an item once, to a PNG file and/or printer instructions. Runs in a worker.
+
+    Returns the instructions, if asked for, and how long it took.
+    """
+    from .printer import convert_image, make_image, render_name
+
+    start = time.perf_counter()
+    if output_path is None:
+        # Printing only, which can reuse a cached job
+        raster = render_name(item.name, item.second_line) if to_raster else None
+        return (raster, time.perf_counter() - start)
+
+    image = make_image(item.name, item.second_line)
+    (image.rotate(90, expand=True) if rotate else image).save(output_path)
+    raster = convert_image(image) if to_raster else None
+    return (raster, time.perf_counter() - start)
+
+
+def run_batch(
+    items: Iterator[BatchItem],
+    output_dir: Path | None = None,
+    print_labels: bool = False,
+    rotate: bool = False,
+    jobs: int | None = None,
+    report: IO[str] = sys.stderr,
+) -> int:
+    """Render every item to output_dir and/or print it. Returns the failure count."""
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    ok = 0
+    failed = 0
+    print_jobs = []
+    start = time.perf_counter()
+
+    jobs = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        window = jobs * 2
+        pending: deque[tuple[BatchItem, Future | None]] = deque()
+
+        def finish_oldest():
+            nonlocal ok, failed
+            (item, future) = pending.popleft()
+            if item.error is not None:
+                failed += 1
+                print(f"[{item.index}] FAILED: {item.error}", file=report)
+                return
+            try:
+                (raster, elapsed) = future.result()
+                outputs = []
+                if output_dir is not None:
+                    outputs.append(str(output_dir / output_filename(item)))
+                if print_labels:
+                    outputs.append(f"job {queue_print(item, raster)}")
+            except Exception as e:
+                failed += 1
+                print(f"[{item.index}] {item.name!r}: FAILED: {e}", file=report)
+                return
+            ok += 1
+            print(f"[{item.index}] {item.name!r}: {elapsed * 1000:.1f} ms -> {', '.join(outputs)}", file=report)
+
+        def queue_print(item, raster):
+            from .spooler import submit_print
+
+            job_id = submit_print(item.name, item.second_line, raster)
+            print_jobs.append((item, job_id))
+            return job_id
+
+        for item in items:
+            future = None
+            if item.error is None:
+                output_path = str(output_dir / output_filename(item)) if output_dir is not None else None
+                future = pool.submit(render_item, item, output_path, rotate, print_labels)
+            pending.append((item, future))
+
+            # Bound the work in flight, and hand results over in order
+            while len(pending) > window:
+                finish_oldest()
+
+        while pending:
+            finish_oldest()
+
+    if print_jobs:
+        print_failed = wait_for_print_jobs(print_jobs, report)
+        ok -= print_failed
+        failed += print_failed
+
+    total = time.perf_counter() - start
+    print(f"{ok + failed} items, {failed} failed, in {total:.1f} s", file=report)
+    return failed
+
+
+def wait_for_print_jobs(print_jobs: list, report: IO[str], timeout: float = PRINT_TIMEOUT) -> int:
+    """Wait for queued labels to print. Returns how many failed.
+
+    Gives up once no label finished for `timeout` seconds, e.g. when the
+    printer is stuck, and counts the labels still waiting as failed.
+    """
+    from .spooler import DONE, FAILED, get_job_status
+
+    failed = 0
+    deadline = time.monotonic() + timeout
+    for (item, job_id) in print_jobs:
+        while True:
+            status = get_job_status(job_id)
+            if status is None or status["state"] in (DONE, FAILED) or time.monotonic() >= deadline:
+                break
+            time.sleep(0.1)
+
+        if status is None:
+            error = "job was lost"
+        elif status["state"] == FAILED:
+            error = status["error"]
+        elif status["state"] != DONE:
+            error = f"still {status['state']} after waiting {timeout:.0f} s for the printer"
+        else:
+            deadline = time.monotonic() + timeout
+            continue
+        failed += 1
+        print(f"[{item.index}] {item.name!r}: PRINT FAILED: {error}", file=report)
+    return failed
@@ -0,0 +1,243 @@
+"""
+Benchmarks for the render, convert and lookup hot paths.
+
+Each benchmark is timed and compared to a stored baseline, and the run fails
+if anything got slower than the baseline by more than the tolerance. Times
+are stored relative to a fixed pure-Python calibration workload rather than
+in seconds, so baselines recorded on one Linux box are a fair yardstick on
+another (including the Pi). Re-record them with --save after a deliberate
+change in speed.
+
+Lookups run against a local FakeWildApricot, never the real API.
+
+Usage:
+    python -m nametags.bench             # compare to the stored baselines
+    python -m nametags.bench --save      # record new baselines
+    python -m nametags.bench -k make_image
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from functools import partial
+from importlib import resources
+from pathlib import Path
+from typing import Callable
+
+from .fakewa import LookupFixture
+
+# Shipped as package data, so installed copies can compare too. --save
+# writes here, which in a checkout is the file to commit.
+BASELINES_PATH = Path(str(resources.files(__package__) / "bench_baselines.json"))
+
+# Allowed slowdown before a benchmark counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+# Each benchmark is timed this many times and the fastest is kept, as
+# anything slower was slowed down by something else on the machine
+ROUNDS = 7
+
+# The whole suite is run this many times, interleaved, and the fastest kept
+PASSES = 3
+
+# Rounds are made up of enough calls to take at least this long
+MIN_ROUND_TIME = 0.05
+
+# A benchmark's setup, which returns the function to time
+Benchmark = Callable[[], Callable[[], object]]
+
+NAMES = {
+    "short": ("Bob", None),
+    "long": ("Maximilian Bartholomew Featherstonehaugh", "Electronics, Woodshop and CNC Area Host"),
+    "unicode": ("Zoë Ångström-Søren", "Ça va? Ünïcödé ✓"),
+}
+
+FIT_TEXTS = [
+    "Bob",
+    "Alexandra",
+    "Maximilian Bartholomew Featherstonehaugh",
+    "Zoë Ångström-Søren",
+    "WWWWWWWWWWWWWWWWWWWWWWWWWWWWWW",
+]
+
+
+def calibrate():
+    """A fixed amount of interpreter work to measure the machine by."""
+    total = 0
+    for i in range(100_000):
+        total += (i * 7) % 13
+    return total
+
+
+def time_call(function: Callable[[], object]) -> float:
+    """Return the best seconds per call of a function."""
+    function()  # Warm up caches and lazy imports
+
+    # Find a number of calls per round that is long enough to time
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_ROUND_TIME:
+            break
+        loops *= 2
+
+    times = [elapsed / loops]
+    for _ in range(ROUNDS - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        times.append((time.perf_counter() - start) / loops)
+    return min(times)
+
+
+def make_image_benchmark(name: str, second_line: str | None):
+    from .printer import make_image
+
+    return lambda: make_image(name, second_line)
+
+
+def fit_font_size_benchmark():
+    from .assetcache import font_path
+    from .fitting import clear_fit_cache, fit_font_size
+    from .printer import LABEL_SIZE
+    from .template import get_label_template
+
+    # The width names are fitted to when rendering
+    max_width = get_label_template(LABEL_SIZE).text_max_width
+
+    def run():
+        # Time the fitting itself, not the memo
+        clear_fit_cache()
+        for text in FIT_TEXTS:
+            fit_font_size(text, font_path, max_width, 170)
+    return run
+
+
+def convert_benchmark():
+    from .printer import convert_image, make_image
+
+    image = make_image(*NAMES["long"])
+    return lambda: convert_image(image)
+
+
+def brother_ql_convert_benchmark():
+    """brother_ql's own conversion, to compare the fast path against."""
+    from brother_ql.conversion import convert
+    from brother_ql.raster import BrotherQLRaster
+
+    from .printer import LABEL_SIZE, PRINTER_MODEL, make_image
+
+    image = make_image(*NAMES["long"])
+    return lambda: convert(BrotherQLRaster(PRINTER_MODEL), [image], LABEL_SIZE)
+
+
+def lookup_online_benchmark(fixture: LookupFixture):
+    return lambda: fixture.rfid.lookup_rfid_online("0000000042")
+
+
+def lookup_index_benchmark(fixture: LookupFixture):
+    fixture.rfid.lookup_rfid_online("0000000043")  # Now in the index
+    return lambda: fixture.rfid.lookup_rfid("0000000043")
+
+
+def get_benchmarks(fixture: LookupFixture) -> dict[str, Benchmark]:
+    """Every benchmark by name, with lookups going to the fixture's fake API."""
+    return {
+        **{f"make_image_{kind}": partial(make_image_benchmark, *NAMES[kind]) for kind in NAMES},
+        "fit_font_size": fit_font_size_benchmark,
+        "convert_62x100": convert_benchmark,
+        "brother_ql_convert": brother_ql_convert_benchmark,
+        "lookup_rfid_online": partial(lookup_online_benchmark, fixture),
+        "lookup_rfid_index": partial(lookup_index_benchmark, fixture),
+    }
+
+
+def run_benchmarks(selected: str | None = None, passes: int = PASSES) -> dict[str, float]:
+    """Time every benchmark whose name contains `selected`, in calibration units."""
+    results: dict[str, float] = {}
+    with LookupFixture() as fixture:
+        benchmarks = {
+            name: setup for (name, setup) in get_benchmarks(fixture).items() if selected is None or selected in name
+        }
+        for _ in range(passes):
+            for (name, setup) in benchmarks.items():
+                # Calibrate next to each benchmark, as the machine's speed drifts
+                unit = time_call(calibrate)
+                result = time_call(setup()) / unit
+                results[name] = min(result, results.get(name, result))
+    return results
+
+
+def load_baselines(path: Path) -> dict[str, float]:
+    try:
+        with open(path) as f:
+            return json.load(f)["benchmarks"]
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(path: Path, results: dict[str, float]):
+    baselines = load_baselines(path)
+    baselines.update(results)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "recorded_on": f"{platform.machine()} Python {platform.python_version()}",
+            "benchmarks": {name: float(f"{value:.4g}") for (name, value) in sorted(baselines.items())},
+        }, f, indent=2)
+        f.write("\n")
+
+
+def find_regressions(
+    results: dict[str, float], baselines: dict[str, float], tolerance: float
+) -> list[str]:
+    """Return the benchmarks that are slower than their baseline allows."""
+    return [
+        name for (name, value) in results.items()
+        if name in baselines and value > baselines[name] * (1 + tolerance)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-k", dest="selected", default=None, help="Only run benchmarks whose name contains this")
+    parser.add_argument("--passes", type=int, default=PASSES, help=f"Times to run the suite (default: {PASSES})")
+    parser.add_argument("--save", action="store_true", help="Record the results as the new baselines")
+    parser.add_argument("--baselines", type=Path, default=BASELINES_PATH, help="Baselines file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help=f"Allowed slowdown, as a fraction (default: {DEFAULT_TOLERANCE})",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.selected, args.passes)
+
+    if args.save:
+        save_baselines(args.baselines, results)
+        print(f"Saved {len(results)} baselines to {args.baselines}")
+        return
+
+    baselines = load_baselines(args.baselines)
+    regressions = find_regressions(results, baselines, args.tolerance)
+    print(f"{'benchmark':<24} {'baseline':>10} {'now':>10} {'change':>8}")
+    for (name, value) in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            print(f"{name:<24} {'-':>10} {value:>10.3f} {'new':>8}")
+            continue
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<24} {baseline:>10.3f} {value:>10.3f} {value / baseline - 1:>+8.0%}{flag}")
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
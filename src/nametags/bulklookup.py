@@ -0,0 +1,121 @@
+"""
+Look up many RFID tags in one go, e.g. to audit fobs.
+
+Tags are read one per line and looked up concurrently through the shared,
+authenticated API client, no faster than the rate limit allows. Results are
+written as JSONL, in input order, as soon as they're ready, even while the
+input waits for more tags.
+"""
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Callable, Iterator
+
+# Wild Apricot allows 60 contact requests a minute
+DEFAULT_RATE = 1.0  # requests per second
+DEFAULT_JOBS = 4
+
+
+class RateLimiter:
+    """Token bucket that blocks callers to stay under a rate, shared by threads."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request may be made."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def read_tags(stream: IO[str]) -> Iterator[str]:
+    """Yield the tags in a stream, one per line, skipping blank lines."""
+    for line in stream:
+        tag = line.strip()
+        if tag:
+            yield tag
+
+
+def lookup_tag(rfid_tag: str) -> dict:
+    """Look up a tag via the API and describe every member it matches."""
+    from .rfid import find_members_online, record_to_lines
+
+    members = []
+    for record in find_members_online(rfid_tag):
+        (name, second_line) = record_to_lines(record)
+        members.append({
+            "contact_id": record.contact_id,
+            "rfid": record.rfid_value,
+            "name": name,
+            "second_line": second_line,
+        })
+    return {"rfid_tag": rfid_tag, "found": len(members) == 1, "matches": members}
+
+
+def run_bulk_lookup(
+    tags: Iterator[str],
+    output: IO[str] = sys.stdout,
+    jobs: int = DEFAULT_JOBS,
+    rate: float = DEFAULT_RATE,
+    lookup: Callable[[str], dict] = lookup_tag,
+) -> int:
+    """Look up every tag and write a JSON line for each. Returns how many weren't found."""
+    limiter = RateLimiter(rate)
+    not_found = 0
+
+    def limited_lookup(rfid_tag):
+        limiter.acquire()
+        return lookup(rfid_tag)
+
+    # Results are written by their own thread, as soon as they're ready in
+    # order, rather than whenever the next tag is read
+    pending: queue.Queue[tuple[str, Future] | None] = queue.Queue(maxsize=jobs * 2)
+    write_errors: list[Exception] = []
+
+    def write_results():
+        nonlocal not_found
+        while (entry := pending.get()) is not None:
+            (rfid_tag, future) = entry
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"rfid_tag": rfid_tag, "found": False, "error": str(e)}
+            if not result["found"]:
+                not_found += 1
+            if write_errors:
+                continue  # Keep draining, so reading doesn't block
+            try:
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+            except Exception as e:
+                write_errors.append(e)
+
+    writer = threading.Thread(target=write_results, name="lookup-writer")
+    writer.start()
+    try:
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="lookup") as pool:
+            for rfid_tag in tags:
+                # Blocks while too far ahead of the writer
+                pending.put((rfid_tag, pool.submit(limited_lookup, rfid_tag)))
+    finally:
+        pending.put(None)
+        writer.join()
+
+    if write_errors:
+        raise write_errors[0]
+    return not_found
@@ -4,11 +4,13 @@ import argparse
 import sys
 from pathlib import Path
 
-from .printer import make_image
+from .logconf import setup_logging
 
 
 def render(args):
     """Generate a nametag image from a local name or stdin."""
+    from .printer import make_image
+
     if args.name == "-":
         lines = sys.stdin.read().splitlines()
         if not lines:
@@ -54,6 +56,51 @@ def lookup(args):
         print(second_line)
 
 
+def bulk_lookup(args):
+    """Look up many RFID tags and output JSONL."""
+    try:
+        from .rfid import get_api_client, get_contacts_url
+    except KeyError as e:
+        print(f"Error: Missing environment variable {e}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error: Failed to import rfid module: {e}", file=sys.stderr)
+        sys.exit(1)
+    from .bulklookup import read_tags, run_bulk_lookup
+
+    # Authenticate once, before the lookups share the client
+    get_contacts_url(get_api_client())
+
+    if args.input == "-":
+        not_found = run_bulk_lookup(read_tags(sys.stdin), sys.stdout, args.jobs, args.rate)
+    else:
+        with open(args.input) as f:
+            not_found = run_bulk_lookup(read_tags(f), sys.stdout, args.jobs, args.rate)
+
+    if not_found:
+        sys.exit(1)
+
+
+def batch(args):
+    """Render and/or print many nametags from CSV or JSONL."""
+    from .batch import read_items, run_batch
+
+    if args.output_dir is None and not args.print:
+        print("Error: Pass --output-dir and/or --print", file=sys.stderr)
+        sys.exit(2)
+
+    output_dir = Path(args.output_dir) if args.output_dir is not None else None
+
+    if args.input == "-":
+        failed = run_batch(read_items(sys.stdin, args.format), output_dir, args.print, args.rotate, args.jobs)
+    else:
+        with open(args.input, newline="") as f:
+            failed = run_batch(read_items(f, args.format), output_dir, args.print, args.rotate, args.jobs)
+
+    if failed:
+        sys.exit(1)
+
+
 def main():
     """CLI for nametag printer."""
     parser = argparse.ArgumentParser(description="Nametag printer CLI")
@@ -88,12 +135,83 @@ def main():
     lookup_parser = subparsers.add_parser("lookup", help="Look up a name by RFID tag")
     lookup_parser.add_argument("rfid_tag", help="RFID tag number to look up")
 
+    bulk_lookup_parser = subparsers.add_parser(
+        "bulk-lookup", help="Look up many RFID tags and output JSONL"
+    )
+    bulk_lookup_parser.add_argument(
+        "input",
+        nargs="?",
+        default="-",
+        help="File of RFID tags, one per line, or '-' for stdin (default)",
+    )
+    bulk_lookup_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=4,
+        help="Number of lookups in flight at once (default: 4)",
+    )
+    bulk_lookup_parser.add_argument(
+        "--rate",
+        type=float,
+        default=1.0,
+        help="Most lookups to start per second (default: 1, Wild Apricot's limit)",
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="Render and/or print many nametags from CSV or JSONL"
+    )
+    batch_parser.add_argument(
+        "input",
+        nargs="?",
+        default="-",
+        help="CSV or JSONL file of names and second lines, or '-' for stdin (default)",
+    )
+    batch_parser.add_argument(
+        "--format",
+        "-f",
+        choices=["csv", "jsonl"],
+        default=None,
+        help="Input format (default: guess from the first line)",
+    )
+    batch_parser.add_argument(
+        "--output-dir",
+        "-o",
+        default=None,
+        help="Directory to write PNGs to",
+    )
+    batch_parser.add_argument(
+        "--print",
+        "-p",
+        action="store_true",
+        help="Send the nametags to the printer, in input order",
+    )
+    batch_parser.add_argument(
+        "--rotate",
+        "-r",
+        action="store_true",
+        help="Rotate PNGs 90 degrees (as they would be printed)",
+    )
+    batch_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: one per CPU)",
+    )
+
     args = parser.parse_args()
 
+    setup_logging()
+
     if args.command == "render":
         render(args)
     elif args.command == "lookup":
         lookup(args)
+    elif args.command == "bulk-lookup":
+        bulk_lookup(args)
+    elif args.command == "batch":
+        batch(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,265 @@
+"""
+Local stand-in for the Wild Apricot API.
+
+Serves just enough of the OAuth and contacts endpoints for the nametag
+printer: token requests, the accounts list, and contact searches by RFID or
+last update. Tests, benchmarks and the load harness point a WaApiClient at it
+instead of the real API, or the whole rfid module with a LookupFixture.
+Latency and errors can be injected to see how the client copes.
+
+Example:
+    with FakeWildApricot() as fake:
+        fake.add_contact(1, "0001234567", "Testy")
+        api = fake.make_client()
+        api.execute_request("/v2/accounts/")
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .WaApi import WaApiClient
+
+HOST = "127.0.0.1"
+ACCOUNT_ID = 1
+
+# Field system codes, as in the real account
+RFID_FIELD = "custom-9894255"
+FIRST_NAME_FIELD = "FirstName"
+PREFERRED_NAME_FIELD = "custom-17061153"
+SECOND_LINE_FIELD = "custom-17703390"
+
+SUBSTRINGOF_FILTER = re.compile(r"substringof\('([^']*)', '([^']*)'\)")
+UPDATED_FILTER = re.compile(r"'Profile last updated' ge (\S+)")
+
+
+class FakeWildApricot:
+    """Threaded HTTP server that answers like the Wild Apricot API."""
+
+    def __init__(self, latency: float = 0.0, token_lifetime: int = 1800):
+        self.latency = latency
+        self.token_lifetime = token_lifetime
+        self.contacts: dict[int, dict] = {}
+        self.requests: list[tuple[str, str]] = []
+        self.connections = 0
+        self._errors: list[int] = []
+        self._delays: list[float] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((HOST, 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{HOST}:{self._server.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-wild-apricot", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def make_client(self, api_key: str = "fake", **kwargs) -> WaApiClient:
+        """Return a WaApiClient authenticated against this server."""
+        api = self.configure_client(WaApiClient("fake-id", "fake-secret", **kwargs))
+        api.authenticate_with_apikey(api_key)
+        return api
+
+    def configure_client(self, api):
+        """Point a client at this server."""
+        api.auth_endpoint = self.url + "/auth/token"
+        api.api_endpoint = self.url
+        return api
+
+    def add_contact(
+        self,
+        contact_id: int,
+        rfid: str | None,
+        first_name: str | None,
+        preferred_name: str | None = None,
+        second_line: str | None = None,
+    ):
+        """Add or replace a contact."""
+        with self._lock:
+            self.contacts[contact_id] = {
+                "Id": contact_id,
+                "FirstName": first_name,
+                "ProfileLastUpdated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+                "FieldValues": [
+                    {"FieldName": "RFID", "SystemCode": RFID_FIELD, "Value": rfid},
+                    {"FieldName": "First name", "SystemCode": FIRST_NAME_FIELD, "Value": first_name},
+                    {"FieldName": "Preferred Name", "SystemCode": PREFERRED_NAME_FIELD, "Value": preferred_name},
+                    {"FieldName": "Second Line", "SystemCode": SECOND_LINE_FIELD, "Value": second_line},
+                ],
+            }
+
+    def fail_next(self, count: int = 1, status: int = 500):
+        """Answer the next requests with an error status."""
+        with self._lock:
+            self._errors.extend([status] * count)
+
+    def delay_next(self, count: int = 1, seconds: float = 1.0):
+        """Delay the next requests, on top of the configured latency."""
+        with self._lock:
+            self._delays.extend([seconds] * count)
+
+    def _next_fault(self) -> tuple[int | None, float]:
+        with self._lock:
+            error = self._errors.pop(0) if self._errors else None
+            delay = self._delays.pop(0) if self._delays else 0.0
+        return (error, delay)
+
+    def _search_contacts(self, query: dict) -> list[dict]:
+        with self._lock:
+            contacts = sorted(self.contacts.values(), key=lambda contact: contact["Id"])
+
+        filter = query.get("$filter", [None])[0]
+        if filter is not None:
+            if match := SUBSTRINGOF_FILTER.fullmatch(filter):
+                tag = match.group(2)
+                contacts = [contact for contact in contacts if tag in (self._field(contact, RFID_FIELD) or "")]
+            elif match := UPDATED_FILTER.fullmatch(filter):
+                since = match.group(1)
+                contacts = [contact for contact in contacts if contact["ProfileLastUpdated"] >= since]
+
+        skip = int(query.get("$skip", [0])[0])
+        top = query.get("$top", [None])[0]
+        contacts = contacts[skip:]
+        if top is not None:
+            contacts = contacts[:int(top)]
+        return contacts
+
+    @staticmethod
+    def _field(contact: dict, system_code: str):
+        return next((i["Value"] for i in contact["FieldValues"] if i["SystemCode"] == system_code), None)
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length", 0))
+                if length:
+                    self.rfile.read(length)
+
+                with fake._lock:
+                    fake.requests.append((self.command, self.path))
+
+                (error, delay) = fake._next_fault()
+                time.sleep(fake.latency + delay)
+                if error is not None:
+                    self._reply(error, {"message": "Injected error"})
+                    return
+
+                url = urlsplit(self.path)
+                query = parse_qs(url.query)
+                contacts_path = f"/v2/accounts/{ACCOUNT_ID}/contacts"
+
+                if url.path == "/auth/token":
+                    self._reply(200, {
+                        "access_token": "fake-token",
+                        "token_type": "Bearer",
+                        "expires_in": fake.token_lifetime,
+                        "refresh_token": "fake-refresh-token",
+                    })
+                elif url.path == "/v2/accounts/":
+                    self._reply(200, [{
+                        "Id": ACCOUNT_ID,
+                        "Resources": [{"Name": "Contacts", "Url": fake.url + contacts_path + "/"}],
+                    }])
+                elif url.path == contacts_path:
+                    self._reply(200, {"Contacts": fake._search_contacts(query)})
+                else:
+                    self._reply(404, {"message": "Not found"})
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+class LookupFixture:
+    """Points the rfid module at a FakeWildApricot and a scratch member index.
+
+    The fake has a member for each tag, by default 0000000000 to 0000000199,
+    named in `names`. It answers after `latency` seconds.
+    """
+
+    def __init__(self, tags: list[str] | None = None, latency: float = 0.0):
+        if tags is None:
+            tags = [f"{i:010d}" for i in range(200)]
+        self.names = {tag: f"Member {i}" for (i, tag) in enumerate(tags)}
+        self.latency = latency
+
+    def __enter__(self):
+        # rfid reads its credentials at import
+        for variable in ("WA_CLIENT_ID", "WA_CLIENT_SECRET", "WA_API_KEY"):
+            os.environ.setdefault(variable, "fake")
+        from . import rfid
+        from .memberindex import MemberIndex
+
+        self.rfid = rfid
+        self.fake = FakeWildApricot(self.latency).start()
+        for (i, (tag, name)) in enumerate(self.names.items()):
+            self.fake.add_contact(i, tag, name, None, "Member")
+        self._tempdir = tempfile.TemporaryDirectory()
+
+        self._saved = (rfid._api_client, rfid._contacts_url, rfid._member_index)
+        rfid._api_client = self.fake.make_client(refresh_in_background=False)
+        rfid._contacts_url = None
+        rfid._member_index = MemberIndex(os.path.join(self._tempdir.name, "members.sqlite3"))
+        return self
+
+    def __exit__(self, *exc_info):
+        rfid = self.rfid
+        rfid._api_client.close()
+        (rfid._api_client, rfid._contacts_url, rfid._member_index) = self._saved
+        self.fake.stop()
+        self._tempdir.cleanup()
+
+
+if __name__ == "__main__":
+    with FakeWildApricot() as fake:
+        fake.add_contact(1, "0001234567", "Testy", None, "she/her")
+        fake.add_contact(2, "0007654321", "Nicholas", "Nick")
+        print(f"Fake Wild Apricot listening on {fake.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
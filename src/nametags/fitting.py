@@ -0,0 +1,62 @@
+"""
+Find the largest font size at which a piece of text fits a given width.
+
+Text width grows roughly linearly with the font size, so the first guess is
+scaled from a measurement at the largest size and then refined by bisection.
+That takes a handful of measurements instead of one per 5pt step, and the
+result for each (text, font, width) is memoized so repeat names cost nothing.
+"""
+from functools import lru_cache
+
+from .assetcache import load_font
+
+# Never shrink text below this size, even if it still doesn't fit
+MIN_FONT_SIZE = 10
+
+
+def text_width(text: str, font_file: str, size: int) -> int:
+    """Return the rendered width of the text in pixels."""
+    (left, _, right, _) = load_font(font_file, size).getbbox(text)
+    return int(right - left)
+
+
+@lru_cache(maxsize=1024)
+def fit_font_size(
+    text: str,
+    font_file: str,
+    max_width: int,
+    max_size: int,
+    min_size: int = MIN_FONT_SIZE,
+) -> int:
+    """Return the largest size in [min_size, max_size] where the text fits.
+
+    If the text doesn't fit even at min_size, min_size is returned.
+    """
+    width = text_width(text, font_file, max_size)
+    if width <= max_width:
+        return max_size
+
+    # Sizes in (fits, too_wide) are unknown; fits may not actually fit yet
+    fits = min_size
+    too_wide = max_size
+
+    # Proportional guess, nudged into the unknown range
+    guess = max_size * max_width // max(width, 1)
+
+    # Check the guess and its neighbour first, it's usually off by at most one
+    probe = guess
+    while too_wide - fits > 1:
+        probe = min(max(probe, fits + 1), too_wide - 1)
+        if text_width(text, font_file, probe) <= max_width:
+            fits = probe
+            probe = probe + 1 if probe == guess else (fits + too_wide) // 2
+        else:
+            too_wide = probe
+            probe = probe - 1 if probe == guess else (fits + too_wide) // 2
+
+    return fits
+
+
+def clear_fit_cache():
+    """Forget all memoized font sizes, e.g. after the fonts change."""
+    fit_font_size.cache_clear()
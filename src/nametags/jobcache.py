@@ -0,0 +1,131 @@
+"""
+Cache of converted Brother QL raster jobs.
+
+Members scan the same fob every visit, and the same name always renders and
+converts to the same raster bytes. Keeping the final instructions around lets
+a repeat print go straight to the printer. Entries live in memory, bounded by
+total size, and optionally in a directory so they survive restarts.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from .template import TEMPLATE_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+def raster_job_key(name: str, second_line: str | None, label_size: str, model: str) -> str:
+    """Return the cache key for a nametag print job."""
+    # Same normalization as make_image, so "" and None share an entry
+    if second_line is not None:
+        second_line = second_line.strip() or None
+    key_data = json.dumps([name, second_line, label_size, model, TEMPLATE_VERSION])
+    return hashlib.sha256(key_data.encode()).hexdigest()
+
+
+class RasterJobCache:
+    """LRU cache of raster job bytes, with an optional on-disk tier."""
+
+    def __init__(self, max_bytes: int, cache_dir: str | None = None, max_disk_bytes: int | None = None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes if max_disk_bytes is not None else max_bytes * 4
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> bytes | None:
+        """Return the cached job, or None if it isn't cached."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+
+        data = self._read_disk(key)
+        if data is not None:
+            self._put_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Store a job, evicting the least recently used ones as needed."""
+        self._put_memory(key, data)
+        self._write_disk(key, data)
+
+    def clear(self):
+        """Drop every cached job, including the ones on disk."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        for entry in self._disk_entries():
+            os.remove(entry.path)
+
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _disk_path(self, key: str) -> str | None:
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, f"{key}.bin")
+
+    def _disk_entries(self) -> list[os.DirEntry]:
+        if self.cache_dir is None:
+            return []
+        return [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".bin")]
+
+    def _read_disk(self, key: str) -> bytes | None:
+        path = self._disk_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Failed to read cached raster job {key}: {e}")
+            return None
+        # Touch the file so disk eviction is least recently used, too
+        os.utime(path)
+        return data
+
+    def _write_disk(self, key: str, data: bytes):
+        path = self._disk_path(key)
+        if path is None:
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+        except OSError as e:
+            logger.warning(f"Failed to write cached raster job {key}: {e}")
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_disk_bytes:
+                break
+            total -= entry.stat().st_size
+            os.remove(entry.path)
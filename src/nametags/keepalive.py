@@ -1,29 +1,81 @@
 """
 The Brother QL-800 printer seems to go to sleep after a period of inactivity.
 This module periodically sends a status request to keep it awake.
+
+A print or status request in the last KEEPALIVE_INTERVAL seconds already
+kept it awake, so no request is sent then. While the printer is missing
+(unplugged or switched off), requests back off up to KEEPALIVE_MAX_INTERVAL.
+Each status is logged when it changes, and published as metrics by the
+printer handle.
+
+The spooler daemon runs this in a thread, since it holds the printer open.
+Running this module on its own is only useful without the spooler.
 """
 import logging
 import time
+from os import environ
 
-from brother_ql.backends.helpers import status as status_fn
-
+from . import metrics
 from .logconf import setup_logging
-from .printer import get_printer_id
+from .printer import get_printer_handle
+
+logger = logging.getLogger(__name__)
+
+# Seconds the printer may sit idle before it's pinged
+KEEPALIVE_INTERVAL = int(environ.get("KEEPALIVE_INTERVAL", 300))
+
+# Longest wait between pings while the printer doesn't answer
+KEEPALIVE_MAX_INTERVAL = 3600
 
-setup_logging()
+pings = metrics.counter("nametag_printer_keepalive_total", "Keepalive checks, by result", ["result"])
+
+
+def backoff_seconds(failures: int) -> float:
+    """Seconds to wait before pinging again after this many failures in a row."""
+    return min(KEEPALIVE_INTERVAL * 2 ** (failures - 1), KEEPALIVE_MAX_INTERVAL)
+
+
+def describe_status(status: dict) -> str:
+    """Summarize a printer status for the log."""
+    media = f"{status['media_type']} {status['media_width']}x{status['media_length']}"
+    if status["errors"]:
+        return f"{media}, errors: {', '.join(status['errors'])}"
+    return f"{media}, no errors"
 
 
 def keep_printer_awake():
+    handle = get_printer_handle()
+    failures = 0
+    description = None
     while True:
-        status_fn(
-            printer_model="QL-800",
-            printer_identifier=get_printer_id(),
-            backend_identifier='pyusb',
-        )
-        time.sleep(300)  # Every 5 minutes
+        if failures:
+            time.sleep(backoff_seconds(failures))
+        else:
+            idle_seconds = handle.idle_seconds()
+            if idle_seconds is not None and idle_seconds < KEEPALIVE_INTERVAL:
+                time.sleep(KEEPALIVE_INTERVAL - idle_seconds)
+                # Skip the ping if a print kept the printer awake meanwhile
+                if handle.idle_seconds() < KEEPALIVE_INTERVAL:
+                    pings.labels("skipped").inc()
+                    continue
+
+        try:
+            status = handle.status()
+        except Exception as e:
+            failures += 1
+            pings.labels("failed").inc()
+            logger.warning(f"Failed to get printer status, retrying in {backoff_seconds(failures):.0f} s: {e}")
+            continue
+
+        failures = 0
+        pings.labels("ok").inc()
+        if describe_status(status) != description:
+            description = describe_status(status)
+            logger.info(f"Printer status: {description}")
 
 
 if __name__ == "__main__":
+    setup_logging()
     try:
         keep_printer_awake()
     except KeyboardInterrupt:
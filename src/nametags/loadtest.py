@@ -0,0 +1,318 @@
+"""
+Replay a rush of RFID scans through the whole system, without hardware.
+
+Scans are typed into a FakeInputDevice, so listen_for_rfid() reads them with
+the same reader thread and key events as the real reader. Lookups go to a
+local FakeWildApricot with the chosen latency, and labels are rendered and
+printed through the spooler and PrinterHandle onto a LabelSink, which drops
+them or appends them to a file. The report gives throughput, scan-to-label
+latency and the scans that never got a label.
+
+A script has one scan per line: seconds since the start, the tag, and
+"unknown" if the tag isn't a member's. Without a script, a rush of members
+checking in is generated.
+
+Every scan is looked up online unless --warm-index syncs the member index
+first, like a listener that has been running for a while.
+
+Usage:
+    python -m nametags.loadtest --scans 100 --rate 2
+    python -m nametags.loadtest --script rush.txt --api-latency 0.5 --print-seconds 1
+    python -m nametags.loadtest --warm-index
+"""
+import argparse
+import logging
+import math
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from functools import partial
+from typing import IO, NamedTuple
+
+from .logconf import setup_logging
+
+DEFAULT_SCANS = 100
+DEFAULT_RATE = 2.0  # scans per second
+
+# Most seconds to wait for labels after the last scan
+DRAIN_SECONDS = 60.0
+
+
+class Scan(NamedTuple):
+    at: float  # Seconds since the start
+    tag: str
+    member: bool = True
+
+
+@dataclass
+class LoadReport:
+    """What came of a replayed rush."""
+
+    scans: int
+    expected: int  # Scans that should print a label
+    dropped: int  # Expected labels that never printed
+    extra: int  # Labels nobody expected, e.g. repeat scans that printed
+    seconds: float  # From the first scan to the last label
+    latencies: list[float] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """Labels printed per second."""
+        return len(self.latencies) / self.seconds if self.seconds else 0.0
+
+    def percentile(self, percent: float) -> float | None:
+        """Scan-to-label latency below which `percent` of labels printed."""
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[max(math.ceil(percent / 100 * len(latencies)) - 1, 0)]
+
+
+def read_script(stream: IO[str]) -> list[Scan]:
+    """Read scans from a script, skipping blank lines and # comments."""
+    scans: list[Scan] = []
+    for line in stream:
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) not in (2, 3) or fields[2:] not in ([], ["unknown"]):
+            raise ValueError(f"Expected '<seconds> <tag> [unknown]', got {line.strip()!r}")
+        scans.append(Scan(float(fields[0]), fields[1], len(fields) == 2))
+    return sorted(scans, key=lambda scan: scan.at)
+
+
+def make_rush(
+    count: int = DEFAULT_SCANS, rate: float = DEFAULT_RATE, repeats: float = 0.1, unknown: float = 0.05, seed: int = 0
+) -> list[Scan]:
+    """Generate members checking in at random, `rate` scans a second on average.
+
+    Each member scans once, but some tap their fob again right away, and
+    some scans are of tags that aren't members'.
+    """
+    rng = random.Random(seed)
+    scans: list[Scan] = []
+    at = 0.0
+    members = 0
+    while len(scans) < count:
+        if scans and rng.random() < repeats:
+            previous = scans[-1]
+            scans.append(Scan(round(previous.at + rng.uniform(0.2, 2.0), 3), previous.tag, previous.member))
+            continue
+        at = max(at, scans[-1].at if scans else 0.0) + rng.expovariate(rate)
+        if rng.random() < unknown:
+            scans.append(Scan(round(at, 3), f"9{rng.randrange(10 ** 9):09d}", False))
+        else:
+            scans.append(Scan(round(at, 3), f"{members:010d}"))
+            members += 1
+    return scans
+
+
+def expected_labels(scans: list[Scan], dedupe_seconds: float) -> list[bool]:
+    """Whether each scan should print a label: a member's, and not a repeat."""
+    last_scanned: dict[str, float] = {}
+    expected = []
+    for scan in scans:
+        previous = last_scanned.get(scan.tag)
+        last_scanned[scan.tag] = scan.at
+        expected.append(scan.member and (previous is None or scan.at - previous >= dedupe_seconds))
+    return expected
+
+
+class LabelRecorder:
+    """Render and send for the spooler, noting when each name's label printed.
+
+    The spooler prints jobs in the order it rendered them, so each send is
+    for the oldest rendered name.
+    """
+
+    def __init__(self, handle):
+        from .printer import render_name, send_raster
+
+        self._render = render_name
+        self._send = partial(send_raster, handle=handle)
+        self._rendered: deque[str] = deque()
+        self._lock = threading.Lock()
+        self.printed: dict[str, list[float]] = defaultdict(list)
+
+    def render(self, name: str, second_line: str | None) -> bytes:
+        qr_data = self._render(name, second_line)
+        self._rendered.append(name)
+        return qr_data
+
+    def send(self, qr_data: bytes) -> dict:
+        name = self._rendered.popleft()
+        status = self._send(qr_data)
+        if status["did_print"]:
+            with self._lock:
+                self.printed[name].append(time.monotonic())
+        return status
+
+    def count(self) -> int:
+        with self._lock:
+            return sum(len(times) for times in self.printed.values())
+
+
+def replay(device, scans: list[Scan]) -> list[float]:
+    """Type each scan into the device on schedule and return when each was typed."""
+    start = time.monotonic()
+    scanned_at = []
+    for scan in scans:
+        delay = start + scan.at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        device.scan(scan.tag)
+        scanned_at.append(time.monotonic())
+    return scanned_at
+
+
+def summarize(
+    scans: list[Scan],
+    expected: list[bool],
+    scanned_at: list[float],
+    names: dict[str, str],
+    printed: dict[str, list[float]],
+) -> LoadReport:
+    """Match each expected label to the first label printed for its name after the scan."""
+    unmatched = {name: sorted(times) for (name, times) in printed.items()}
+    latencies = []
+    dropped = 0
+    last_label = scanned_at[0] if scanned_at else 0.0
+    for (scan, expect, at) in zip(scans, expected, scanned_at):
+        if not expect:
+            continue
+        times = unmatched.get(names[scan.tag], [])
+        label_at = next((t for t in times if t >= at), None)
+        if label_at is None:
+            dropped += 1
+            continue
+        times.remove(label_at)
+        latencies.append(label_at - at)
+        last_label = max(last_label, label_at)
+
+    return LoadReport(
+        scans=len(scans),
+        expected=sum(expected),
+        dropped=dropped,
+        extra=sum(len(times) for times in unmatched.values()),
+        seconds=last_label - scanned_at[0] if scanned_at else 0.0,
+        latencies=latencies,
+    )
+
+
+def run_load(
+    scans: list[Scan],
+    api_latency: float = 0.0,
+    print_seconds: float = 0.0,
+    output: str | None = None,
+    drain_seconds: float = DRAIN_SECONDS,
+    warm_index: bool = False,
+) -> LoadReport:
+    """Replay scans through listen_for_rfid() against a fake API and printer.
+
+    With `warm_index`, the member index is synced before the rush, so scans
+    are answered locally instead of waiting on the API.
+    """
+    from .fakewa import LookupFixture
+
+    members = list(dict.fromkeys(scan.tag for scan in scans if scan.member))
+    with LookupFixture(members, api_latency) as lookups:
+        from .printer import PRINTER_MODEL
+        from .printerhandle import PrinterHandle, sink_backend
+        from .rfidreader import EvdevReader, FakeInputDevice
+        from .spooler import Spooler
+        from .warmup import warm_up
+
+        rfid = lookups.rfid
+        expected = expected_labels(scans, rfid.RFID_DEDUPE_SECONDS)
+        rfid._last_scanned.clear()
+        rfid._not_found_until.clear()
+
+        backend_identifier = "null" if output is None else f"file:{output}"
+        handle = PrinterHandle(backend_identifier, PRINTER_MODEL, backend=sink_backend(output, print_seconds))
+        recorder = LabelRecorder(handle)
+        spooler = Spooler(recorder.render, recorder.send).start()
+
+        if warm_index:
+            rfid.sync_member_index(full=True)
+        # Like a restart before the rush, so the first scans don't pay for it
+        warm_up(api=True, rendering=True)
+        handle.identifier  # Opens the fake printer
+
+        device = FakeInputDevice()
+        # The listener's sync would fill the index behind the rush's back, and
+        # neither it nor the scrape file writer would stop when the run ends
+        listener = threading.Thread(
+            target=rfid.listen_for_rfid,
+            args=(EvdevReader(device).start(), spooler.submit),
+            kwargs={"sync": False, "scrape_metrics": False},
+            name="loadtest-listener",
+            daemon=True,
+        )
+        listener.start()
+        scanned_at = replay(device, scans)
+
+        deadline = time.monotonic() + drain_seconds
+        while recorder.count() < sum(expected) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        device.close()
+        listener.join(drain_seconds)
+
+    return summarize(scans, expected, scanned_at, lookups.names, recorder.printed)
+
+
+def format_report(report: LoadReport) -> str:
+    def seconds(value: float | None) -> str:
+        return "-" if value is None else f"{value:.3f} s"
+
+    return "\n".join([
+        f"{'scans':<16} {report.scans}",
+        f"{'labels expected':<16} {report.expected}",
+        f"{'labels printed':<16} {len(report.latencies)}",
+        f"{'dropped scans':<16} {report.dropped}",
+        f"{'extra labels':<16} {report.extra}",
+        f"{'throughput':<16} {report.throughput:.2f} labels/s",
+        f"{'p50 latency':<16} {seconds(report.percentile(50))}",
+        f"{'p99 latency':<16} {seconds(report.percentile(99))}",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--script", type=argparse.FileType("r"), help="Scans to replay, instead of a generated rush")
+    parser.add_argument("--scans", type=int, default=DEFAULT_SCANS, help=f"Scans to generate (default: {DEFAULT_SCANS})")
+    parser.add_argument(
+        "--rate", type=float, default=DEFAULT_RATE, help=f"Generated scans per second (default: {DEFAULT_RATE})"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated rush")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Seconds the fake API takes to answer")
+    parser.add_argument("--print-seconds", type=float, default=0.0, help="Seconds the fake printer takes per label")
+    parser.add_argument("--output", help="Append the printed labels' raster instructions to this file")
+    parser.add_argument(
+        "--warm-index", action="store_true", help="Sync the member index before the rush, so scans skip the API"
+    )
+    parser.add_argument(
+        "--drain", type=float, default=DRAIN_SECONDS, help=f"Most seconds to wait for labels (default: {DRAIN_SECONDS:.0f})"
+    )
+    parser.add_argument("--verbose", action="store_true", help="Log what the listener, spooler and printer do")
+    args = parser.parse_args()
+
+    # The reader stopping at the end would otherwise be logged as an error
+    setup_logging(logging.INFO if args.verbose else logging.CRITICAL)
+
+    if args.script is not None:
+        with args.script:
+            scans = read_script(args.script)
+    else:
+        scans = make_rush(args.scans, args.rate, seed=args.seed)
+
+    report = run_load(scans, args.api_latency, args.print_seconds, args.output, args.drain, args.warm_index)
+    print(format_report(report))
+    if report.dropped:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,8 @@ Logging configuration for the nametags application.
 import logging
 
 
-def setup_logging():
+def setup_logging(level: int = logging.INFO):
     logging.basicConfig(
-        level=logging.INFO,
+        level=level,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     )
@@ -0,0 +1,186 @@
+"""
+Local index of members by RFID tag.
+
+Looking a tag up in Wild Apricot takes a network round trip and a
+server-side substring scan, and fails outright when the Wi-Fi drops. This
+module keeps the few fields a nametag needs in a small SQLite database keyed
+by tag, so a scan can be answered locally. Filling and refreshing the index
+from the API is done by the rfid module.
+"""
+import logging
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from os import makedirs, path
+from typing import Iterable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# RFID tags as read by the scanner; a contact's field may hold several
+TAG_PATTERN = re.compile(r"\d+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+    contact_id INTEGER PRIMARY KEY,
+    rfid_value TEXT,
+    first_name TEXT,
+    preferred_name TEXT,
+    second_line TEXT
+);
+CREATE TABLE IF NOT EXISTS tags (
+    tag TEXT NOT NULL,
+    contact_id INTEGER NOT NULL REFERENCES members(contact_id) ON DELETE CASCADE,
+    PRIMARY KEY (tag, contact_id)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS answers (
+    tag TEXT PRIMARY KEY,
+    first_line TEXT,
+    second_line TEXT,
+    answered_at TEXT
+);
+"""
+
+
+class MemberRecord(NamedTuple):
+    """The fields of a contact that a nametag needs."""
+
+    contact_id: int
+    rfid_value: str | None
+    first_name: str | None
+    preferred_name: str | None
+    second_line: str | None
+
+
+class MemberIndex:
+    """SQLite-backed map of RFID tags to member records."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        if db_path != ":memory:":
+            makedirs(path.dirname(path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        # Answers this process already stored, to skip rewriting them
+        self._stored_answers: dict[str, tuple[str, str | None]] = {}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def lookup(self, rfid_tag: str) -> list[MemberRecord]:
+        """Return every member whose RFID field holds the tag."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT m.contact_id, m.rfid_value, m.first_name, m.preferred_name, m.second_line"
+                " FROM tags t JOIN members m ON m.contact_id = t.contact_id"
+                " WHERE t.tag = ?",
+                (rfid_tag,),
+            ).fetchall()
+        return [MemberRecord(*row) for row in rows]
+
+    def count(self) -> int:
+        """Return the number of indexed members."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+
+    def upsert(self, records: Iterable[MemberRecord]):
+        """Insert or update members, replacing their indexed tags."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for record in records:
+                    self._upsert_one(record)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def replace_all(self, records: Iterable[MemberRecord]):
+        """Replace the whole index, e.g. after a full load."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM tags")
+                self._conn.execute("DELETE FROM members")
+                for record in records:
+                    self._upsert_one(record)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _upsert_one(self, record: MemberRecord):
+        self._conn.execute(
+            "INSERT INTO members (contact_id, rfid_value, first_name, preferred_name, second_line)"
+            " VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT(contact_id) DO UPDATE SET"
+            " rfid_value = excluded.rfid_value,"
+            " first_name = excluded.first_name,"
+            " preferred_name = excluded.preferred_name,"
+            " second_line = excluded.second_line",
+            record,
+        )
+        self._conn.execute("DELETE FROM tags WHERE contact_id = ?", (record.contact_id,))
+        tags = set(TAG_PATTERN.findall(record.rfid_value or ""))
+        self._conn.executemany(
+            "INSERT INTO tags (tag, contact_id) VALUES (?, ?)",
+            [(tag, record.contact_id) for tag in tags],
+        )
+
+    def remember_answer(self, rfid_tag: str, first_line: str, second_line: str | None):
+        """Keep the lines last printed for a tag, to fall back on when the API is down.
+
+        Unlike members, answers survive replace_all(). Most scans repeat the
+        last answer, so it is only written when it changes.
+        """
+        with self._lock:
+            if self._stored_answers.get(rfid_tag) == (first_line, second_line):
+                return
+            self._conn.execute(
+                "INSERT INTO answers (tag, first_line, second_line, answered_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(tag) DO UPDATE SET"
+                " first_line = excluded.first_line,"
+                " second_line = excluded.second_line,"
+                " answered_at = excluded.answered_at",
+                (rfid_tag, first_line, second_line, datetime.now(timezone.utc).isoformat()),
+            )
+            self._stored_answers[rfid_tag] = (first_line, second_line)
+
+    def last_answer(self, rfid_tag: str) -> tuple[str, str | None] | None:
+        """Return the lines last printed for a tag, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT first_line, second_line FROM answers WHERE tag = ?", (rfid_tag,)
+            ).fetchone()
+        return tuple(row) if row is not None else None
+
+    def forget_answer(self, rfid_tag: str):
+        """Forget the lines for a tag, e.g. once it no longer matches a member."""
+        with self._lock:
+            self._conn.execute("DELETE FROM answers WHERE tag = ?", (rfid_tag,))
+            self._stored_answers.pop(rfid_tag, None)
+
+    def get_sync_time(self, key: str) -> datetime | None:
+        """Return when the given kind of sync last started, if ever."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return datetime.fromisoformat(row[0])
+
+    def set_sync_time(self, key: str, when: datetime):
+        """Record when the given kind of sync started."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sync_state (key, value) VALUES (?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, when.astimezone(timezone.utc).isoformat()),
+            )
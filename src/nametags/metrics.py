@@ -0,0 +1,251 @@
+"""
+Latency histograms and counters for each stage of printing a nametag.
+
+Modules define their metrics at import with counter() and histogram(), and
+update them as they work. The webserver serves them at /metrics in the
+Prometheus text format, including the spooler daemon's. Processes without a
+webserver (the RFID listener, the spooler) can also write them to a scrape
+file for node_exporter's textfile collector, by setting METRICS_DIR.
+
+Example:
+    lookup_seconds = histogram("nametag_lookup_seconds", "Time to look up a tag", ["source"])
+    with lookup_seconds.labels("index").time():
+        ...
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from os import environ, path
+
+logger = logging.getLogger(__name__)
+
+# Directory to write scrape files to, if set
+METRICS_DIR = environ.get("METRICS_DIR") or None
+
+# Seconds between scrape file writes
+METRICS_WRITE_INTERVAL = 15
+
+# Covers a cache hit (well under a millisecond) up to a slow print
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry: dict[str, "_Metric"] = {}
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._series: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *labelvalues) -> "_Child":
+        """Return the series with these label values."""
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {labelvalues}")
+        return _Child(self, tuple(str(value) for value in labelvalues))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            series = [[list(key), self._copy(value)] for (key, value) in self._series.items()]
+        return {"type": self.type, "help": self.help, "labelnames": list(self.labelnames), "series": series}
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1):
+        self._inc((), amount)
+
+    def _inc(self, key, amount):
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float):
+        self._set((), value)
+
+    def clear(self):
+        """Drop every series, e.g. before setting the current set of labels."""
+        with self._lock:
+            self._series.clear()
+
+    def _set(self, key, value):
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float):
+        self._observe((), value)
+
+    def time(self):
+        """Time a block of code, in seconds."""
+        return _Child(self, ()).time()
+
+    def _observe(self, key, value):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts, sum, count
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for (i, bound) in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+    def _copy(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+
+class _Child:
+    """One labelled series of a metric."""
+
+    def __init__(self, metric: _Metric, key: tuple[str, ...]):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1):
+        self._metric._inc(self._key, amount)  # type: ignore[attr-defined]
+
+    def set(self, value: float):
+        self._metric._set(self._key, value)  # type: ignore[attr-defined]
+
+    def observe(self, value: float):
+        self._metric._observe(self._key, value)  # type: ignore[attr-defined]
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+def _register(cls, name, help, labelnames, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help, tuple(labelnames), **kwargs)
+        return metric
+
+
+def counter(name: str, help: str, labelnames=()) -> Counter:
+    """Get or create a counter."""
+    return _register(Counter, name, help, labelnames)
+
+
+def gauge(name: str, help: str, labelnames=()) -> Gauge:
+    """Get or create a gauge."""
+    return _register(Gauge, name, help, labelnames)
+
+
+def histogram(name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    """Get or create a histogram."""
+    return _register(Histogram, name, help, labelnames, buckets=buckets)
+
+
+def snapshot() -> dict:
+    """Return the current value of every metric, as plain data that can be sent as JSON."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {metric.name: metric.snapshot() for metric in metrics}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for (name, value) in zip(names, values)) + "}"
+
+
+def render(snapshots: dict[str, dict]) -> str:
+    """Render snapshots from one or more processes in the Prometheus text format.
+
+    Snapshots are keyed by process name, which becomes a "process" label.
+    """
+    families: dict[str, dict] = {}
+    for (process, process_snapshot) in snapshots.items():
+        for (name, family) in process_snapshot.items():
+            merged = families.setdefault(name, {**family, "series": []})
+            merged["series"].extend(
+                (["process"] + family["labelnames"], [process] + values, value)
+                for (values, value) in family["series"]
+            )
+
+    lines = []
+    for (name, family) in sorted(families.items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for (labelnames, labelvalues, value) in family["series"]:
+            if family["type"] in ("counter", "gauge"):
+                lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {value}")
+                continue
+            (bucket_counts, total, count) = value
+            cumulative = 0
+            for (bound, bucket_count) in zip(family["buckets"], bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(labelnames + ["le"], labelvalues + [repr(float(bound))])
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            labels = _format_labels(labelnames + ["le"], labelvalues + ["+Inf"])
+            lines.append(f"{name}_bucket{labels} {count}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, labelvalues)} {total}")
+            lines.append(f"{name}_count{_format_labels(labelnames, labelvalues)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def write_scrape_file(file_path: str, process: str):
+    """Write this process's metrics to a file, atomically."""
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(render({process: snapshot()}))
+    os.replace(temp_path, file_path)
+
+
+def start_scrape_file_writer(process: str, metrics_dir: str | None = METRICS_DIR):
+    """Keep a scrape file for this process up to date in METRICS_DIR, if it's set."""
+    if metrics_dir is None:
+        return None
+    os.makedirs(metrics_dir, exist_ok=True)
+    file_path = path.join(metrics_dir, f"nametags-{process}.prom")
+
+    def write_forever():
+        while True:
+            try:
+                write_scrape_file(file_path, process)
+            except OSError:
+                logger.exception(f"Failed to write metrics to {file_path}")
+            time.sleep(METRICS_WRITE_INTERVAL)
+
+    thread = threading.Thread(target=write_forever, name="metrics-writer", daemon=True)
+    thread.start()
+    logger.info(f"Writing metrics to {file_path}")
+    return thread
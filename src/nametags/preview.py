@@ -0,0 +1,88 @@
+"""
+Rendered nametag previews for the web form.
+
+The form shows the tag while someone types, which would mean a render per
+keystroke. Previews are cached by what's on the tag, and concurrent requests
+for the same tag share a single render.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from io import BytesIO
+
+from . import metrics
+from .template import TEMPLATE_VERSION
+
+preview_requests = metrics.counter(
+    "nametag_preview_requests_total", "Preview requests, by how they were answered", ["result"]
+)
+
+
+def render_preview(name: str, second_line: str | None) -> bytes:
+    """Render a nametag to PNG bytes."""
+    from .printer import make_image
+
+    image = make_image(name, second_line)
+    buffer = BytesIO()
+    image.save(buffer, "png", optimize=False)
+    return buffer.getvalue()
+
+
+class PreviewCache:
+    """LRU cache of rendered previews that coalesces identical renders."""
+
+    def __init__(self, render=render_preview, max_entries: int = 128):
+        self._render = render
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._inflight: dict[str, Future[bytes]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag(name: str, second_line: str | None, label_size: str) -> str:
+        """Return the ETag of a preview, without rendering it."""
+        # Same normalization as make_image, so "" and None share an entry
+        if second_line is not None:
+            second_line = second_line.strip() or None
+        key_data = json.dumps([name, second_line, label_size, TEMPLATE_VERSION])
+        return hashlib.sha256(key_data.encode()).hexdigest()[:32]
+
+    def get(self, name: str, second_line: str | None, label_size: str) -> tuple[bytes, str]:
+        """Return the PNG bytes and ETag of a preview, rendering it if needed."""
+        key = self.etag(name, second_line, label_size)
+
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                preview_requests.labels("hit").inc()
+                return (png, key)
+
+            rendering = self._inflight.get(key)
+            if rendering is None:
+                future: Future[bytes] = Future()
+                self._inflight[key] = future
+
+        if rendering is not None:
+            # Someone else is rendering this exact preview
+            preview_requests.labels("coalesced").inc()
+            return (rendering.result(), key)
+
+        preview_requests.labels("miss").inc()
+        try:
+            png = self._render(name, second_line)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[key]
+            self._entries[key] = png
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(png)
+        return (png, key)
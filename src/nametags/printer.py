@@ -1,63 +1,118 @@
-from io import BytesIO
-from os import environ, path
+from os import environ
 
-from brother_ql.backends.helpers import discover, send
-from brother_ql.conversion import convert
-from brother_ql.labels import LabelsManager
-from brother_ql.raster import BrotherQLRaster
-from PIL import Image, ImageDraw, ImageFont
-from wand.color import Color
-from wand.image import Image as WandImage
+from PIL import Image, ImageDraw
 
-from .logconf import setup_logging
-
-setup_logging()
-
-# Get the directory of the current script
-script_dir = path.dirname(path.abspath(__file__))
-asset_dir = path.join(script_dir, "assets")
-
-# Path to the font file
-font_path = path.join(asset_dir, "OpenSans-Regular.ttf")
-bold_font_path = path.join(asset_dir, "OpenSans-SemiBold.ttf")
-
-# Path to the logo file
-logo_path = path.join(asset_dir, "ps1-logo-clean-white.svg")
-
-# Make sure the asset files exist
-for asset_path in (logo_path, font_path, bold_font_path):
-    if not path.isfile(asset_path):
-        raise FileNotFoundError(f"Font file not found: {asset_path}")
+from . import metrics
+from .assetcache import font_path, load_font
+from .fitting import fit_font_size
+from .jobcache import RasterJobCache, raster_job_key
+from .template import get_label_template
 
 
 LABEL_SIZE = environ.get("LABEL_SIZE", "62x100")
+PRINTER_MODEL = "QL-800"
+
+# brother_ql backend to find the printer with, or "null" or "file:<path>"
+# to run without one
+PRINTER_BACKEND = environ.get("PRINTER_BACKEND", "pyusb")
+
+# Converted raster jobs, so repeat prints skip rendering entirely.
+# Set RASTER_CACHE_DIR to keep them across restarts.
+raster_job_cache = RasterJobCache(
+    max_bytes=int(environ.get("RASTER_CACHE_BYTES", 16 * 1024 * 1024)),
+    cache_dir=environ.get("RASTER_CACHE_DIR") or None,
+)
+
+# Discovered once and kept open across jobs
+_printer_handle = None
+
+stage_seconds = metrics.histogram(
+    "nametag_print_stage_seconds", "Time spent in each stage of printing a nametag", ["stage"]
+)
+raster_cache_requests = metrics.counter(
+    "nametag_raster_cache_requests_total", "Raster job cache lookups", ["result"]
+)
+prints = metrics.counter(
+    "nametag_prints_total", "Labels sent to the printer, by outcome", ["outcome"]
+)
+
+
+def get_printer_handle():
+    """Get the connection to the printer, which is opened on first use."""
+    global _printer_handle
+    if _printer_handle is None:
+        # Imported here, as brother_ql is slow to import and only needed to print
+        from .printerhandle import PrinterHandle
+        _printer_handle = PrinterHandle(PRINTER_BACKEND, PRINTER_MODEL)
+    return _printer_handle
 
 
 def get_printer_id():
     """Auto-discover the printer and return its identifier."""
-    # Auto-discover the printer using the pyusb backend
-    printer_id = discover('pyusb')[0]['identifier']
-
-    # Discard broken serial from identifier
-    # https://github.com/pklaus/brother_ql_web/issues/10#issuecomment-994990935
-    printer_id = printer_id.split("_")[0]
-
-    return printer_id
+    return get_printer_handle().identifier
 
 
 def print_name(name: str, second_line: str | None):
     """Print a nametag with the given name."""
-    image = make_image(name, second_line)
-    image.rotate(90, expand=True)
-    print_image(image)
+    send_raster(render_name(name, second_line))
+
+
+def render_name(name: str, second_line: str | None) -> bytes:
+    """Get the printer raster instructions for a nametag with the given name."""
+    key = raster_job_key(name, second_line, LABEL_SIZE, PRINTER_MODEL)
+    qr_data = raster_job_cache.get(key)
+    if qr_data is None:
+        raster_cache_requests.labels("miss").inc()
+        with stage_seconds.labels("make_image").time():
+            image = make_image(name, second_line)
+        image.rotate(90, expand=True)
+        with stage_seconds.labels("convert").time():
+            qr_data = convert_image(image)
+        raster_job_cache.put(key, qr_data)
+    else:
+        raster_cache_requests.labels("hit").inc()
+    return qr_data
 
 
 def print_image(image: Image.Image):
     """Print the given PIL image."""
-    qlr = BrotherQLRaster("QL-800")
-    qr_data = convert(qlr, [image], LABEL_SIZE)
-    printer_id = get_printer_id()
-    send(qr_data, printer_id)
+    send_raster(convert_image(image))
+
+
+def convert_image(image: Image.Image) -> bytes:
+    """Convert the given PIL image to printer raster instructions."""
+    # Imported here, as brother_ql is slow to import and only needed to print
+    from .rasterencoder import encode_raster
+
+    return encode_raster(image, LABEL_SIZE, PRINTER_MODEL)
+
+
+def send_raster(qr_data: bytes, handle=None) -> dict:
+    """Send raster instructions to the printer, or to the given handle.
+
+    Raises PrinterStatusError if the printer reports a problem, like running
+    out of labels, before or while printing, and TimeoutError if it doesn't
+    confirm the label printed.
+    """
+    from .printerhandle import PrinterStatusError
+
+    if handle is None:
+        handle = get_printer_handle()
+    try:
+        with stage_seconds.labels("check").time():
+            handle.check_ready()
+        with stage_seconds.labels("send").time():
+            status = handle.send(qr_data)
+    except Exception:
+        prints.labels("exception").inc()
+        raise
+    prints.labels(status["outcome"]).inc()
+    printer_state = status["printer_state"]
+    if printer_state is not None and printer_state["errors"]:
+        raise PrinterStatusError(f"Printer reports: {', '.join(printer_state['errors'])}")
+    if not status["did_print"]:
+        raise TimeoutError("The printer didn't confirm the label printed")
+    return status
 
 
 def make_image(name: str, second_line: str | None) -> Image.Image:
@@ -68,117 +123,38 @@ def make_image(name: str, second_line: str | None) -> Image.Image:
         second_line: Optional second line of text
     """
 
-    # Define image dimensions
-    label = next(
-        (
-            candidate
-            for candidate in LabelsManager().iter_elements()
-            if candidate.identifier == LABEL_SIZE
-        ),
-        None,
-    )
-    if label is None:
-        raise ValueError(
-            f"Invalid LABEL_SIZE '{LABEL_SIZE}'. Expected a known Brother QL label identifier."
-        )
-    image_height, image_width = label.dots_printable
-
-    center_x = image_width // 2
+    # Static background and geometry, built once per label size
+    template = get_label_template(LABEL_SIZE)
+    center_x = template.center_x
 
-    # Define black bar heights
-    top_bar_height = 200
-    bottom_bar_height = 100
-
-    # Define text positions
-    hello_text_y = 0
-    my_name_is_text_y = 115
-
-    # Desired size of the logo (width, height)
-    logo_size = (100, 100)
-    logo_inset = 50  # Inset from the edges
-
-    # Create a blank white image
-    image = Image.new("RGB", (image_width, image_height), "white")
+    # Start from a copy of the prerendered background
+    image = template.new_image()
     draw = ImageDraw.Draw(image)
 
-    # Load fonts
-    font_name_size = 170
-    font_second_line_size = 120
-    font_hello_size = 100
-    font_my_name_is_size = 50
-
-    # Raises IOError if the font file is not found
-    font_hello = ImageFont.truetype(font_path, font_hello_size)
-    font_my_name_is = ImageFont.truetype(bold_font_path, font_my_name_is_size)
-
     # Trim second line, turn empty to None
     if second_line is not None:
         second_line = second_line.strip()
         if len(second_line) == 0:
             second_line = None
 
-    # Dynamically adjust font size for the name
-    while True:
-        font_name = ImageFont.truetype(font_path, font_name_size)
-
-        (left, top, right, bottom) = font_name.getbbox(name)
-        text_width = right - left
-        text_height = bottom - top
+    # Find the largest font size that fits the name
+    font_name_size = fit_font_size(name, font_path, template.text_max_width, 170)
+    font_name = load_font(font_path, font_name_size)
 
-        # Leave a margin on both sides
-        if text_width <= image_width - 100:
-            break
+    (left, top, right, bottom) = font_name.getbbox(name)
+    text_height = bottom - top
 
-        # Decrease font size if text is too wide
-        font_name_size -= 5
-
-    # Dynamically adjust font size for the second line
-    while second_line:
-        font_second_line = ImageFont.truetype(font_path, font_second_line_size)
+    # Find the largest font size that fits the second line
+    if second_line is not None:
+        font_second_line_size = fit_font_size(second_line, font_path, template.text_max_width, 120)
+        font_second_line = load_font(font_path, font_second_line_size)
 
         (left, top, right, bottom) = font_second_line.getbbox(second_line)
-        second_line_width = right - left
         second_line_height = bottom - top
 
-        # Leave a margin on both sides
-        if second_line_width <= image_width - 100:
-            break
-
-        # Decrease font size if text is too wide
-        font_second_line_size -= 5
-
-    # Add black bars at the top and bottom
-    draw.rectangle([(0, 0), (image_width, top_bar_height)], fill="black")
-    draw.rectangle([(0, image_height - bottom_bar_height), (image_width, image_height)], fill="black")
-
-    # Render the SVG logo into a rasterized image using Wand
-    with WandImage(filename=logo_path, background=Color('transparent'), resolution=300) as wand_image:
-        wand_image.format = 'png'  # Convert the SVG to PNG format
-        wand_image.resize(logo_size[0], logo_size[1])  # Resize the image to the desired size
-        logo_png_data = wand_image.make_blob('png')  # Get the PNG data as a binary blob
-        logo_image = Image.open(BytesIO(logo_png_data)).convert("RGBA")  # Convert to a Pillow image
-
-    # Add the logo to the top-left corner of the black bar
-    top_left_logo_x = logo_inset
-    top_left_logo_y = (top_bar_height - logo_size[1]) // 2  # Center vertically in the black bar
-    image.paste(logo_image, (top_left_logo_x, top_left_logo_y), logo_image)
-
-    # Add the logo to the top-right corner of the black bar
-    top_right_logo_x = image_width - logo_size[0] - logo_inset
-    top_right_logo_y = (top_bar_height - logo_size[1]) // 2  # Center vertically in the black bar
-    image.paste(logo_image, (top_right_logo_x, top_right_logo_y), logo_image)
-
-    # Add "Hello" text
-    hello_text = "Hello"
-    draw.text((center_x, hello_text_y), hello_text, anchor="ma", fill="white", font=font_hello)
-
-    # Add "my name is" text
-    my_name_is_text = "my name is"
-    draw.text((center_x, my_name_is_text_y), my_name_is_text, anchor="ma", fill="white", font=font_my_name_is)
-
     # Calculate text position to center the name within the white space
-    white_space_top = top_bar_height
-    white_space_bottom = image_height - bottom_bar_height
+    white_space_top = template.white_space_top
+    white_space_bottom = template.white_space_bottom
     white_space_height = white_space_bottom - white_space_top
 
     text_y = white_space_top + (white_space_height - text_height) // 2 + text_height
@@ -0,0 +1,319 @@
+"""
+Long-lived connection to the label printer.
+
+brother_ql's send() and status() helpers enumerate the USB bus and open the
+device on every call, which adds noticeable latency to each label on the Pi.
+PrinterHandle discovers the printer once and keeps its backend open across
+jobs. It only rediscovers the printer after a failure, e.g. when it has been
+unplugged or power cycled.
+
+The handle also remembers the last status the printer reported, from a print
+or a status request, and publishes it as metrics. Before a print,
+check_ready() looks at that status, and only asks the printer again if it's
+stale or reported a problem, so an empty printer fails the job right away.
+
+LabelSink stands in for a printer, to run without hardware: the "null"
+backend drops labels and the "file:<path>" backend appends them to a file.
+"""
+import logging
+import threading
+import time
+from typing import Any
+
+from brother_ql.backends import backend_factory
+from brother_ql.raster import BrotherQLRaster
+from brother_ql.reader import interpret_response
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# How long to wait for the printer to report back, in seconds
+RESPONSE_TIMEOUT = 10
+
+# A status older than this is requested again before printing, in seconds
+STATUS_MAX_AGE = 300
+
+# Errors meaning the roll ran out. The QL-800 doesn't report how much is left.
+MEDIA_END_ERRORS = (
+    "No media when printing",
+    "End of media (die-cut size only)",
+    "Media cannot be fed (also when the media end is detected)",
+)
+
+
+stage_seconds = metrics.histogram(
+    "nametag_print_stage_seconds", "Time spent in each stage of printing a nametag", ["stage"]
+)
+rediscoveries = metrics.counter(
+    "nametag_printer_rediscoveries_total", "Times the printer was rediscovered after a failure"
+)
+printer_up = metrics.gauge("nametag_printer_up", "Whether the printer answered its last request")
+printer_media = metrics.gauge(
+    "nametag_printer_media_info", "Media loaded in the printer", ["media_type", "width", "length"]
+)
+printer_errors = metrics.gauge("nametag_printer_errors", "Errors the printer last reported", ["error"])
+printer_media_end = metrics.gauge("nametag_printer_media_end", "Whether the printer reported running out of media")
+
+
+class PrinterNotFoundError(Exception):
+    """No printer was found by discovery."""
+
+
+class PrinterStatusError(Exception):
+    """The printer reported a problem, e.g. it's out of labels."""
+
+
+def status_problems(status: dict) -> list[str]:
+    """List what would stop the printer from printing, from a parsed status."""
+    problems = list(status["errors"])
+    if status["media_type"] == "No media" and "No media when printing" not in problems:
+        problems.append("No media")
+    return problems
+
+
+def status_response(status_type: int, phase_type: int = 0, error_info: int = 0) -> bytes:
+    """Build a QL-800 status response for 62x100 labels, see brother_ql.reader"""
+    data = bytearray(32)
+    data[0:8] = b"\x80\x20\x42\x34\x38\x30\x30\x00"
+    data[8] = error_info
+    data[10] = 62  # Media width
+    data[11] = 0x0B  # Die-cut labels
+    data[17] = 100  # Media length
+    data[18] = status_type
+    data[19] = phase_type
+    return bytes(data)
+
+
+class LabelSink:
+    """A printer backend that takes labels without printing them.
+
+    Answers like a QL-800 loaded with 62x100 labels, after `print_seconds`
+    for each label. With a path, everything sent is appended to that file.
+    """
+
+    def __init__(self, device: tuple[str | None, float]):
+        (self.path, self.print_seconds) = device
+        self.labels = 0
+        self._responses: list[bytes] = []
+        self._ready_at = 0.0
+
+    def write(self, data: bytes):
+        if self.path is not None:
+            with open(self.path, "ab") as f:
+                f.write(data)
+        if data.endswith(b"\x1a"):  # Print command, ends a label
+            self.labels += 1
+            self._ready_at = time.monotonic() + self.print_seconds
+            self._responses = [status_response(0x01), status_response(0x06, 0x00)]
+        else:
+            self._responses = [status_response(0x00)]
+
+    def read(self) -> bytes:
+        if not self._responses or time.monotonic() < self._ready_at:
+            return b""
+        return self._responses.pop(0)
+
+    def dispose(self):
+        pass
+
+
+def sink_backend(path: str | None = None, print_seconds: float = 0.0) -> dict:
+    """A backend like brother_ql's backend_factory() returns, for a LabelSink."""
+    identifier = f"file://{path}" if path is not None else "null"
+    return {
+        "list_available_devices": lambda: [{"identifier": identifier, "instance": (path, print_seconds)}],
+        "backend_class": LabelSink,
+    }
+
+
+def get_backend(backend_identifier: str) -> dict:
+    """Look up a brother_ql backend, or a sink for "null" or "file:<path>"."""
+    if backend_identifier == "null":
+        return sink_backend()
+    if backend_identifier.startswith("file:"):
+        return sink_backend(backend_identifier.removeprefix("file:"))
+    return backend_factory(backend_identifier)
+
+
+class PrinterHandle:
+    """Discover a printer once and keep its backend open."""
+
+    def __init__(self, backend_identifier: str = "pyusb", model: str = "QL-800", backend: dict | None = None):
+        self.backend_identifier = backend_identifier
+        self.model = model
+        self._backend = backend if backend is not None else get_backend(backend_identifier)
+        self._identifier: str | None = None
+        self._printer = None
+        self._lock = threading.RLock()
+        self.last_status: dict | None = None
+        self._last_status_at: float | None = None
+
+    @property
+    def identifier(self) -> str:
+        """Identifier of the printer, discovering it if needed."""
+        with self._lock:
+            if self._identifier is None:
+                return self._discover()
+            return self._identifier
+
+    def _discover(self) -> str:
+        with stage_seconds.labels("discover").time():
+            return self._open_first_device()
+
+    def _open_first_device(self) -> str:
+        devices = self._backend["list_available_devices"]()
+        if not devices:
+            raise PrinterNotFoundError(f"No printer found with the {self.backend_identifier} backend")
+        device = devices[0]
+
+        # Discard broken serial from identifier
+        # https://github.com/pklaus/brother_ql_web/issues/10#issuecomment-994990935
+        identifier = device["identifier"]
+        if identifier.startswith("usb://"):
+            identifier = identifier.split("_")[0]
+
+        # Open the discovered device directly, rather than enumerating again
+        self._printer = self._backend["backend_class"](device["instance"])
+        self._identifier = identifier
+        logger.info(f"Opened printer {identifier}")
+        return identifier
+
+    def _get_printer(self):
+        if self._printer is None:
+            self._discover()
+        return self._printer
+
+    def invalidate(self):
+        """Close the printer, so the next job rediscovers it."""
+        with self._lock:
+            if self._printer is not None:
+                self._printer.dispose()
+            self._printer = None
+            self._identifier = None
+        printer_up.set(0)
+
+    def idle_seconds(self) -> float | None:
+        """Seconds since the printer last reported its status, or None if it hasn't."""
+        if self._last_status_at is None:
+            return None
+        return time.monotonic() - self._last_status_at
+
+    def _record_status(self, status: dict):
+        self.last_status = status
+        self._last_status_at = time.monotonic()
+
+        printer_up.set(1)
+        printer_media.clear()
+        printer_media.labels(status["media_type"], status["media_width"], status["media_length"]).set(1)
+        printer_errors.clear()
+        for error in status["errors"]:
+            printer_errors.labels(error).set(1)
+        printer_media_end.set(int(any(error in MEDIA_END_ERRORS for error in status["errors"])))
+
+    def check_ready(self):
+        """Raise PrinterStatusError if the printer can't print.
+
+        Uses the last status unless it's older than STATUS_MAX_AGE or reported
+        a problem, which might have been fixed since.
+        """
+        status = self.last_status
+        idle_seconds = self.idle_seconds()
+        if status is None or idle_seconds > STATUS_MAX_AGE or status_problems(status):
+            status = self.status()
+
+        problems = status_problems(status)
+        if problems:
+            raise PrinterStatusError(f"Printer reports: {', '.join(problems)}")
+
+    def send(self, instructions: bytes) -> dict:
+        """Send instructions to the printer and wait for it to finish printing.
+
+        Returns the same status dict as brother_ql's send() helper.
+        """
+        with self._lock:
+            try:
+                printer = self._get_printer()
+                printer.write(instructions)
+            except Exception as e:
+                # Nothing was printed yet, so rediscover and try once more
+                logger.warning(f"Failed to write to printer, rediscovering: {e}")
+                rediscoveries.inc()
+                self.invalidate()
+                printer = self._get_printer()
+                printer.write(instructions)
+
+            try:
+                return self._wait_for_print(printer)
+            except Exception:
+                self.invalidate()
+                raise
+
+    def status(self) -> dict:
+        """Request the printer's status and return the parsed response."""
+        raster = BrotherQLRaster(self.model)
+        raster.add_invalidate()
+        raster.add_status_information()
+
+        with self._lock:
+            try:
+                printer = self._get_printer()
+                printer.write(raster.data)
+                result = self._read_response(printer)
+            except Exception:
+                self.invalidate()
+                raise
+
+        if result is None:
+            self.invalidate()
+            raise TimeoutError("Received no status from the printer")
+        self._record_status(result)
+        return result
+
+    def _read_response(self, printer) -> dict | None:
+        start = time.time()
+        while time.time() - start < RESPONSE_TIMEOUT:
+            data = printer.read()
+            if not data:
+                time.sleep(0.005)
+                continue
+            try:
+                return interpret_response(data)
+            except (ValueError, NameError):
+                logger.error(f"Couldn't understand response: {data}")
+        return None
+
+    def _wait_for_print(self, printer) -> dict:
+        # Mirrors brother_ql.backends.helpers.send()
+        status: dict[str, Any] = {
+            "instructions_sent": True,
+            "outcome": "sent",
+            "printer_state": None,
+            "did_print": False,
+            "ready_for_next_job": False,
+        }
+
+        start = time.time()
+        while time.time() - start < RESPONSE_TIMEOUT:
+            result = self._read_response(printer)
+            if result is None:
+                break
+            status["printer_state"] = result
+            if result["errors"]:
+                logger.error(f"Errors occured: {result['errors']}")
+                status["outcome"] = "error"
+                break
+            if result["status_type"] == "Printing completed":
+                status["did_print"] = True
+                status["outcome"] = "printed"
+            if result["status_type"] == "Phase change" and result["phase_type"] == "Waiting to receive":
+                status["ready_for_next_job"] = True
+            if status["did_print"] and status["ready_for_next_job"]:
+                break
+
+        if not (status["did_print"] and status["ready_for_next_job"]):
+            logger.warning("Printing potentially not successful?")
+        if status["printer_state"] is not None:
+            self._record_status(status["printer_state"])
+
+        return status
@@ -0,0 +1,167 @@
+"""
+Fast conversion of label images to Brother QL raster instructions.
+
+brother_ql's convert() handles any image, label and color mode, one generic
+Pillow step at a time: rotate, pad to the print head, invert, threshold,
+mirror, pack, and then slice rows in a Python loop. Our labels are black and
+white and already the right size, so encode_raster() rotates and mirrors the
+8-bit image in one Pillow transpose, then thresholds, pads and packs all rows
+at once as a NumPy array. The instructions around the raster rows still come
+from brother_ql, so the output is byte for byte what convert() produces.
+
+NumPy is optional (the "numpy" extra). Without it, and for anything the fast
+path doesn't cover (red printing, dithering, labels that need resizing),
+encode_raster() calls convert().
+"""
+from PIL import Image
+
+# Same default as brother_ql's convert(), in percent
+DEFAULT_THRESHOLD = 70
+
+
+def threshold_value(threshold: int = DEFAULT_THRESHOLD) -> int:
+    """Darkness (0-255) from which a pixel prints, as convert() computes it."""
+    return min(255, max(0, int((100.0 - threshold) / 100.0 * 255)))
+
+
+def to_grayscale(image: Image.Image) -> Image.Image:
+    """Convert an image to "L", flattening transparency onto white like convert()."""
+    if image.mode.endswith("A"):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, image.split()[-1])
+        image = background
+    return image.convert("L")
+
+
+def encode_raster(
+    image: Image.Image,
+    label: str,
+    model: str,
+    cut: bool = True,
+    compress: bool = False,
+    threshold: int = DEFAULT_THRESHOLD,
+) -> bytes:
+    """Convert an image to raster instructions, like brother_ql's convert()."""
+    from brother_ql.conversion import convert
+    from brother_ql.labels import FormFactor, LabelsManager
+    from brother_ql.raster import BrotherQLRaster
+
+    def fallback():
+        return convert(BrotherQLRaster(model), [image], label, cut=cut, compress=compress, threshold=threshold)
+
+    try:
+        import numpy as np
+    except ImportError:
+        return fallback()
+
+    label_specs = LabelsManager()[label]
+    qlr = BrotherQLRaster(model)
+    (dots_wide, dots_long) = label_specs.dots_printable
+    (width, height) = image.size
+
+    rotate = False
+    if label_specs.form_factor in (FormFactor.DIE_CUT, FormFactor.ROUND_DIE_CUT):
+        # A landscape image is turned to run along the label
+        rotate = (width, height) == (dots_long, dots_wide)
+        if not rotate and (width, height) != (dots_wide, dots_long):
+            return fallback()  # Raises a ValueError for the wrong size
+        rows = dots_long
+    elif label_specs.form_factor == FormFactor.ENDLESS and width == dots_wide:
+        rows = height
+    else:
+        return fallback()  # Needs resizing
+
+    (min_rows, max_rows) = qlr.model.min_max_length_dots
+    if not min_rows <= rows <= max_rows:
+        return fallback()  # Raises a BrotherQLRasterError
+
+    # Turn the image to raster rows, mirrored as they leave the print head.
+    # A landscape image is rotated a quarter turn first, so together that's
+    # a transverse. Pillow does it on the 8-bit image, before thresholding.
+    flip = Image.Transpose.TRANSVERSE if rotate else Image.Transpose.FLIP_LEFT_RIGHT
+    dots = np.asarray(to_grayscale(image).transpose(flip)) <= 255 - threshold_value(threshold)
+
+    # The image sits against the right edge of the print head, less the
+    # margin, which is now on the left
+    head_width = qlr.get_pixel_width()
+    margin = label_specs.offset_r + qlr.model.additional_offset_r
+    padded = np.zeros((rows, head_width), dtype=bool)
+    padded[:, margin:margin + dots.shape[1]] = dots
+    row_bytes = np.packbits(padded, axis=1)
+
+    _add_header(qlr, label_specs, rows, cut, compress)
+    if compress and qlr.model.compression:
+        qlr.data += _encode_compressed_rows(row_bytes)
+    else:
+        # Each row is 0x67 0x00, the row length, then the row
+        commands = np.empty((rows, 3 + row_bytes.shape[1]), dtype=np.uint8)
+        commands[:, 0:2] = (0x67, 0x00)
+        commands[:, 2] = row_bytes.shape[1]
+        commands[:, 3:] = row_bytes
+        qlr.data += commands.tobytes()
+    qlr.add_print()
+    return qlr.data
+
+
+def _add_header(qlr, label_specs, rows: int, cut: bool, compress: bool):
+    # Mirrors brother_ql.conversion.convert() for one black and white image
+    from brother_ql import BrotherQLUnsupportedCmd
+    from brother_ql.labels import FormFactor
+
+    try:
+        qlr.add_switch_mode()
+    except BrotherQLUnsupportedCmd:
+        pass
+    qlr.add_invalidate()
+    qlr.add_initialize()
+    try:
+        qlr.add_switch_mode()
+    except BrotherQLUnsupportedCmd:
+        pass
+
+    qlr.add_status_information()
+    (tape_width, tape_length) = label_specs.tape_size
+    if label_specs.form_factor in (FormFactor.DIE_CUT, FormFactor.ROUND_DIE_CUT):
+        qlr.mtype = 0x0B
+        qlr.mwidth = tape_width
+        qlr.mlength = tape_length
+    else:
+        qlr.mtype = 0x0A
+        qlr.mwidth = tape_width
+        qlr.mlength = 0
+    qlr.pquality = 1
+    qlr.add_media_and_quality(rows)
+    try:
+        if cut:
+            qlr.add_autocut(True)
+            qlr.add_cut_every(1)
+    except BrotherQLUnsupportedCmd:
+        pass
+    try:
+        qlr.dpi_600 = False
+        qlr.cut_at_end = cut
+        qlr.two_color_printing = False
+        qlr.add_expanded_mode()
+    except BrotherQLUnsupportedCmd:
+        pass
+    qlr.add_margins(label_specs.feed_margin)
+    try:
+        if compress:
+            qlr.add_compression(True)
+    except BrotherQLUnsupportedCmd:
+        pass
+
+
+def _encode_compressed_rows(row_bytes) -> bytes:
+    import packbits
+
+    # Labels are mostly blank, so most rows repeat and are encoded once
+    encoded: dict[bytes, bytes] = {}
+    commands = bytearray()
+    for row in map(bytes, row_bytes):
+        command = encoded.get(row)
+        if command is None:
+            packed = packbits.encode(row)
+            command = encoded[row] = b"\x67\x00" + bytes([len(packed)]) + packed
+        commands += command
+    return bytes(commands)
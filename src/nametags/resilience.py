@@ -0,0 +1,168 @@
+"""
+Deadlines, retries and a circuit breaker for calls to a flaky service.
+
+An RFID scan waits on Wild Apricot, over the Pi's Wi-Fi. A Budget caps how
+long one scan may spend on it, across all attempts. call_with_retries()
+retries transient errors after a jittered backoff, as long as the budget
+allows. A CircuitBreaker that sees several failures in a row makes calls
+fail immediately for a while, rather than have every scan wait out the
+budget, then lets one call through to check if the service is back.
+
+Example:
+    breaker = CircuitBreaker("wild_apricot")
+    matches = call_with_retries(
+        lambda timeout: search(tag, timeout), Budget(5), is_transient_error, breaker
+    )
+"""
+import http.client
+import logging
+import random
+import threading
+import time
+import urllib.error
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Retry delays start around this many seconds and double, up to the cap
+BACKOFF_BASE = 0.1
+BACKOFF_CAP = 1.0
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+retries = metrics.counter("nametag_retries_total", "Calls retried after a transient error", ["service"])
+breaker_state = metrics.gauge("nametag_circuit_open", "Whether calls to a service fail fast", ["service"])
+breaker_rejections = metrics.counter(
+    "nametag_circuit_rejections_total", "Calls failed fast by an open circuit breaker", ["service"]
+)
+
+
+class BudgetExceededError(TimeoutError):
+    """The time allowed for an operation ran out."""
+
+
+class CircuitOpenError(Exception):
+    """The service failed repeatedly, so calls fail fast until it cools down."""
+
+
+class Budget:
+    """A deadline shared by all the attempts of an operation."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left, or 0 once the deadline passed."""
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def timeout(self, cap: float) -> float:
+        """Seconds the next request may wait: what's left, but no more than `cap`.
+
+        Raises BudgetExceededError once the deadline passed.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise BudgetExceededError(f"Gave up after {self.seconds:.1f} s")
+        return min(remaining, cap)
+
+
+class CircuitBreaker:
+    """Fail fast after `threshold` failures in a row, for `cooldown` seconds."""
+
+    def __init__(self, service: str, threshold: int = 5, cooldown: float = 30.0):
+        self.service = service
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        breaker_state.labels(service).set(0)
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                # Let one call through to see if the service recovered
+                self.state = HALF_OPEN
+                logger.info(f"Trying {self.service} again")
+                return
+        breaker_rejections.labels(self.service).inc()
+        raise CircuitOpenError(f"{self.service} is failing, not calling it for now")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"{self.service} recovered")
+            self.state = CLOSED
+            self._failures = 0
+        breaker_state.labels(self.service).set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.threshold:
+                if self.state != OPEN:
+                    logger.warning(f"{self.service} failed {self._failures} times, failing fast for {self.cooldown:.0f} s")
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+        if self.state == OPEN:
+            breaker_state.labels(self.service).set(1)
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Return whether a failed HTTP call is worth retrying."""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Delay before retry number `attempt` (from 0), with full jitter."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def call_with_retries(call, budget: Budget, is_retryable=is_transient_error, breaker=None, attempts: int = 3):
+    """Call `call(timeout)` until it succeeds, within the budget.
+
+    `timeout` is the time left in the budget, for the call's own timeouts.
+    Errors that aren't retryable, like a bad request, are raised right away
+    and don't count against the breaker. Raises BudgetExceededError if the
+    budget runs out before an attempt, or else the last attempt's error.
+    """
+    service = breaker.service if breaker is not None else "unknown"
+    for attempt in range(attempts):
+        remaining = budget.remaining()
+        if remaining <= 0:
+            raise BudgetExceededError(f"Gave up after {budget.seconds:.1f} s")
+        if breaker is not None:
+            breaker.before_call()
+
+        try:
+            result = call(remaining)
+        except Exception as e:
+            if not is_retryable(e):
+                # The service answered, so it's up
+                if breaker is not None:
+                    breaker.record_success()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            delay = backoff_seconds(attempt)
+            if attempt == attempts - 1 or delay >= budget.remaining():
+                raise
+            logger.warning(f"Retrying {service} in {delay:.2f} s after: {e!r}")
+            retries.labels(service).inc()
+            time.sleep(delay)
+            continue
+
+        if breaker is not None:
+            breaker.record_success()
+        return result
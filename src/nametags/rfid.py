@@ -1,15 +1,17 @@
 import logging
-from os import environ
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from os import environ, path
 from urllib.parse import urlencode
 
-import keyboard
-
+from . import metrics
 from .logconf import setup_logging
-from .printer import print_name
+from .memberindex import MemberIndex, MemberRecord
+from .resilience import Budget, CircuitBreaker, call_with_retries
+from .rfidreader import RfidReader, open_reader, scans
 from .WaApi import WaApiClient
 
-setup_logging()
-
 logger = logging.getLogger(__name__)
 
 # Raises KeyError if not set
@@ -17,91 +19,377 @@ WA_CLIENT_ID = environ["WA_CLIENT_ID"]
 WA_CLIENT_SECRET = environ["WA_CLIENT_SECRET"]
 WA_API_KEY = environ["WA_API_KEY"]
 
+# Seconds to wait when connecting to or reading from the API
+WA_API_TIMEOUT = float(environ.get("WA_API_TIMEOUT", 10))
+
+# Most seconds a scan may wait on the API, across retries, before falling
+# back to the last answer printed for the tag
+RFID_LOOKUP_BUDGET = float(environ.get("RFID_LOOKUP_BUDGET", 5))
+RFID_LOOKUP_ATTEMPTS = 3
+
+# After this many failed requests in a row, scans skip the API for a while
+WA_BREAKER_THRESHOLD = 5
+WA_BREAKER_COOLDOWN = 30  # seconds
+
 # Field names
 RFID_FIELD = "custom-9894255"
 FIRST_NAME_FIELD = "FirstName"
 PREFERRED_NAME_FIELD = "custom-17061153"
 SECOND_LINE_FIELD = "custom-17703390"
 
-# Globals to cache the API client and contacts URL
+# Local RFID index, refreshed from Wild Apricot in the background
+MEMBER_INDEX_PATH = environ.get(
+    "MEMBER_INDEX_PATH", path.expanduser("~/.cache/nametags/members.sqlite3")
+)
+MEMBER_SYNC_INTERVAL = int(environ.get("MEMBER_SYNC_INTERVAL", 300))  # seconds
+MEMBER_FULL_SYNC_INTERVAL = timedelta(hours=24)
+
+# Contacts updated this long before the last sync are fetched again, which
+# absorbs clock skew and the account's timezone in "Profile last updated"
+MEMBER_SYNC_OVERLAP = timedelta(hours=24)
+
+# Contacts per page when reading the whole contact list
+CONTACTS_PAGE_SIZE = 500
+
+# Scans of the same tag this close together print one label, e.g. when a
+# member holds their fob against the reader or taps it twice
+RFID_DEDUPE_SECONDS = float(environ.get("RFID_DEDUPE_SECONDS", 10))
+
+# Tags that weren't found, or matched several members, aren't looked up
+# online again for this long
+RFID_NEGATIVE_TTL = float(environ.get("RFID_NEGATIVE_TTL", 300))
+
+# Most tags to remember for either of the above
+RFID_MEMORY_SIZE = 1000
+
+lookup_seconds = metrics.histogram(
+    "nametag_rfid_lookup_seconds", "Time to look up an RFID tag", ["source"]
+)
+member_index_requests = metrics.counter(
+    "nametag_member_index_requests_total", "RFID lookups in the local index", ["result"]
+)
+sync_seconds = metrics.histogram(
+    "nametag_member_sync_seconds", "Time to sync the RFID index", ["kind"], buckets=(1, 5, 10, 30, 60, 120, 300)
+)
+sync_failures = metrics.counter("nametag_member_sync_failures_total", "Failed RFID index syncs")
+negative_cache_hits = metrics.counter(
+    "nametag_rfid_negative_cache_hits_total", "Lookups of tags recently not found, skipped"
+)
+degraded_lookups = metrics.counter(
+    "nametag_rfid_degraded_lookups_total", "Lookups that failed online, by fallback", ["result"]
+)
+
+wa_breaker = CircuitBreaker("wild_apricot", WA_BREAKER_THRESHOLD, WA_BREAKER_COOLDOWN)
+
+# Globals to cache the API client, contacts URL and member index
 # (API client will refresh the token as needed)
 _api_client = None
 _contacts_url = None
+_member_index = None
 
+# Monotonic times of recent scans, and until when tags are known not to match
+_last_scanned: dict[str, float] = {}
+_not_found_until: dict[str, float] = {}
+_not_found_lock = threading.Lock()
 
-def get_api_client():
+
+def get_api_client(timeout: float | None = None):
     """Get an authenticated WaApiClient instance."""
     global _api_client
     if _api_client is None:
-        _api_client = WaApiClient(WA_CLIENT_ID, WA_CLIENT_SECRET)
-        _api_client.authenticate_with_apikey(WA_API_KEY)
+        api = WaApiClient(WA_CLIENT_ID, WA_CLIENT_SECRET, timeout=WA_API_TIMEOUT)
+        # Only kept once authenticated, so a failure is retried on next use
+        api.authenticate_with_apikey(WA_API_KEY, timeout=timeout)
+        _api_client = api
     return _api_client
 
 
-def get_contacts_url(api):
+def get_contacts_url(api, timeout: float | None = None):
     """Get the contacts URL."""
     global _contacts_url
     if _contacts_url is None:
-        accounts = api.execute_request("/v2/accounts/")
+        accounts = api.execute_request("/v2/accounts/", timeout=timeout)
         account = accounts[0]
         _contacts_url = next(res for res in account.Resources if res.Name == "Contacts").Url
     return _contacts_url
 
 
-def lookup_rfid(rfid_tag: str) -> (str | None, str | None):
-    """Lookup the name corresponding to the RFID tag."""
+def get_member_index():
+    """Get the local RFID index."""
+    global _member_index
+    if _member_index is None:
+        _member_index = MemberIndex(MEMBER_INDEX_PATH)
+    return _member_index
+
+
+def contact_to_record(contact) -> MemberRecord:
+    """Pick the fields a nametag needs out of an API contact."""
+    return MemberRecord(
+        contact_id=contact.Id,
+        rfid_value=contact.get_field_value(RFID_FIELD),
+        first_name=contact.get_field_value(FIRST_NAME_FIELD),
+        preferred_name=contact.get_field_value(PREFERRED_NAME_FIELD),
+        second_line=contact.get_field_value(SECOND_LINE_FIELD),
+    )
+
+
+def record_to_lines(record: MemberRecord) -> tuple[str | None, str | None]:
+    """Get the lines to print on a member's nametag."""
+    first_line = None
+    if record.first_name:
+        first_line = record.first_name
+    if record.preferred_name:
+        first_line = record.preferred_name
+
+    return (first_line, record.second_line)
+
+
+def fetch_contacts(filter: str | None = None):
+    """Yield every contact matching the filter, page by page."""
     api = get_api_client()
     contacts_url = get_contacts_url(api)
 
+    skip = 0
+    while True:
+        params = {"$async": "false", "$top": CONTACTS_PAGE_SIZE, "$skip": skip}
+        if filter is not None:
+            params["$filter"] = filter
+        response = api.execute_request(contacts_url[:-1] + "?" + urlencode(params))
+
+        contacts = getattr(response, "Contacts", [])
+        yield from contacts
+
+        if len(contacts) < CONTACTS_PAGE_SIZE:
+            break
+        skip += CONTACTS_PAGE_SIZE
+
+
+def sync_member_index(full: bool = False):
+    """Refresh the local RFID index from Wild Apricot.
+
+    A full sync replaces the index with every contact. Otherwise only contacts
+    updated since the last sync are fetched.
+    """
+    index = get_member_index()
+    started_at = datetime.now(timezone.utc)
+
+    last_full = index.get_sync_time("full")
+    last_sync = index.get_sync_time("incremental") or last_full
+    if last_full is None or started_at - last_full > MEMBER_FULL_SYNC_INTERVAL:
+        full = True
+
+    with sync_seconds.labels("full" if full else "incremental").time():
+        if full:
+            records = [contact_to_record(contact) for contact in fetch_contacts()]
+            index.replace_all(records)
+            index.set_sync_time("full", started_at)
+            index.set_sync_time("incremental", started_at)
+            logger.info(f"Loaded {len(records)} members into the RFID index.")
+            return
+
+        # https://gethelp.wildapricot.com/en/articles/502#filtering
+        since = (last_sync - MEMBER_SYNC_OVERLAP).strftime("%Y-%m-%dT%H:%M:%S")
+        records = [
+            contact_to_record(contact)
+            for contact in fetch_contacts(f"'Profile last updated' ge {since}")
+        ]
+        index.upsert(records)
+        index.set_sync_time("incremental", started_at)
+        logger.info(f"Updated {len(records)} members in the RFID index.")
+
+
+def start_member_index_sync():
+    """Keep the local RFID index up to date in a background thread."""
+    def sync_forever():
+        while True:
+            try:
+                sync_member_index()
+            except Exception:
+                sync_failures.inc()
+                logger.exception("Failed to sync the RFID index.")
+            time.sleep(MEMBER_SYNC_INTERVAL)
+
+    thread = threading.Thread(target=sync_forever, name="member-index-sync", daemon=True)
+    thread.start()
+    return thread
+
+
+def lookup_rfid(rfid_tag: str) -> tuple[str | None, str | None]:
+    """Lookup the name corresponding to the RFID tag.
+
+    If the API can't be reached, returns the lines last printed for the tag,
+    if any.
+    """
+    # Answer from the local index when it has exactly one match
+    index = get_member_index()
+    with lookup_seconds.labels("index").time():
+        matches = index.lookup(rfid_tag)
+    if len(matches) == 1:
+        (first_line, second_line) = record_to_lines(matches[0])
+        if first_line:
+            member_index_requests.labels("hit").inc()
+            index.remember_answer(rfid_tag, first_line, second_line)
+            return (first_line, second_line)
+
+    member_index_requests.labels("miss").inc()
+
+    with _not_found_lock:
+        not_found_until = _not_found_until.get(rfid_tag)
+    if not_found_until is not None and time.monotonic() < not_found_until:
+        negative_cache_hits.inc()
+        logger.info(f"RFID tag {rfid_tag} was recently not found, skipping lookup.")
+        return (None, None)
+
+    try:
+        with lookup_seconds.labels("online").time():
+            return lookup_rfid_online(rfid_tag)
+    except Exception as e:
+        logger.error(f"Failed to look up RFID tag {rfid_tag} online: {e!r}")
+
+    last_answer = index.last_answer(rfid_tag)
+    if last_answer is None:
+        degraded_lookups.labels("none").inc()
+        return (None, None)
+    degraded_lookups.labels("last_known_good").inc()
+    logger.warning(f"Using the last known name for RFID tag {rfid_tag}.")
+    return last_answer
+
+
+def find_members_online(rfid_tag: str, budget: Budget | None = None) -> list[MemberRecord]:
+    """Find every member whose RFID field contains the tag, via the API.
+
+    With a budget, authenticating and refreshing the token, finding the
+    contacts URL and the search itself all have to finish within it.
+    """
+    def timeout():
+        return WA_API_TIMEOUT if budget is None else budget.timeout(WA_API_TIMEOUT)
+
+    api = get_api_client(timeout())
+    contacts_url = get_contacts_url(api, timeout())
+
     # https://gethelp.wildapricot.com/en/articles/502#filtering
     params = {"$filter": f"substringof('{RFID_FIELD}', '{rfid_tag}')", "$async": "false"}
     request = contacts_url[:-1] + "?" + urlencode(params)
 
-    response = api.execute_request(request)
+    response = api.execute_request(request, timeout=timeout())
+
+    return [contact_to_record(contact) for contact in getattr(response, "Contacts", [])]
+
 
-    if not hasattr(response, "Contacts") or len(response.Contacts) != 1:
+def lookup_rfid_online(rfid_tag: str) -> tuple[str | None, str | None]:
+    """Lookup the name corresponding to the RFID tag via the API.
+
+    Transient errors are retried within RFID_LOOKUP_BUDGET seconds. Raises
+    if the API still can't be reached, or its circuit breaker is open.
+    """
+    budget = Budget(RFID_LOOKUP_BUDGET)
+    matches = call_with_retries(
+        lambda timeout: find_members_online(rfid_tag, Budget(timeout)),
+        budget,
+        breaker=wa_breaker,
+        attempts=RFID_LOOKUP_ATTEMPTS,
+    )
+    index = get_member_index()
+
+    if len(matches) != 1:
         logger.warning(f"RFID tag {rfid_tag} not found or multiple matches.")
+        with _not_found_lock:
+            remember_tag(_not_found_until, rfid_tag, time.monotonic() + RFID_NEGATIVE_TTL)
+        index.forget_answer(rfid_tag)
         return (None, None)
 
-    contact = response.Contacts[0]
+    record = matches[0]
 
-    preferred_name = next(i for i in contact.FieldValues if i.SystemCode == PREFERRED_NAME_FIELD).Value
-    first_name = next(i for i in contact.FieldValues if i.SystemCode == FIRST_NAME_FIELD).Value
-    second_line = next(i for i in contact.FieldValues if i.SystemCode == SECOND_LINE_FIELD).Value
+    # Remember the member, so the next scan is answered locally
+    index.upsert([record])
 
-    first_line = None
-    if first_name:
-        first_line = first_name
-    if preferred_name:
-        first_line = preferred_name
+    (first_line, second_line) = record_to_lines(record)
 
     if not first_line:
         logger.warning(f"No name on record for member with RFID tag {rfid_tag}.")
+    else:
+        index.remember_answer(rfid_tag, first_line, second_line)
 
     return (first_line, second_line)
 
 
-def listen_for_rfid():
-    """Listen for RFID inputs via the keyboard."""
+def remember_tag(memory: dict[str, float], rfid_tag: str, when: float):
+    """Remember a time for a tag, forgetting the oldest tags past RFID_MEMORY_SIZE."""
+    memory.pop(rfid_tag, None)
+    memory[rfid_tag] = when
+    while len(memory) > RFID_MEMORY_SIZE:
+        del memory[next(iter(memory))]
+
+
+def is_duplicate_scan(rfid_tag: str) -> bool:
+    """Return whether the tag was already scanned within RFID_DEDUPE_SECONDS.
+
+    The window restarts with every scan, so a fob held against the reader
+    prints once.
+    """
+    now = time.monotonic()
+    last_scanned = _last_scanned.get(rfid_tag)
+    remember_tag(_last_scanned, rfid_tag, now)
+    return last_scanned is not None and now - last_scanned < RFID_DEDUPE_SECONDS
+
+
+def listen_for_rfid(
+    reader: RfidReader | None = None, submit=None, sync: bool = True, scrape_metrics: bool = True
+):
+    """Listen for RFID scans and print a nametag for each member.
+
+    Reads the configured RFID reader, unless given one that was started.
+    Labels are queued with submit_print(), unless given a `submit(name,
+    second_line)` that prints them elsewhere. `sync` keeps the member index
+    up to date in the background, and `scrape_metrics` writes the listener's
+    metrics for node_exporter. Returns once the reader stops.
+    """
+    from .spooler import prints_in_process, submit_print
+    from .warmup import warm_up
+
+    # Without the spooler daemon, labels are rendered and printed here
+    printing_here = submit is None and prints_in_process()
+    warm_up(api=True, rendering=printing_here, printer=printing_here)
+    if submit is None:
+        submit = submit_print
+
+    if sync:
+        start_member_index_sync()
+
+    if scrape_metrics:
+        metrics.start_scrape_file_writer("rfid")
+
+    # Scans queue up in the reader while a lookup or print is slow
+    if reader is None:
+        reader = open_reader()
+
     logger.info("Listening for RFID scans...")
-    buffer = ""
     while True:
-        event = keyboard.read_event()
-        if event.event_type == "down":  # Only process key press events
-            char = event.name
-            if char == "enter":  # Linebreak indicates end of RFID input
-                if len(buffer) == 10 and buffer.isdigit():
-                    logger.info(f"RFID Tag Detected: {buffer}")
-                    (first_line, second_line) = lookup_rfid(buffer)
-                    if first_line:
-                        logger.info(f"Matched Name: {first_line}")
-                        print_name(first_line, second_line)
-                buffer = ""  # Clear the buffer after processing
-            elif char.isdigit():  # Append digits to the buffer
-                buffer += char
-                buffer = buffer[-10:]
-                logger.debug(f"Buffer: {buffer}")
+        tag = reader.tags.get()
+        if tag is None:
+            logger.error("The RFID reader stopped.")
+            return
+
+        logger.info(f"RFID Tag Detected: {tag}")
+        if is_duplicate_scan(tag):
+            scans.labels("duplicate").inc()
+            logger.info(f"Ignoring repeat scan of {tag}")
+            continue
+
+        (first_line, second_line) = lookup_rfid(tag)
+        if first_line:
+            scans.labels("found").inc()
+            logger.info(f"Matched Name: {first_line}")
+            try:
+                submit(first_line, second_line)
+            except Exception:
+                # Keep listening, the next scan may well print
+                scans.labels("print_failed").inc()
+                logger.exception(f"Failed to queue a nametag for {tag}")
+        else:
+            scans.labels("not_found").inc()
 
 
 if __name__ == "__main__":
+    setup_logging()
     listen_for_rfid()
@@ -0,0 +1,221 @@
+"""
+Read RFID tags from the USB reader, which types them like a keyboard.
+
+A reader runs in its own thread and puts each complete 10-digit tag on a
+queue, so scans keep being read while a lookup or a print is slow. There are
+two backends:
+
+- evdev grabs the reader's input device exclusively, so its keystrokes don't
+  end up in other programs, and only reads that one device. It needs the
+  evdev package (the "evdev" extra) and RFID_DEVICE or RFID_DEVICE_NAME.
+- keyboard uses the keyboard library's global hook, which sees every
+  keyboard on the system. It's the fallback when evdev isn't configured.
+
+FakeInputDevice stands in for an evdev device in tests.
+"""
+import logging
+import queue
+import threading
+import time
+from os import environ
+from typing import NamedTuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Which backend to use: "evdev", "keyboard", or "auto" for evdev if it's configured
+RFID_READER = environ.get("RFID_READER", "auto")
+
+# The reader's input device, by path (e.g. /dev/input/by-id/...-event-kbd)
+# or by part of its name
+RFID_DEVICE = environ.get("RFID_DEVICE") or None
+RFID_DEVICE_NAME = environ.get("RFID_DEVICE_NAME") or None
+
+TAG_LENGTH = 10
+
+# Linux input event codes, see linux/input-event-codes.h
+EV_KEY = 0x01
+KEY_DOWN = 1
+KEY_CHARS = {
+    2: "1", 3: "2", 4: "3", 5: "4", 6: "5", 7: "6", 8: "7", 9: "8", 10: "9", 11: "0",
+    79: "1", 80: "2", 81: "3", 75: "4", 76: "5", 77: "6", 71: "7", 72: "8", 73: "9", 82: "0",
+    28: "enter", 96: "enter",
+}
+
+read_seconds = metrics.histogram(
+    "nametag_rfid_read_seconds", "Time from the first digit of a scan to its end"
+)
+scans = metrics.counter("nametag_rfid_scans_total", "RFID scans, by result", ["result"])
+
+
+class TagAssembler:
+    """Build tags out of keystrokes: digits followed by enter."""
+
+    def __init__(self, length: int = TAG_LENGTH):
+        self.length = length
+        self.buffer = ""
+        self.started: float | None = None
+
+    def feed(self, key: str) -> str | None:
+        """Add a key, by name. Returns the tag if this key completed one."""
+        if key == "enter":  # Linebreak indicates end of RFID input
+            tag = None
+            if len(self.buffer) == self.length and self.buffer.isdigit() and self.started is not None:
+                read_seconds.observe(time.perf_counter() - self.started)
+                tag = self.buffer
+            else:
+                scans.labels("invalid").inc()
+            self.buffer = ""  # Clear the buffer after processing
+            self.started = None
+            return tag
+        if key.isdigit():  # Append digits to the buffer
+            if self.started is None:
+                self.started = time.perf_counter()
+            self.buffer += key
+            self.buffer = self.buffer[-self.length:]
+            logger.debug(f"Buffer: {self.buffer}")
+        return None
+
+
+class RfidReader:
+    """Read tags in a thread and queue them. None is queued when reading stops."""
+
+    name = ""
+
+    def __init__(self):
+        self.tags: queue.Queue[str | None] = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"rfid-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        assembler = TagAssembler()
+        try:
+            for key in self._keys():
+                tag = assembler.feed(key)
+                if tag is not None:
+                    self.tags.put(tag)
+        except Exception:
+            logger.exception(f"Stopped reading RFID tags from {self.name}")
+        finally:
+            self.tags.put(None)
+
+    def _keys(self):
+        raise NotImplementedError
+
+
+class EvdevReader(RfidReader):
+    """Read one input device through evdev, grabbed so nothing else sees it."""
+
+    name = "evdev"
+
+    def __init__(self, device):
+        super().__init__()
+        self.device = device
+
+    def _keys(self):
+        self.device.grab()
+        logger.info(f"Reading RFID tags from {self.device.path} ({self.device.name})")
+        try:
+            for event in self.device.read_loop():
+                if event.type == EV_KEY and event.value == KEY_DOWN:
+                    key = KEY_CHARS.get(event.code)
+                    if key is not None:
+                        yield key
+        finally:
+            try:
+                self.device.ungrab()
+            except OSError:
+                pass  # Already gone, e.g. unplugged
+
+
+class KeyboardReader(RfidReader):
+    """Read every keyboard through the keyboard library's global hook."""
+
+    name = "keyboard"
+
+    def _keys(self):
+        import keyboard
+
+        logger.info("Reading RFID tags from all keyboards")
+        while True:
+            event = keyboard.read_event()
+            if event.event_type == "down":  # Only process key press events
+                yield event.name
+
+
+def find_device(device_path: str | None = RFID_DEVICE, device_name: str | None = RFID_DEVICE_NAME):
+    """Open the reader's evdev input device by path, or by part of its name."""
+    import evdev
+
+    if device_path is not None:
+        return evdev.InputDevice(device_path)
+    if device_name is None:
+        raise FileNotFoundError("Set RFID_DEVICE or RFID_DEVICE_NAME to read the RFID reader through evdev")
+
+    for candidate_path in evdev.list_devices():
+        device = evdev.InputDevice(candidate_path)
+        if device_name.lower() in device.name.lower():
+            return device
+        device.close()
+    raise FileNotFoundError(f"No input device named like {device_name!r}")
+
+
+def open_reader(backend: str = RFID_READER) -> RfidReader:
+    """Start a reader with the configured backend."""
+    configured = RFID_DEVICE is not None or RFID_DEVICE_NAME is not None
+    if backend == "evdev" or (backend == "auto" and configured):
+        try:
+            return EvdevReader(find_device()).start()
+        except (ImportError, OSError) as e:
+            if backend == "evdev":
+                raise
+            logger.warning(f"Can't read the RFID reader through evdev, falling back to keyboard: {e}")
+    return KeyboardReader().start()
+
+
+class FakeEvent(NamedTuple):
+    type: int
+    code: int
+    value: int
+
+
+class FakeInputDevice:
+    """An evdev input device that types the tags it's given."""
+
+    path = "/dev/input/fake"
+    name = "Fake RFID Reader"
+
+    # Key codes of each character, the inverse of KEY_CHARS
+    CODES = {char: code for (code, char) in KEY_CHARS.items() if code <= 28}
+
+    def __init__(self):
+        self.grabbed = False
+        self._events: queue.Queue[FakeEvent | None] = queue.Queue()
+
+    def scan(self, text: str):
+        """Type the characters, then enter, like the reader does."""
+        for key in [*text, "enter"]:
+            self._events.put(FakeEvent(EV_KEY, self.CODES[key], KEY_DOWN))
+            self._events.put(FakeEvent(EV_KEY, self.CODES[key], 0))
+
+    def close(self):
+        """End read_loop(), like unplugging the device."""
+        self._events.put(None)
+
+    def grab(self):
+        self.grabbed = True
+
+    def ungrab(self):
+        self.grabbed = False
+
+    def read_loop(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                raise OSError(19, "No such device")
+            yield event
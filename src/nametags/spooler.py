@@ -0,0 +1,424 @@
+"""
+Print spooler that owns the printer.
+
+The webserver and the RFID listener both print nametags. Rather than each of
+them opening the USB printer (and blocking while a label prints), they hand
+jobs to this daemon over a Unix socket. The daemon prints one job at a time,
+renders the next job while the current one is printing, and reports job
+status back to whoever asks.
+
+Run it with `python -m nametags.spooler`. Where the daemon always runs, set
+SPOOLER_DAEMON=1 so clients wait for it while it starts or restarts. Without
+it, jobs are printed by a spooler inside the submitting process whenever the
+daemon isn't running.
+"""
+import asyncio
+import base64
+import binascii
+import errno
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from os import environ, path
+from tempfile import gettempdir
+
+from . import metrics
+from .logconf import setup_logging
+
+logger = logging.getLogger(__name__)
+
+SPOOLER_SOCKET = environ.get("SPOOLER_SOCKET", path.join(gettempdir(), "nametags-spooler.sock"))
+
+# Set to 1 where the daemon always runs, e.g. under supervisord. Clients then
+# never print in-process, and wait up to SPOOLER_WAIT seconds for the daemon.
+SPOOLER_DAEMON = environ.get("SPOOLER_DAEMON", "0") == "1"
+SPOOLER_WAIT = float(environ.get("SPOOLER_WAIT", 30))
+
+# Job states
+QUEUED = "queued"
+RENDERING = "rendering"
+PRINTING = "printing"
+DONE = "done"
+FAILED = "failed"
+
+# How many finished jobs to remember for status requests
+JOB_HISTORY = 1000
+
+# Prefix of job IDs handed out by an in-process spooler
+LOCAL_JOB_PREFIX = "local-"
+
+
+job_seconds = metrics.histogram(
+    "nametag_spooler_job_seconds", "Time from queueing a job to it finishing, by final state", ["state"]
+)
+queue_wait_seconds = metrics.histogram(
+    "nametag_spooler_queue_wait_seconds", "Time a job waited before it was rendered"
+)
+
+
+class SpoolerError(Exception):
+    """The spooler rejected a request."""
+
+
+class Spooler:
+    """Render and print queued nametag jobs, one at a time."""
+
+    def __init__(self, render=None, send=None, job_prefix: str = ""):
+        # Default to the real printer, imported lazily so clients stay light
+        if render is None or send is None:
+            from .printer import render_name, send_raster
+            render = render or render_name
+            send = send or send_raster
+        self._render = render
+        self._send = send
+        self._job_prefix = job_prefix
+        self._jobs: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._render_queue: queue.Queue = queue.Queue()
+        # Holds the next rendered job while the current one prints
+        self._print_queue: queue.Queue = queue.Queue(maxsize=1)
+        self._threads: list[threading.Thread] = []
+
+    def start(self):
+        """Start the render and print threads."""
+        for target, name in ((self._render_loop, "spooler-render"), (self._print_loop, "spooler-print")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, name: str, second_line: str | None, raster: bytes | None = None) -> str:
+        """Queue a nametag and return its job ID.
+
+        If the raster instructions were already rendered, pass them in to skip
+        rendering.
+        """
+        job_id = self._job_prefix + uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "state": QUEUED,
+            "error": None,
+            "submitted_at": time.time(),
+            "finished_at": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            while len(self._jobs) > JOB_HISTORY:
+                self._jobs.popitem(last=False)
+        self._render_queue.put((job_id, name, second_line, raster))
+        logger.info(f"Queued job {job_id} for {name!r}")
+        return job_id
+
+    def status(self, job_id: str) -> dict | None:
+        """Return a copy of the job's status, or None if it's unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _set_state(self, job_id: str, state: str, error: str | None = None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["state"] = state
+            job["error"] = error
+            if state == RENDERING:
+                queue_wait_seconds.observe(time.time() - job["submitted_at"])
+            if state in (DONE, FAILED):
+                job["finished_at"] = time.time()
+                job_seconds.labels(state).observe(job["finished_at"] - job["submitted_at"])
+
+    def _render_loop(self):
+        while True:
+            (job_id, name, second_line, qr_data) = self._render_queue.get()
+            self._set_state(job_id, RENDERING)
+            try:
+                if qr_data is None:
+                    qr_data = self._render(name, second_line)
+            except Exception as e:
+                logger.exception(f"Failed to render job {job_id}")
+                self._set_state(job_id, FAILED, str(e))
+                continue
+            self._print_queue.put((job_id, qr_data))
+
+    def _print_loop(self):
+        while True:
+            (job_id, qr_data) = self._print_queue.get()
+            self._set_state(job_id, PRINTING)
+            try:
+                self._send(qr_data)
+            except Exception as e:
+                logger.exception(f"Failed to print job {job_id}")
+                self._set_state(job_id, FAILED, str(e))
+                continue
+            self._set_state(job_id, DONE)
+            logger.info(f"Printed job {job_id}")
+
+
+class _SpoolerRequestHandler(socketserver.StreamRequestHandler):
+    """Answer newline-delimited JSON requests."""
+
+    def handle(self):
+        spooler: Spooler = self.server.spooler  # type: ignore[attr-defined]
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "submit":
+                    raster = request.get("raster")
+                    if raster is not None:
+                        raster = base64.b64decode(raster)
+                    job_id = spooler.submit(request["name"], request.get("second_line"), raster)
+                    response = spooler.status(job_id)
+                elif op == "metrics":
+                    response = metrics.snapshot()
+                elif op == "status":
+                    response = spooler.status(request["job_id"])
+                    if response is None:
+                        response = {"error": f"Unknown job {request['job_id']}"}
+                else:
+                    response = {"error": f"Unknown op {op!r}"}
+            except (ValueError, KeyError, TypeError, binascii.Error) as e:
+                response = {"error": f"Bad request: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class SpoolerServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, spooler: Spooler):
+        self.spooler = spooler
+        if spooler_is_running(socket_path):
+            raise OSError(errno.EADDRINUSE, f"A spooler is already listening on {socket_path}")
+        # Remove a stale socket left behind by a previous run
+        if path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _SpoolerRequestHandler)
+
+
+class SpoolerClient:
+    """Talk to the spooler daemon over its Unix socket."""
+
+    def __init__(self, socket_path: str = SPOOLER_SOCKET, timeout: float = 5.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _request(self, message: dict) -> dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps(message).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+        return self._parse_response(line)
+
+    async def _request_async(self, message: dict) -> dict:
+        (reader, writer) = await asyncio.wait_for(
+            asyncio.open_unix_connection(self.socket_path), self.timeout
+        )
+        try:
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+        finally:
+            writer.close()
+        return self._parse_response(line)
+
+    @staticmethod
+    def _parse_response(line: bytes) -> dict:
+        if not line:
+            raise SpoolerError("Spooler closed the connection")
+        response = json.loads(line)
+        if "error" in response and "job_id" not in response:
+            raise SpoolerError(response["error"])
+        return response
+
+    @staticmethod
+    def _submit_message(name: str, second_line: str | None, raster: bytes | None) -> dict:
+        message = {"op": "submit", "name": name, "second_line": second_line}
+        if raster is not None:
+            message["raster"] = base64.b64encode(raster).decode()
+        return message
+
+    def submit(self, name: str, second_line: str | None, raster: bytes | None = None) -> str:
+        """Queue a nametag and return its job ID."""
+        return self._request(self._submit_message(name, second_line, raster))["job_id"]
+
+    def status(self, job_id: str) -> dict | None:
+        """Return the job's status, or None if it's unknown."""
+        try:
+            return self._request({"op": "status", "job_id": job_id})
+        except SpoolerError:
+            return None
+
+    def metrics(self) -> dict:
+        """Return a snapshot of the daemon's metrics."""
+        return self._request({"op": "metrics"})
+
+    async def submit_async(self, name: str, second_line: str | None, raster: bytes | None = None) -> str:
+        """Queue a nametag and return its job ID, without blocking the event loop."""
+        return (await self._request_async(self._submit_message(name, second_line, raster)))["job_id"]
+
+    async def status_async(self, job_id: str) -> dict | None:
+        """Return the job's status, or None if it's unknown, without blocking the event loop."""
+        try:
+            return await self._request_async({"op": "status", "job_id": job_id})
+        except SpoolerError:
+            return None
+
+
+# In-process fallback, for when the daemon isn't running
+_local_spooler = None
+_local_spooler_lock = threading.Lock()
+
+# The spooler this process serves on the socket, if it's also the daemon
+_served_spooler = None
+
+
+def get_local_spooler() -> Spooler:
+    """Get a spooler running inside this process."""
+    global _local_spooler
+    with _local_spooler_lock:
+        if _local_spooler is None:
+            _local_spooler = Spooler(job_prefix=LOCAL_JOB_PREFIX).start()
+        return _local_spooler
+
+
+def start_server(spooler: Spooler, socket_path: str = SPOOLER_SOCKET) -> SpoolerServer:
+    """Serve the spooler on the socket from a background thread.
+
+    Jobs submitted from this process go straight to it, not over the socket.
+    """
+    global _served_spooler
+    server = SpoolerServer(socket_path, spooler)
+    threading.Thread(target=server.serve_forever, name="spooler-server", daemon=True).start()
+    _served_spooler = spooler
+    logger.info(f"Spooler listening on {socket_path}")
+    return server
+
+
+def get_served_spooler() -> Spooler | None:
+    """Get the spooler this process serves, if it's the daemon."""
+    return _served_spooler
+
+
+def submit_print(name: str, second_line: str | None, raster: bytes | None = None) -> str:
+    """Queue a nametag with the spooler and return its job ID.
+
+    Pass the raster instructions if they were already rendered.
+    """
+    if _served_spooler is not None:
+        return _served_spooler.submit(name, second_line, raster)
+    deadline = time.monotonic() + SPOOLER_WAIT
+    while True:
+        try:
+            return SpoolerClient().submit(name, second_line, raster)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            if not SPOOLER_DAEMON:
+                logger.warning(f"Spooler is not running at {SPOOLER_SOCKET}, printing in-process.")
+                return get_local_spooler().submit(name, second_line, raster)
+            _wait_for_daemon(deadline, e)
+            time.sleep(0.5)
+
+
+def _wait_for_daemon(deadline: float, error: OSError):
+    """Give up on a configured daemon that's still down at the deadline."""
+    if time.monotonic() >= deadline:
+        raise SpoolerError(f"Spooler is not running at {SPOOLER_SOCKET}") from error
+    logger.info(f"Waiting for the spooler at {SPOOLER_SOCKET}...")
+
+
+def spooler_is_running(socket_path: str = SPOOLER_SOCKET) -> bool:
+    """Return whether the spooler daemon is accepting jobs."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def prints_in_process() -> bool:
+    """Return whether jobs submitted from this process will likely print in it.
+
+    Only a guess at startup, for warming up. Each job is routed when it's
+    submitted.
+    """
+    return not SPOOLER_DAEMON and not spooler_is_running()
+
+
+def get_job_status(job_id: str) -> dict | None:
+    """Return the status of a job queued with submit_print()."""
+    if _served_spooler is not None:
+        return _served_spooler.status(job_id)
+    if job_id.startswith(LOCAL_JOB_PREFIX):
+        return get_local_spooler().status(job_id)
+    try:
+        return SpoolerClient().status(job_id)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+
+
+async def submit_print_async(name: str, second_line: str | None) -> str:
+    """Like submit_print(), for use on an event loop."""
+    if _served_spooler is not None:
+        return _served_spooler.submit(name, second_line)
+    deadline = time.monotonic() + SPOOLER_WAIT
+    while True:
+        try:
+            return await SpoolerClient().submit_async(name, second_line)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            if not SPOOLER_DAEMON:
+                logger.warning(f"Spooler is not running at {SPOOLER_SOCKET}, printing in-process.")
+                return get_local_spooler().submit(name, second_line)
+            _wait_for_daemon(deadline, e)
+            await asyncio.sleep(0.5)
+
+
+async def get_job_status_async(job_id: str) -> dict | None:
+    """Like get_job_status(), for use on an event loop."""
+    if _served_spooler is not None:
+        return _served_spooler.status(job_id)
+    if job_id.startswith(LOCAL_JOB_PREFIX):
+        return get_local_spooler().status(job_id)
+    try:
+        return await SpoolerClient().status_async(job_id)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+
+
+def serve_forever(socket_path: str = SPOOLER_SOCKET):
+    """Run the spooler daemon."""
+    from .keepalive import keep_printer_awake
+    from .warmup import warm_up
+
+    spooler = Spooler()
+    metrics.start_scrape_file_writer("spooler")
+
+    def start_printing():
+        # Jobs queue up while the first one is made ready to print without delay
+        warm_up(rendering=True, printer=True)
+        spooler.start()
+        # The printer stays open in this process, so keep it awake from here too
+        threading.Thread(target=keep_printer_awake, name="keepalive", daemon=True).start()
+
+    # Listen first, so clients see the daemon and never open the printer themselves
+    with SpoolerServer(socket_path, spooler) as server:
+        logger.info(f"Spooler listening on {socket_path}")
+        threading.Thread(target=start_printing, name="spooler-warmup", daemon=True).start()
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    try:
+        serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,153 @@
+"""
+Static label backgrounds.
+
+Everything except the name and the second line is identical on every tag:
+the black bars, the two logos, "Hello" and "my name is". This module draws
+that background once per label identifier, so a render only has to copy it
+and add the variable text.
+"""
+import logging
+from dataclasses import dataclass
+from functools import cache
+
+from PIL import Image, ImageDraw
+
+from .assetcache import (
+    bold_font_path,
+    check_assets,
+    clear_asset_cache,
+    font_path,
+    load_font,
+    load_logo,
+    logo_path,
+)
+from .fitting import clear_fit_cache
+
+logger = logging.getLogger(__name__)
+
+# Bump this whenever the static layout changes, so cached output built from
+# an older template is not reused
+TEMPLATE_VERSION = 1
+
+# Define black bar heights
+TOP_BAR_HEIGHT = 200
+BOTTOM_BAR_HEIGHT = 100
+
+# Define text positions
+HELLO_TEXT_Y = 0
+MY_NAME_IS_TEXT_Y = 115
+
+# Desired size of the logo (width, height)
+LOGO_SIZE = (100, 100)
+LOGO_INSET = 50  # Inset from the edges
+
+# Font sizes of the static text
+FONT_HELLO_SIZE = 100
+FONT_MY_NAME_IS_SIZE = 50
+
+# Margin left on both sides of the name and second line
+TEXT_MARGIN = 50
+
+
+@dataclass(frozen=True)
+class LabelTemplate:
+    """Prerendered background and geometry of a label."""
+
+    identifier: str
+    width: int
+    height: int
+    background: Image.Image
+
+    @property
+    def center_x(self) -> int:
+        return self.width // 2
+
+    @property
+    def text_max_width(self) -> int:
+        """Widest the name or second line may be."""
+        return self.width - 2 * TEXT_MARGIN
+
+    @property
+    def white_space_top(self) -> int:
+        return TOP_BAR_HEIGHT
+
+    @property
+    def white_space_bottom(self) -> int:
+        return self.height - BOTTOM_BAR_HEIGHT
+
+    def new_image(self) -> Image.Image:
+        """Return a fresh copy of the background to draw on."""
+        return self.background.copy()
+
+
+@cache
+def get_label_template(label_identifier: str) -> LabelTemplate:
+    """Build the template for a Brother QL label identifier, e.g. "62x100"."""
+    from brother_ql.labels import LabelsManager
+
+    check_assets()
+
+    # Define image dimensions
+    label = next(
+        (
+            candidate
+            for candidate in LabelsManager().iter_elements()
+            if candidate.identifier == label_identifier
+        ),
+        None,
+    )
+    if label is None:
+        raise ValueError(
+            f"Invalid LABEL_SIZE '{label_identifier}'. Expected a known Brother QL label identifier."
+        )
+    image_height, image_width = label.dots_printable
+
+    logger.info(f"Building label template for {label_identifier}")
+
+    center_x = image_width // 2
+
+    # Create a blank white image
+    image = Image.new("RGB", (image_width, image_height), "white")
+    draw = ImageDraw.Draw(image)
+
+    # Raises IOError if the font file is not found
+    font_hello = load_font(font_path, FONT_HELLO_SIZE)
+    font_my_name_is = load_font(bold_font_path, FONT_MY_NAME_IS_SIZE)
+
+    # Add black bars at the top and bottom
+    draw.rectangle([(0, 0), (image_width, TOP_BAR_HEIGHT)], fill="black")
+    draw.rectangle([(0, image_height - BOTTOM_BAR_HEIGHT), (image_width, image_height)], fill="black")
+
+    logo_image = load_logo(logo_path, LOGO_SIZE[0], LOGO_SIZE[1])
+
+    # Add the logo to the top-left corner of the black bar
+    top_left_logo_x = LOGO_INSET
+    top_left_logo_y = (TOP_BAR_HEIGHT - LOGO_SIZE[1]) // 2  # Center vertically in the black bar
+    image.paste(logo_image, (top_left_logo_x, top_left_logo_y), logo_image)
+
+    # Add the logo to the top-right corner of the black bar
+    top_right_logo_x = image_width - LOGO_SIZE[0] - LOGO_INSET
+    top_right_logo_y = (TOP_BAR_HEIGHT - LOGO_SIZE[1]) // 2  # Center vertically in the black bar
+    image.paste(logo_image, (top_right_logo_x, top_right_logo_y), logo_image)
+
+    # Add "Hello" text
+    hello_text = "Hello"
+    draw.text((center_x, HELLO_TEXT_Y), hello_text, anchor="ma", fill="white", font=font_hello)
+
+    # Add "my name is" text
+    my_name_is_text = "my name is"
+    draw.text((center_x, MY_NAME_IS_TEXT_Y), my_name_is_text, anchor="ma", fill="white", font=font_my_name_is)
+
+    return LabelTemplate(
+        identifier=label_identifier,
+        width=image_width,
+        height=image_height,
+        background=image,
+    )
+
+
+def clear_template_cache():
+    """Drop all cached templates along with the assets they were built from."""
+    get_label_template.cache_clear()
+    clear_fit_cache()
+    clear_asset_cache()
@@ -0,0 +1,63 @@
+"""
+Do the slow one-time work of a lookup and a print at startup.
+
+API authentication, the accounts request, font loading, logo rasterization
+and printer discovery all happen lazily, so without a warm-up the first scan
+after a restart pays for all of them. Each step is logged with how long it
+took. A failed step is logged and skipped, since the same work will be
+retried on first use.
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Rendered once to warm the template, fonts, logo and raster conversion
+WARMUP_NAME = "Warm Up"
+WARMUP_SECOND_LINE = "Pumping Station: One"
+
+
+def warm_up_api():
+    """Authenticate with Wild Apricot and find the contacts URL."""
+    from .rfid import get_api_client, get_contacts_url, get_member_index
+
+    get_member_index()
+    get_contacts_url(get_api_client())
+
+
+def warm_up_rendering():
+    """Load the template, the fonts and logo of a typical label, and the raster conversion."""
+    from .printer import convert_image, make_image
+
+    # Other font sizes are loaded when a name first needs them, which keeps
+    # the ones no name ever gets out of memory
+    convert_image(make_image(WARMUP_NAME, WARMUP_SECOND_LINE))
+
+
+def warm_up_printer():
+    """Discover and open the printer."""
+    from .printer import get_printer_id
+
+    get_printer_id()
+
+
+def warm_up(api: bool = False, rendering: bool = False, printer: bool = False):
+    """Run the chosen warm-up steps and log how long they took."""
+    steps = []
+    if api:
+        steps.append(("API", warm_up_api))
+    if rendering:
+        steps.append(("rendering", warm_up_rendering))
+    if printer:
+        steps.append(("printer", warm_up_printer))
+
+    start = time.perf_counter()
+    for (name, step) in steps:
+        step_start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Warm-up of {name} failed after {time.perf_counter() - step_start:.2f} s: {e}")
+            continue
+        logger.info(f"Warmed up {name} in {time.perf_counter() - step_start:.2f} s")
+    logger.info(f"Warm-up took {time.perf_counter() - start:.2f} s")
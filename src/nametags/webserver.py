@@ -1,29 +1,179 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
 from asgiref.wsgi import WsgiToAsgi
-from flask import Flask, render_template, request
+from flask import Flask, make_response, render_template
 
+from . import metrics
 from .logconf import setup_logging
-from .printer import print_name
+from .preview import PreviewCache
+from .spooler import (
+    SpoolerClient,
+    SpoolerError,
+    get_job_status_async,
+    get_served_spooler,
+    prints_in_process,
+    submit_print_async,
+)
 
 setup_logging()
 
 app = Flask(__name__)
 
+# Rendered previews, shared by all requests
+preview_cache = PreviewCache()
+
+# Longest name or second line a preview will render
+PREVIEW_MAX_LENGTH = 100
+
 
-@app.route("/", methods=["GET", "POST"])
+# Printing, job status and previews are served by asgi_app() below
+@app.route("/")
 def index():
-    if request.method == "POST":
-        name = request.form["name"]
-        second_line = request.form["second_line"]
+    return render_template("index.html")
 
-        print_name(name, second_line)
 
-        return render_template("printing.html")
+@app.route("/metrics")
+def metrics_page():
+    snapshots = {"webserver": metrics.snapshot()}
+
+    # Printing happens in the spooler daemon, when it's running in another process
+    if get_served_spooler() is None:
+        try:
+            snapshots["spooler"] = SpoolerClient(timeout=1.0).metrics()
+        except (OSError, SpoolerError):
+            pass
+
+    response = make_response(metrics.render(snapshots))
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+
+# Everything else is served by Flask through this adapter
+flask_asgi_app = WsgiToAsgi(app)
+
+
+async def asgi_app(scope, receive, send):
+    """ASGI app for Uvicorn.
+
+    Printing and job status are handled natively, so they never wait on a
+    worker thread. They return as soon as the job is queued, and the page
+    polls /jobs/<job_id> for progress. Previews are also handled natively
+    and rendered in a thread each, because WsgiToAsgi runs every Flask
+    request on one thread: a slow render would hold up every other page, and
+    identical renders could never be shared.
+    """
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+
+    if scope["type"] == "http":
+        method = scope["method"]
+        path = scope["path"]
+        if method == "POST" and path == "/":
+            await _submit_print(scope, receive, send)
+            return
+        if method == "GET" and path.startswith("/jobs/"):
+            await _job_status(path.removeprefix("/jobs/"), send)
+            return
+        if method == "GET" and path == "/preview.png":
+            await _preview(scope, send)
+            return
+
+    await flask_asgi_app(scope, receive, send)
+
+
+def warm_up_webserver():
+    """Get previews, and prints if there's no spooler daemon, ready for the first request."""
+    from .warmup import warm_up
+
+    warm_up(rendering=True, printer=prints_in_process())
 
-    return render_template("index.html")
 
+async def _lifespan(receive, send):
+    # Uvicorn reports startup as complete once this has warmed up
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await asyncio.to_thread(warm_up_webserver)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _submit_print(scope, receive, send):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    form = parse_qs(body.decode(), keep_blank_values=True)
+    if "name" not in form or "second_line" not in form:
+        await _respond(send, 400, "text/plain", b"Bad Request")
+        return
+
+    try:
+        job_id = await submit_print_async(form["name"][0], form["second_line"][0])
+    except SpoolerError as e:
+        await _respond(send, 503, "text/plain", str(e).encode())
+        return
+
+    page = app.jinja_env.get_template("printing.html").render(job_id=job_id)
+    await _respond(send, 200, "text/html; charset=utf-8", page.encode())
+
+
+async def _job_status(job_id, send):
+    status = await get_job_status_async(job_id)
+    if status is None:
+        await _respond(send, 404, "application/json", b'{"error": "Unknown job"}')
+        return
+    await _respond(send, 200, "application/json", json.dumps(status).encode())
+
+
+async def _preview(scope, send):
+    from .printer import LABEL_SIZE
+
+    query = parse_qs(scope["query_string"].decode(), keep_blank_values=True)
+    name = query.get("name", [""])[0][:PREVIEW_MAX_LENGTH]
+    second_line = query.get("second_line", [""])[0][:PREVIEW_MAX_LENGTH]
+    headers = dict(scope["headers"])
+
+    # Browsers revalidate with the ETag, which is known without rendering
+    etag = preview_cache.etag(name, second_line, LABEL_SIZE)
+    cache_headers = [(b"etag", f'"{etag}"'.encode())]
+    if _etag_matches(headers.get(b"if-none-match", b"").decode(), etag):
+        await _respond(send, 304, "image/png", b"", "max-age=300", cache_headers)
+        return
+
+    (png, etag) = await asyncio.to_thread(preview_cache.get, name, second_line, LABEL_SIZE)
+    await _respond(send, 200, "image/png", png, "max-age=300", cache_headers)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+async def _respond(send, status, content_type, body, cache_control="no-store", headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+            (b"cache-control", cache_control.encode()),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
 
-# Create ASGI app for compatibility with Uvicorn
-asgi_app = WsgiToAsgi(app)
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    import uvicorn
+
+    # The same app Uvicorn serves in production, reloaded on code changes
+    uvicorn.run("nametags.webserver:asgi_app", port=5000, reload=True)
@@ -0,0 +1,16 @@
+import io
+from unittest.mock import MagicMock
+
+from PIL import Image
+
+
+def fake_wand() -> dict:
+    """Stand-in wand modules, as ImageMagick isn't needed to test rendering.
+
+    Every SVG rasterizes to the same 10x10 white square.
+    """
+    blob = io.BytesIO()
+    Image.new("RGBA", (10, 10), "white").save(blob, "png")
+    wand = MagicMock()
+    wand.image.Image.return_value.__enter__.return_value.make_blob.return_value = blob.getvalue()
+    return {"wand": wand, "wand.image": wand.image, "wand.color": wand.color}
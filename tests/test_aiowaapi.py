@@ -0,0 +1,64 @@
+"""
+AsyncWaApiClient against a local stand-in for the Wild Apricot API.
+"""
+import asyncio
+import datetime
+import time
+from unittest import IsolatedAsyncioTestCase
+
+from nametags.aiowaapi import AsyncWaApiClient
+from nametags.fakewa import FakeWildApricot
+from nametags.WaApi import ApiException
+
+
+class TestAsyncWaApiClient(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.fake = FakeWildApricot().start()
+        self.addCleanup(self.fake.stop)
+        self.fake.add_contact(1, "0001234567", "Testy", None, "she/her")
+        self.api = self.fake.configure_client(AsyncWaApiClient("fake-id", "fake-secret"))
+        await self.api.authenticate_with_apikey("fake")
+
+    async def asyncTearDown(self):
+        await self.api.close()
+
+    async def test_execute_request(self):
+        accounts = await self.api.execute_request("/v2/accounts/")
+        contacts_url = next(res for res in accounts[0].Resources if res.Name == "Contacts").Url
+        response = await self.api.execute_request(contacts_url[:-1] + "?$async=false")
+        self.assertEqual(response.Contacts[0].get_field_value("FirstName"), "Testy")
+
+    async def test_requests_reuse_connection(self):
+        for _ in range(5):
+            await self.api.execute_request("/v2/accounts/")
+        self.assertEqual(self.fake.connections, 1)
+
+    async def test_requests_run_concurrently(self):
+        self.fake.latency = 0.2
+        start = time.monotonic()
+        await asyncio.gather(*(self.api.execute_request("/v2/accounts/") for _ in range(5)))
+        self.assertLess(time.monotonic() - start, 0.2 * 5)
+
+    async def test_bad_request_raises_api_exception(self):
+        self.fake.fail_next(status=400)
+        with self.assertRaises(ApiException):
+            await self.api.execute_request("/v2/accounts/")
+
+    async def test_slow_request_times_out(self):
+        self.fake.delay_next(seconds=2)
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            await self.api.execute_request("/v2/accounts/", timeout=0.2)
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    async def test_slow_authentication_times_out(self):
+        api = self.fake.configure_client(AsyncWaApiClient("fake-id", "fake-secret"))
+        self.addAsyncCleanup(api.close)
+        self.fake.delay_next(seconds=2)
+        with self.assertRaises(TimeoutError):
+            await api.authenticate_with_apikey("fake", timeout=0.2)
+
+    async def test_expired_token_is_refreshed(self):
+        self.api._token.retrieved_at -= datetime.timedelta(hours=2)
+        await self.api.execute_request("/v2/accounts/")
+        self.assertEqual(sum(1 for (_, path) in self.fake.requests if path == "/auth/token"), 2)
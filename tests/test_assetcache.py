@@ -0,0 +1,30 @@
+import sys
+from unittest import TestCase
+from unittest.mock import patch
+
+from helpers import fake_wand
+
+from nametags.assetcache import bold_font_path, clear_asset_cache, font_path, load_font, load_logo, logo_path
+
+
+class TestAssetCache(TestCase):
+    def setUp(self):
+        clear_asset_cache()
+        self.addCleanup(clear_asset_cache)
+
+    def test_fonts_are_loaded_once_per_path_and_size(self):
+        font = load_font(font_path, 50)
+        self.assertIs(load_font(font_path, 50), font)
+        self.assertIsNot(load_font(font_path, 51), font)
+        self.assertIsNot(load_font(bold_font_path, 50), font)
+
+        clear_asset_cache()
+        self.assertIsNot(load_font(font_path, 50), font)
+
+    def test_logo_is_rasterized_once_per_size(self):
+        modules = fake_wand()
+        with patch.dict(sys.modules, modules):
+            logo = load_logo(logo_path, 100, 100)
+            self.assertIs(load_logo(logo_path, 100, 100), logo)
+            self.assertIsNot(load_logo(logo_path, 50, 50), logo)
+        self.assertEqual(modules["wand.image"].Image.call_count, 2)
@@ -0,0 +1,92 @@
+import csv
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from helpers import fake_wand
+from PIL import Image
+
+from nametags.batch import BatchItem, output_filename, read_items, run_batch, wait_for_print_jobs
+from nametags.printer import convert_image
+from nametags.printer import make_image as printer_make_image
+from nametags.spooler import DONE, PRINTING
+from nametags.template import clear_template_cache
+
+
+class TestReadItems(TestCase):
+    def test_csv_with_header(self):
+        items = list(read_items(StringIO("name,second_line\nGrace Hopper,she/her\nBob\n")))
+        self.assertEqual(items, [
+            BatchItem(0, "Grace Hopper", "she/her"),
+            BatchItem(1, "Bob", None),
+        ])
+
+    def test_csv_without_header(self):
+        items = list(read_items(StringIO('"Hopper, Grace",\n\nBob,x\n')))
+        self.assertEqual([(item.name, item.second_line) for item in items], [("Hopper, Grace", ""), ("Bob", "x")])
+
+    def test_jsonl_keeps_going_after_bad_line(self):
+        items = list(read_items(StringIO('{"name": "A"}\nnot json\n{"name": "B", "second_line": "x"}\n')))
+        self.assertEqual([item.error is None for item in items], [True, False, True])
+        self.assertEqual(items[2], BatchItem(2, "B", "x"))
+
+    def test_csv_keeps_going_after_bad_row(self):
+        too_long = "x" * (csv.field_size_limit() + 1)
+        items = list(read_items(StringIO(f"Ann\n{too_long}\nCarl\n")))
+        self.assertEqual([item.error is None for item in items], [True, False, True])
+        self.assertEqual(items[2].name, "Carl")
+
+    def test_output_filename(self):
+        self.assertEqual(output_filename(BatchItem(7, "Zoë O'Brien", None)), "0007-zo-o-brien.png")
+
+
+class TestRunBatch(TestCase):
+    def setUp(self):
+        # Workers run as threads, so they see the stand-in wand
+        for patcher in (
+            patch.dict(sys.modules, fake_wand()),
+            patch("nametags.batch.ProcessPoolExecutor", ThreadPoolExecutor),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        clear_template_cache()
+        self.addCleanup(clear_template_cache)
+        self.tempdir = TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.output_dir = Path(self.tempdir.name)
+
+    def test_csv_to_files(self):
+        items = read_items(StringIO("name,second_line\nGrace Hopper,she/her\nBob\n"))
+        report = StringIO()
+        self.assertEqual(run_batch(items, self.output_dir, jobs=2, report=report), 0)
+        self.assertEqual(sorted(path.name for path in self.output_dir.iterdir()), ["0000-grace-hopper.png", "0001-bob.png"])
+        with Image.open(self.output_dir / "0001-bob.png") as image:
+            self.assertEqual(image.size, (1109, 696))
+        self.assertIn("2 items, 0 failed", report.getvalue())
+
+    def test_files_and_prints_render_once(self):
+        renders = []
+
+        def make_image(name, second_line):
+            renders.append(name)
+            return printer_make_image(name, second_line)
+
+        queued = []
+        with patch("nametags.printer.make_image", make_image), \
+             patch("nametags.spooler.submit_print", side_effect=lambda *args: queued.append(args) or "job"), \
+             patch("nametags.spooler.get_job_status", return_value={"state": DONE}):
+            failed = run_batch(iter([BatchItem(0, "Bob", None)]), self.output_dir, print_labels=True, report=StringIO())
+        self.assertEqual(failed, 0)
+        self.assertEqual(renders, ["Bob"])
+        self.assertEqual(queued[0][2], convert_image(printer_make_image("Bob", None)))
+
+    def test_stuck_printer_times_out(self):
+        report = StringIO()
+        print_jobs = [(BatchItem(0, "Bob", None), "job1"), (BatchItem(1, "Ann", None), "job2")]
+        with patch("nametags.spooler.get_job_status", return_value={"state": PRINTING}):
+            self.assertEqual(wait_for_print_jobs(print_jobs, report, timeout=0.2), 2)
+        self.assertIn("still printing", report.getvalue())
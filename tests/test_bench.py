@@ -0,0 +1,25 @@
+import sys
+from unittest import TestCase
+from unittest.mock import patch
+
+from helpers import fake_wand
+
+from nametags.bench import find_regressions, get_benchmarks
+from nametags.fakewa import LookupFixture
+from nametags.template import clear_template_cache
+
+
+class TestBench(TestCase):
+    def test_find_regressions(self):
+        baselines = {"fast": 1.0, "slow": 1.0}
+        results = {"fast": 1.2, "slow": 1.3, "new": 5.0}
+        self.assertEqual(find_regressions(results, baselines, 0.25), ["slow"])
+
+    def test_every_benchmark_runs(self):
+        with patch.dict(sys.modules, fake_wand()):
+            clear_template_cache()
+            self.addCleanup(clear_template_cache)
+            with LookupFixture() as fixture:
+                for (name, setup) in get_benchmarks(fixture).items():
+                    with self.subTest(name):
+                        setup()()
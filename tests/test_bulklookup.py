@@ -0,0 +1,68 @@
+import threading
+import time
+from io import StringIO
+from unittest import TestCase
+
+from nametags.bulklookup import RateLimiter, read_tags, run_bulk_lookup
+
+
+def fake_lookup(rfid_tag):
+    if rfid_tag == "boom":
+        raise RuntimeError("API down")
+    found = rfid_tag.startswith("1")
+    return {"rfid_tag": rfid_tag, "found": found, "matches": []}
+
+
+class TestBulkLookup(TestCase):
+    def test_read_tags_skips_blank_lines(self):
+        self.assertEqual(list(read_tags(StringIO(" 0001\n\n0002 \n"))), ["0001", "0002"])
+
+    def test_results_in_input_order(self):
+        output = StringIO()
+        tags = ["1" + str(i) for i in range(10)] + ["2", "boom"]
+        not_found = run_bulk_lookup(iter(tags), output, jobs=4, rate=1000, lookup=fake_lookup)
+        lines = output.getvalue().splitlines()
+        self.assertEqual([line.split('"')[3] for line in lines], tags)
+        self.assertIn('"error": "API down"', lines[-1])
+        self.assertEqual(not_found, 2)
+
+    def test_streams_while_reading(self):
+        output = StringIO()
+        written_before_last = []
+
+        def tags():
+            for i in range(20):
+                yield f"1{i}"
+            time.sleep(0.1)
+            written_before_last.append(len(output.getvalue().splitlines()))
+            yield "last"
+
+        run_bulk_lookup(tags(), output, jobs=2, rate=1000, lookup=fake_lookup)
+        self.assertGreater(written_before_last[0], 0)
+        self.assertEqual(len(output.getvalue().splitlines()), 21)
+
+    def test_results_are_written_while_input_waits(self):
+        output = StringIO()
+        written_while_waiting = []
+
+        def tags():
+            yield from ("10", "11", "12")
+            # Like a person typing tags into stdin
+            deadline = time.monotonic() + 5
+            while len(output.getvalue().splitlines()) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            written_while_waiting.append(len(output.getvalue().splitlines()))
+
+        run_bulk_lookup(tags(), output, jobs=2, rate=1000, lookup=fake_lookup)
+        self.assertEqual(written_while_waiting, [3])
+
+    def test_rate_limit_shared_by_threads(self):
+        limiter = RateLimiter(rate=50)
+        start = time.monotonic()
+        threads = [threading.Thread(target=limiter.acquire) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The first is free, the other five wait 20 ms each
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
@@ -0,0 +1,31 @@
+"""
+Font fitting only needs Pillow and the bundled fonts, so it can be tested
+without any hardware.
+"""
+from unittest import TestCase
+
+from nametags.assetcache import font_path
+from nametags.fitting import clear_fit_cache, fit_font_size, text_width
+
+
+class TestFitFontSize(TestCase):
+    def setUp(self):
+        clear_fit_cache()
+
+    def test_short_text_keeps_max_size(self):
+        self.assertEqual(fit_font_size("Bob", font_path, 596, 170), 170)
+
+    def test_long_text_gets_largest_fitting_size(self):
+        name = "Maximiliana-Christabel"
+        size = fit_font_size(name, font_path, 596, 170)
+        self.assertLess(size, 170)
+        self.assertLessEqual(text_width(name, font_path, size), 596)
+        self.assertGreater(text_width(name, font_path, size + 1), 596)
+
+    def test_never_below_min_size(self):
+        self.assertEqual(fit_font_size("W" * 500, font_path, 596, 170, min_size=10), 10)
+
+    def test_repeat_text_is_cached(self):
+        fit_font_size("Grace Hopper", font_path, 596, 170)
+        fit_font_size("Grace Hopper", font_path, 596, 170)
+        self.assertEqual(fit_font_size.cache_info().hits, 1)
@@ -0,0 +1,55 @@
+"""
+Keep the CLI quick to start: each subcommand should import only what it needs.
+
+Modules are imported in a fresh interpreter. The check fails if one pulls in
+a slow dependency it doesn't need, or takes longer than its budget.
+"""
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+# Seconds, generous enough for a loaded Pi
+BUDGETS = {
+    "nametags.cli": 0.25,
+    "nametags.rfid": 0.5,
+    "nametags.printer": 0.5,
+}
+
+# Slow to import, and only needed to render, print or read the keyboard
+HEAVY_MODULES = {
+    "nametags.cli": ["PIL", "brother_ql", "wand", "keyboard", "usb", "nametags.printer", "nametags.rfid"],
+    "nametags.rfid": ["PIL", "brother_ql", "wand", "keyboard", "usb", "asyncio"],
+    "nametags.printer": ["brother_ql", "wand", "usb"],
+}
+
+
+def import_in_subprocess(module: str) -> tuple[float, set[str]]:
+    """Import a module in a new interpreter and return its import time and what it loaded."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    for variable in ("WA_CLIENT_ID", "WA_CLIENT_SECRET", "WA_API_KEY"):
+        env.setdefault(variable, "fake")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys, {module}; print(*sys.modules)"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    cumulative = None
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and line.rsplit("|", 1)[-1].strip() == module:
+            cumulative = int(line.split("|")[1]) / 1e6
+    return (cumulative, set(result.stdout.split()))
+
+
+class TestImportTime(TestCase):
+    def test_modules_stay_light(self):
+        for (module, budget) in BUDGETS.items():
+            with self.subTest(module=module):
+                (seconds, loaded) = import_in_subprocess(module)
+                heavy = [name for name in HEAVY_MODULES[module] if name in loaded]
+                self.assertEqual(heavy, [], f"{module} imports {heavy}")
+                self.assertLess(seconds, budget, f"{module} took {seconds:.3f} s to import")
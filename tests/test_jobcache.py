@@ -0,0 +1,35 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from nametags.jobcache import RasterJobCache, raster_job_key
+
+
+class TestRasterJobKey(TestCase):
+    def test_blank_second_line_matches_none(self):
+        self.assertEqual(
+            raster_job_key("Bob", "  ", "62x100", "QL-800"),
+            raster_job_key("Bob", None, "62x100", "QL-800"),
+        )
+
+    def test_label_size_is_part_of_key(self):
+        self.assertNotEqual(
+            raster_job_key("Bob", None, "62x100", "QL-800"),
+            raster_job_key("Bob", None, "62", "QL-800"),
+        )
+
+
+class TestRasterJobCache(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = RasterJobCache(max_bytes=20)
+        cache.put("a", b"x" * 10)
+        cache.put("b", b"x" * 10)
+        cache.get("a")
+        cache.put("c", b"x" * 10)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_disk_tier_survives_restart(self):
+        with TemporaryDirectory() as cache_dir:
+            RasterJobCache(max_bytes=100, cache_dir=cache_dir).put("a", b"raster")
+            self.assertEqual(RasterJobCache(max_bytes=100, cache_dir=cache_dir).get("a"), b"raster")
@@ -0,0 +1,66 @@
+import io
+import os
+import sys
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from helpers import fake_wand
+
+# rfid reads its credentials at import
+for variable in ("WA_CLIENT_ID", "WA_CLIENT_SECRET", "WA_API_KEY"):
+    os.environ.setdefault(variable, "fake")
+
+from nametags import printer, printerhandle  # noqa: E402
+from nametags.loadtest import Scan, expected_labels, make_rush, read_script, run_load, summarize  # noqa: E402
+from nametags.template import clear_template_cache  # noqa: E402
+
+
+class TestLoadTest(TestCase):
+    def test_read_script(self):
+        script = io.StringIO("# Opening night\n0.5 0001234567\n\n0.0 0007654321 unknown\n")
+        self.assertEqual(read_script(script), [Scan(0.0, "0007654321", False), Scan(0.5, "0001234567")])
+        with self.assertRaises(ValueError):
+            read_script(io.StringIO("0.5 0001234567 member\n"))
+
+    def test_expected_labels(self):
+        scans = [Scan(0, "1"), Scan(1, "1"), Scan(20, "1"), Scan(21, "2", False)]
+        self.assertEqual(expected_labels(scans, 10), [True, False, True, False])
+
+    def test_generated_rush_is_repeatable(self):
+        self.assertEqual(make_rush(50, seed=1), make_rush(50, seed=1))
+        self.assertEqual(len(make_rush(50)), 50)
+
+    def test_summarize(self):
+        scans = [Scan(0, "1"), Scan(1, "2"), Scan(2, "1"), Scan(3, "3")]
+        expected = [True, True, False, True]
+        names = {"1": "One", "2": "Two", "3": "Three"}
+        printed = {"One": [100.5, 101.0], "Two": [102.0]}
+        report = summarize(scans, expected, [100, 101, 102, 103], names, printed)
+        self.assertEqual(report.latencies, [0.5, 1.0])
+        self.assertEqual((report.dropped, report.extra), (1, 1))
+        self.assertEqual(report.seconds, 2.0)
+        self.assertEqual(report.percentile(50), 0.5)
+        self.assertEqual(report.percentile(99), 1.0)
+
+
+class TestRunLoad(TestCase):
+    def setUp(self):
+        patcher = patch.dict(sys.modules, fake_wand())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clear_template_cache()
+        self.addCleanup(clear_template_cache)
+        # The sink's status would otherwise show up in later tests' metrics
+        self.addCleanup(printerhandle.printer_media.clear)
+
+    def test_rush_through_null_printer(self):
+        handle = printer._printer_handle
+        scans = [Scan(0.0, "0000000001"), Scan(0.05, "0000000002"), Scan(0.1, "0000000001"), Scan(0.15, "9000000000", False)]
+        report = run_load(scans, drain_seconds=10)
+        self.assertEqual((report.expected, len(report.latencies), report.dropped, report.extra), (2, 2, 0, 0))
+
+        # The real printer is left alone, and nothing the listener starts outlives the run
+        self.assertIs(printer._printer_handle, handle)
+        self.assertNotIn("member-index-sync", [thread.name for thread in threading.enumerate()])
+        self.assertNotIn("metrics-writer", [thread.name for thread in threading.enumerate()])
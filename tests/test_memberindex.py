@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from nametags.memberindex import MemberIndex, MemberRecord
+
+
+class TestMemberIndex(TestCase):
+    def setUp(self):
+        self.index = MemberIndex(":memory:")
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_lookup_by_any_tag_in_field(self):
+        record = MemberRecord(1, "0001234567, 0007654321", "Testy", None, "she/her")
+        self.index.upsert([record])
+        self.assertEqual(self.index.lookup("0007654321"), [record])
+        self.assertEqual(self.index.lookup("1234567"), [])
+
+    def test_upsert_replaces_tags(self):
+        self.index.upsert([MemberRecord(1, "0001234567", "Testy", None, None)])
+        self.index.upsert([MemberRecord(1, "0007654321", "Testy", "Nick", None)])
+        self.assertEqual(self.index.lookup("0001234567"), [])
+        self.assertEqual(self.index.lookup("0007654321")[0].preferred_name, "Nick")
+
+    def test_replace_all_drops_missing_members(self):
+        self.index.upsert([MemberRecord(1, "0001234567", "Testy", None, None)])
+        self.index.replace_all([MemberRecord(2, "0007654321", "Other", None, None)])
+        self.assertEqual(self.index.count(), 1)
+        self.assertEqual(self.index.lookup("0001234567"), [])
+
+    def test_sync_time_round_trip(self):
+        self.assertIsNone(self.index.get_sync_time("full"))
+        when = datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        self.index.set_sync_time("full", when)
+        self.assertEqual(self.index.get_sync_time("full"), when)
+
+    def test_answers_round_trip(self):
+        self.index.remember_answer("0001234567", "Testy", None)
+        self.index.remember_answer("0001234567", "Testy", "she/her")
+        self.assertEqual(self.index.last_answer("0001234567"), ("Testy", "she/her"))
+        self.index.forget_answer("0001234567")
+        self.assertIsNone(self.index.last_answer("0001234567"))
+        self.index.remember_answer("0001234567", "Testy", "she/her")
+        self.assertEqual(self.index.last_answer("0001234567"), ("Testy", "she/her"))
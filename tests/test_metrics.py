@@ -0,0 +1,60 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from nametags import metrics
+
+
+class TestMetrics(TestCase):
+    def test_render_counters_and_histograms(self):
+        requests = metrics.counter("test_requests_total", "Requests", ["result"])
+        latency = metrics.histogram("test_latency_seconds", "Latency", buckets=(0.1, 1))
+        requests.labels("hit").inc()
+        requests.labels("hit").inc(2)
+        latency.observe(0.05)
+        latency.observe(0.5)
+        latency.observe(5)
+
+        text = metrics.render({"test": metrics.snapshot()})
+        self.assertIn("# TYPE test_requests_total counter", text)
+        self.assertIn('test_requests_total{process="test",result="hit"} 3', text)
+        self.assertIn('test_latency_seconds_bucket{process="test",le="0.1"} 1', text)
+        self.assertIn('test_latency_seconds_bucket{process="test",le="1.0"} 2', text)
+        self.assertIn('test_latency_seconds_bucket{process="test",le="+Inf"} 3', text)
+        self.assertIn('test_latency_seconds_count{process="test"} 3', text)
+
+    def test_gauges_are_set_and_cleared(self):
+        media = metrics.gauge("test_media_info", "Media", ["media_type"])
+        media.labels("Die-cut labels").set(1)
+        media.clear()
+        media.labels("Continuous length tape").set(1)
+
+        text = metrics.render({"test": metrics.snapshot()})
+        self.assertIn("# TYPE test_media_info gauge", text)
+        self.assertIn('test_media_info{process="test",media_type="Continuous length tape"} 1', text)
+        self.assertNotIn("Die-cut", text)
+
+    def test_same_name_is_same_metric(self):
+        self.assertIs(metrics.counter("test_shared_total", "Shared"), metrics.counter("test_shared_total", "Shared"))
+
+    def test_merge_processes(self):
+        jobs = metrics.counter("test_jobs_total", "Jobs")
+        jobs.inc()
+        snapshot = metrics.snapshot()
+        text = metrics.render({"webserver": snapshot, "spooler": snapshot})
+        self.assertEqual(text.count("# TYPE test_jobs_total counter"), 1)
+        self.assertIn('test_jobs_total{process="spooler"} 1', text)
+        self.assertIn('test_jobs_total{process="webserver"} 1', text)
+
+    def test_label_values_are_escaped(self):
+        errors = metrics.counter("test_errors_total", "Errors", ["reason"])
+        errors.labels('say "hi"\n').inc()
+        self.assertIn(r'reason="say \"hi\"\n"', metrics.render({"test": metrics.snapshot()}))
+
+    def test_write_scrape_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "nametags-test.prom")
+            metrics.write_scrape_file(file_path, "test")
+            with open(file_path) as f:
+                self.assertIn("# TYPE", f.read())
+            self.assertEqual(os.listdir(directory), ["nametags-test.prom"])
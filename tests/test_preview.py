@@ -0,0 +1,52 @@
+import threading
+import time
+from unittest import TestCase
+
+from nametags.preview import PreviewCache
+
+
+class TestPreviewCache(TestCase):
+    def test_repeat_previews_are_cached(self):
+        renders = []
+
+        def render(name, second_line):
+            renders.append(name)
+            return name.encode()
+
+        cache = PreviewCache(render=render)
+        (png, etag) = cache.get("Testy", None, "62x100")
+        self.assertEqual(cache.get("Testy", "  ", "62x100"), (png, etag))
+        self.assertEqual(renders, ["Testy"])
+
+    def test_etag_depends_on_label_size(self):
+        self.assertNotEqual(
+            PreviewCache.etag("Testy", None, "62x100"),
+            PreviewCache.etag("Testy", None, "62"),
+        )
+
+    def test_identical_renders_are_coalesced(self):
+        renders = []
+
+        def render(name, second_line):
+            renders.append(name)
+            time.sleep(0.2)
+            return name.encode()
+
+        cache = PreviewCache(render=render)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get("Testy", None, "62x100")))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(renders, ["Testy"])
+        self.assertEqual(len(set(results)), 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = PreviewCache(render=lambda name, second_line: name.encode(), max_entries=2)
+        for name in ("a", "b", "c"):
+            cache.get(name, None, "62x100")
+        self.assertEqual(len(cache._entries), 2)
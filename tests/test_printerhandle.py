@@ -0,0 +1,114 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from nametags.printerhandle import (
+    PrinterHandle,
+    PrinterNotFoundError,
+    PrinterStatusError,
+    sink_backend,
+    status_response,
+)
+
+
+PRINTING_COMPLETED = status_response(0x01)
+WAITING_TO_RECEIVE = status_response(0x06, 0x00)
+END_OF_MEDIA = status_response(0x02, error_info=0x02)
+
+
+class FakePrinter:
+    fail_writes = 0
+    responses_to_write = [PRINTING_COMPLETED, WAITING_TO_RECEIVE]
+
+    def __init__(self, device):
+        self.device = device
+        self.written = []
+        self.responses = []
+        self.disposed = False
+
+    def write(self, data):
+        if FakePrinter.fail_writes:
+            FakePrinter.fail_writes -= 1
+            raise OSError("No such device")
+        self.written.append(data)
+        self.responses = list(FakePrinter.responses_to_write)
+
+    def read(self):
+        return self.responses.pop(0) if self.responses else b""
+
+    def dispose(self):
+        self.disposed = True
+
+
+class TestPrinterHandle(TestCase):
+    def setUp(self):
+        self.discoveries = 0
+        self.devices = [{"identifier": "usb://0x04f9:0x209b_BROKEN", "instance": "device"}]
+
+        def list_available_devices():
+            self.discoveries += 1
+            return self.devices
+
+        backend = {"list_available_devices": list_available_devices, "backend_class": FakePrinter}
+        with patch("nametags.printerhandle.backend_factory", return_value=backend):
+            self.handle = PrinterHandle()
+        FakePrinter.fail_writes = 0
+        FakePrinter.responses_to_write = [PRINTING_COMPLETED, WAITING_TO_RECEIVE]
+
+    def test_discovers_once_across_jobs(self):
+        self.assertEqual(self.handle.identifier, "usb://0x04f9:0x209b")
+        for _ in range(3):
+            status = self.handle.send(b"job")
+            self.assertEqual(status["outcome"], "printed")
+        self.assertEqual(self.discoveries, 1)
+
+    def test_rediscovers_after_write_failure(self):
+        self.handle.send(b"job")
+        FakePrinter.fail_writes = 1
+        status = self.handle.send(b"job")
+        self.assertTrue(status["did_print"])
+        self.assertEqual(self.discoveries, 2)
+
+    def test_no_printer(self):
+        self.devices = []
+        with self.assertRaises(PrinterNotFoundError):
+            self.handle.send(b"job")
+
+    def test_ready_check_uses_the_last_status(self):
+        self.handle.send(b"job")
+        printer = self.handle._printer
+        self.handle.check_ready()
+        self.assertEqual(printer.written, [b"job"])
+
+    def test_ready_check_fails_when_out_of_labels(self):
+        self.handle.send(b"job")
+        FakePrinter.responses_to_write = [END_OF_MEDIA]
+        self.handle.status()
+        with self.assertRaisesRegex(PrinterStatusError, "End of media"):
+            self.handle.check_ready()
+
+        # A new roll is noticed on the next check
+        FakePrinter.responses_to_write = [PRINTING_COMPLETED]
+        self.handle.check_ready()
+
+
+class TestLabelSink(TestCase):
+    def test_file_sink_prints_and_keeps_labels(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            output = os.path.join(tempdir, "printed_labels.bin")
+            handle = PrinterHandle("file:" + output)
+            self.assertEqual(handle.identifier, "file://" + output)
+            handle.check_ready()
+            status = handle.send(b"label\x1a")
+            self.assertTrue(status["did_print"])
+            self.assertEqual(handle._printer.labels, 1)
+            with open(output, "rb") as f:
+                self.assertTrue(f.read().endswith(b"label\x1a"))
+
+    def test_null_sink_takes_print_time(self):
+        handle = PrinterHandle("null", backend=sink_backend(print_seconds=0.05))
+        start = time.monotonic()
+        self.assertEqual(handle.send(b"label\x1a")["outcome"], "printed")
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
@@ -0,0 +1,61 @@
+import random
+import sys
+from unittest import TestCase
+from unittest.mock import patch
+
+from brother_ql.conversion import convert
+from brother_ql.raster import BrotherQLRaster
+from PIL import Image, ImageDraw
+
+from nametags.rasterencoder import encode_raster
+
+
+def label_image(size, mode="RGB"):
+    """A label with grey edges to threshold, a box and some noise."""
+    image = Image.new(mode, size, "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, size[0] // 3, size[1] // 4), fill="black")
+    draw.text((size[0] // 2, size[1] // 2), "Grace Hopper", fill="black", font_size=80)
+    draw.ellipse((20, size[1] - 200, 300, size[1] - 20), outline="gray", width=9)
+    rng = random.Random(size[0] * size[1])
+    for _ in range(2000):
+        draw.point((rng.randrange(size[0]), rng.randrange(size[1])), fill=rng.choice(("black", "gray", "white")))
+    return image
+
+
+class TestEncodeRaster(TestCase):
+    def assertSameAsConvert(self, image, label="62x100", model="QL-800", **kwargs):
+        expected = convert(BrotherQLRaster(model), [image], label, **kwargs)
+        self.assertEqual(encode_raster(image, label, model, **kwargs), expected)
+
+    def test_die_cut_labels(self):
+        cases = {
+            "landscape RGB": label_image((1109, 696)),
+            "portrait RGB": label_image((696, 1109)),
+            "greyscale": label_image((1109, 696), "L"),
+            "1-bit": label_image((1109, 696), "1"),
+            "transparent": label_image((1109, 696), "RGBA").rotate(10),
+        }
+        for (name, image) in cases.items():
+            with self.subTest(name):
+                self.assertSameAsConvert(image)
+
+    def test_options(self):
+        image = label_image((1109, 696))
+        for kwargs in ({"cut": False}, {"threshold": 20}, {"threshold": 95}):
+            with self.subTest(**kwargs):
+                self.assertSameAsConvert(image, **kwargs)
+
+    def test_endless_label(self):
+        self.assertSameAsConvert(label_image((696, 400)), label="62")
+
+    def test_compression(self):
+        self.assertSameAsConvert(label_image((1109, 696)), model="QL-820NWB", compress=True)
+
+    def test_wrong_size_is_rejected_like_convert(self):
+        with self.assertRaises(ValueError):
+            encode_raster(label_image((500, 500)), "62x100", "QL-800")
+
+    def test_without_numpy(self):
+        with patch.dict(sys.modules, {"numpy": None}):
+            self.assertSameAsConvert(label_image((1109, 696)))
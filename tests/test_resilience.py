@@ -0,0 +1,73 @@
+import urllib.error
+from unittest import TestCase
+from unittest.mock import patch
+
+from nametags.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    Budget,
+    BudgetExceededError,
+    CircuitBreaker,
+    CircuitOpenError,
+    call_with_retries,
+)
+
+
+def server_error():
+    return urllib.error.HTTPError("http://example.com", 503, "Unavailable", {}, None)
+
+
+class TestCallWithRetries(TestCase):
+    def setUp(self):
+        patcher = patch("nametags.resilience.time.sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_transient_errors_are_retried(self):
+        calls = []
+
+        def call(timeout):
+            calls.append(timeout)
+            if len(calls) < 3:
+                raise server_error()
+            return "ok"
+
+        self.assertEqual(call_with_retries(call, Budget(5)), "ok")
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_are_not_retried(self):
+        calls = []
+
+        def call(timeout):
+            calls.append(timeout)
+            raise ValueError("bad request")
+
+        with self.assertRaises(ValueError):
+            call_with_retries(call, Budget(5))
+        self.assertEqual(len(calls), 1)
+
+    def test_spent_budget(self):
+        with self.assertRaises(BudgetExceededError):
+            call_with_retries(lambda timeout: "ok", Budget(0))
+
+
+class TestCircuitBreaker(TestCase):
+    def test_opens_then_lets_one_call_through_after_cooldown(self):
+        breaker = CircuitBreaker("test", threshold=2, cooldown=30)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        with patch("nametags.resilience.time.monotonic", return_value=breaker._opened_at + 31):
+            breaker.before_call()
+            self.assertEqual(breaker.state, HALF_OPEN)
+            with self.assertRaises(CircuitOpenError):
+                breaker.before_call()
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.before_call()
@@ -1,24 +1,120 @@
 """
 There's really no good way to test this project without actually running it
 on hardware (RFID reader and label printer). However, we can test the RFID
-lookup function against known RFID values.
+lookup function against known RFID values, served by a fake Wild Apricot.
 """
+import os
+import tempfile
+import threading
+import time
 from unittest import TestCase
 from unittest.mock import patch
 
-from nametags.rfid import lookup_rfid
+# rfid reads its credentials at import
+for variable in ("WA_CLIENT_ID", "WA_CLIENT_SECRET", "WA_API_KEY"):
+    os.environ.setdefault(variable, "fake")
+
+from nametags import rfid  # noqa: E402
+from nametags.fakewa import FakeWildApricot  # noqa: E402
+from nametags import rfidreader  # noqa: E402
+from nametags.memberindex import MemberIndex  # noqa: E402
+from nametags.resilience import CircuitBreaker  # noqa: E402
+from nametags.rfid import lookup_rfid  # noqa: E402
+from nametags.WaApi import WaApiClient  # noqa: E402
 
 
 class TestRfidLookup(TestCase):
+    def setUp(self):
+        self.fake = FakeWildApricot().start()
+        self.fake.add_contact(94877866, "1111111111", "testy")
+        self.fake.add_contact(86867117, "2222222222", "Formal", "nickname", "Second line")
+        self.tempdir = tempfile.TemporaryDirectory()
+        api = self.fake.make_client(refresh_in_background=False)
+        index = MemberIndex(os.path.join(self.tempdir.name, "members.sqlite3"))
+
+        patches = [
+            patch.object(rfid, "_api_client", api),
+            patch.object(rfid, "_contacts_url", None),
+            patch.object(rfid, "_member_index", index),
+            patch.dict(rfid._not_found_until, clear=True),
+            patch.object(rfid, "wa_breaker", CircuitBreaker("test", threshold=5, cooldown=60)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(api.close)
+        self.addCleanup(self.fake.stop)
+        self.addCleanup(self.tempdir.cleanup)
+
     def test_first_name(self):
         # ID: 94877866
-        first_name = lookup_rfid("1111111111")
+        (first_name, second_line) = lookup_rfid("1111111111")
         self.assertEqual(first_name, "testy")
+        self.assertIsNone(second_line)
 
     def test_preferred_name(self):
         # ID: 86867117
-        preferred_name = lookup_rfid("2222222222")
+        (preferred_name, second_line) = lookup_rfid("2222222222")
         self.assertEqual(preferred_name, "nickname")
+        self.assertEqual(second_line, "Second line")
+
+    def test_not_found(self):
+        self.assertEqual(lookup_rfid("3333333333"), (None, None))
+
+    def test_not_found_is_remembered(self):
+        lookup_rfid("3333333333")
+        lookup_rfid("3333333333")
+        with patch.object(rfid, "RFID_NEGATIVE_TTL", 0):
+            lookup_rfid("4444444444")
+            lookup_rfid("4444444444")
+        searches = [path for (_, path) in self.fake.requests if "substringof" in path]
+        self.assertEqual(len([path for path in searches if "3333333333" in path]), 1)
+        self.assertEqual(len([path for path in searches if "4444444444" in path]), 2)
+
+    def test_slow_request_is_retried(self):
+        self.fake.delay_next(seconds=2)
+        with patch.object(rfid, "WA_API_TIMEOUT", 0.2):
+            start = time.monotonic()
+            self.assertEqual(lookup_rfid("1111111111"), ("testy", None))
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_errors_are_retried(self):
+        self.fake.fail_next(2, status=503)
+        self.assertEqual(lookup_rfid("1111111111"), ("testy", None))
+
+    def test_lookup_gives_up_within_budget(self):
+        self.fake.delay_next(count=10, seconds=2)
+        with patch.object(rfid, "RFID_LOOKUP_BUDGET", 0.5):
+            start = time.monotonic()
+            self.assertEqual(lookup_rfid("1111111111"), (None, None))
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_authentication_counts_against_budget(self):
+        def make_client(*args, **kwargs):
+            return self.fake.configure_client(WaApiClient(*args, refresh_in_background=False, **kwargs))
+
+        self.fake.delay_next(count=10, seconds=2)
+        with patch.object(rfid, "_api_client", None), \
+             patch.object(rfid, "WaApiClient", make_client), \
+             patch.object(rfid, "RFID_LOOKUP_BUDGET", 0.5):
+            start = time.monotonic()
+            self.assertEqual(lookup_rfid("1111111111"), (None, None))
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_last_known_good_answer_when_api_is_down(self):
+        lookup_rfid("2222222222")
+        rfid._member_index.replace_all([])
+        self.fake.fail_next(10, status=500)
+        self.assertEqual(lookup_rfid("2222222222"), ("nickname", "Second line"))
+        self.assertEqual(lookup_rfid("1111111111"), (None, None))
+
+    def test_breaker_fails_fast(self):
+        self.fake.fail_next(100, status=500)
+        lookup_rfid("1111111111")
+        lookup_rfid("2222222222")
+        requests = len(self.fake.requests)
+        self.assertEqual(lookup_rfid("1111111111"), (None, None))
+        self.assertEqual(len(self.fake.requests), requests)
 
 
 class FakeEvent:
@@ -27,37 +123,90 @@ class FakeEvent:
         self.event_type = event_type
 
 
+def scan(tag):
+    return [FakeEvent(char) for char in tag] + [FakeEvent("enter")]
+
+
 class TestRfidListen(TestCase):
-    def test_listen_for_rfid(self):
-        # Simulate: invalid short RFID, invalid long RFID, then valid RFID, each followed by 'enter'
-        # Short: 5 digits, Long: 12 digits, Valid: 10 digits
-        events = (
-            [FakeEvent(str(d)) for d in range(1, 6)] + [FakeEvent("enter")]  # short
-            + [FakeEvent(str(d % 10)) for d in range(1, 13)] + [FakeEvent("enter")]  # long
-            + [FakeEvent(str(d)) for d in range(1, 10)] + [FakeEvent("0")] + [FakeEvent("enter")]  # valid: 1234567890
-        )
-        event_iter = iter(events)
+    def listen(self, events=None, reader=None, lookup_delay=0, print_errors=()):
+        """Run the listener over keyboard events, or a reader, and return the submit_print mock."""
+        event_iter = iter(events or [])
 
         def fake_read_event():
             try:
                 return next(event_iter)
             except StopIteration:
-                raise StopIteration  # Used to break the loop
+                raise StopIteration  # Used to stop the reader, which ends the loop
 
         def mock_lookup_rfid(rfid_tag):
+            time.sleep(lookup_delay)
             # Only return a name for the valid 10-digit RFID
-            if rfid_tag == "1234567890":
-                return "Test Name"
-            return None
+            if rfid_tag in ("1234567890", "1111111111"):
+                return ("Test Name", None)
+            return (None, None)
 
-        with patch('nametags.rfid.keyboard.read_event', fake_read_event), \
+        open_reader = rfidreader.KeyboardReader().start if reader is None else reader.start
+        with patch('keyboard.read_event', fake_read_event), \
+             patch('nametags.rfid.open_reader', open_reader), \
              patch('nametags.rfid.lookup_rfid', side_effect=mock_lookup_rfid), \
-             patch('nametags.rfid.print_name') as mock_print_name, \
+             patch('nametags.spooler.prints_in_process', return_value=False), \
+             patch('nametags.spooler.submit_print') as mock_print_name, \
+             patch('nametags.rfid.start_member_index_sync'), \
+             patch('nametags.warmup.warm_up'), \
+             patch.dict(rfid._last_scanned, clear=True), \
+             patch('nametags.rfidreader.logger'), \
              patch('nametags.rfid.logger'):
-            try:
-                from nametags import rfid
-                rfid.listen_for_rfid()
-            except StopIteration:
-                pass
-            # Only the valid RFID should trigger print_name
-            mock_print_name.assert_called_once_with("Test Name")
+            mock_print_name.side_effect = [*print_errors, *[None] * 10]
+            rfid.listen_for_rfid()
+        return mock_print_name
+
+    def test_listen_for_rfid(self):
+        # Simulate: invalid short RFID, invalid long RFID, then valid RFID, each followed by 'enter'
+        # Short: 5 digits, Long: 12 digits, Valid: 10 digits
+        events = (
+            [FakeEvent(str(d)) for d in range(1, 6)] + [FakeEvent("enter")]  # short
+            + [FakeEvent(str(d % 10)) for d in range(1, 13)] + [FakeEvent("enter")]  # long
+            + [FakeEvent(str(d)) for d in range(1, 10)] + [FakeEvent("0")] + [FakeEvent("enter")]  # valid: 1234567890
+        )
+        mock_print_name = self.listen(events)
+        # Only the valid RFID should trigger submit_print
+        mock_print_name.assert_called_once_with("Test Name", None)
+
+    def test_repeat_scans_print_once(self):
+        mock_print_name = self.listen(scan("1234567890") * 3)
+        mock_print_name.assert_called_once_with("Test Name", None)
+
+    def test_scan_after_window_prints_again(self):
+        with patch.object(rfid, "RFID_DEDUPE_SECONDS", 0):
+            mock_print_name = self.listen(scan("1234567890") * 2)
+        self.assertEqual(mock_print_name.call_count, 2)
+
+    def test_evdev_reader(self):
+        device = rfidreader.FakeInputDevice()
+        for tag in ("1234567890", "12345", "1111111111"):
+            device.scan(tag)
+        device.close()
+        mock_print_name = self.listen(reader=rfidreader.EvdevReader(device))
+        self.assertEqual(mock_print_name.call_count, 2)
+        self.assertFalse(device.grabbed)
+
+    def test_scans_are_kept_during_slow_lookups(self):
+        device = rfidreader.FakeInputDevice()
+        device.scan("1234567890")
+
+        def scan_while_busy():
+            time.sleep(0.05)  # While the first lookup is running
+            device.scan("1111111111")
+            device.close()
+
+        threading.Thread(target=scan_while_busy).start()
+        mock_print_name = self.listen(reader=rfidreader.EvdevReader(device), lookup_delay=0.2)
+        self.assertEqual(mock_print_name.call_count, 2)
+
+    def test_listener_survives_print_failures(self):
+        device = rfidreader.FakeInputDevice()
+        for tag in ("1234567890", "1111111111"):
+            device.scan(tag)
+        device.close()
+        mock_print_name = self.listen(reader=rfidreader.EvdevReader(device), print_errors=[TimeoutError("timed out")])
+        self.assertEqual(mock_print_name.call_count, 2)
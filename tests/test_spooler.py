@@ -0,0 +1,224 @@
+import threading
+import time
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+
+from nametags import printer
+from nametags import spooler as spooler_module
+from nametags.printer import send_raster
+from nametags.printerhandle import LabelSink, PrinterHandle, sink_backend, status_response
+from nametags.spooler import (
+    DONE,
+    FAILED,
+    Spooler,
+    SpoolerClient,
+    SpoolerError,
+    SpoolerServer,
+    get_job_status,
+    serve_forever,
+    spooler_is_running,
+    start_server,
+    submit_print,
+)
+
+
+def wait_for_state(spooler, job_id, states, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = spooler.status(job_id)
+        if status is not None and status["state"] in states:
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} never reached {states}")
+
+
+class TestSpooler(TestCase):
+    def test_jobs_print_in_order(self):
+        printed = []
+        spooler = Spooler(render=lambda name, second_line: name.encode(), send=printed.append).start()
+        job_ids = [spooler.submit(name, None) for name in ("a", "b", "c")]
+        for job_id in job_ids:
+            wait_for_state(spooler, job_id, (DONE,))
+        self.assertEqual(printed, [b"a", b"b", b"c"])
+
+    def test_next_job_renders_while_printing(self):
+        printing = threading.Event()
+        release = threading.Event()
+        rendered = []
+
+        def render(name, second_line):
+            rendered.append(name)
+            return name.encode()
+
+        def send(qr_data):
+            printing.set()
+            release.wait(5)
+
+        spooler = Spooler(render=render, send=send).start()
+        first = spooler.submit("a", None)
+        printing.wait(5)
+        second = spooler.submit("b", None)
+        deadline = time.monotonic() + 5
+        while "b" not in rendered and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(rendered, ["a", "b"])
+        release.set()
+        wait_for_state(spooler, first, (DONE,))
+        wait_for_state(spooler, second, (DONE,))
+
+    def test_render_failure_is_reported(self):
+        def render(name, second_line):
+            raise ValueError("bad label")
+
+        spooler = Spooler(render=render, send=lambda qr_data: None).start()
+        status = wait_for_state(spooler, spooler.submit("a", None), (FAILED,))
+        self.assertEqual(status["error"], "bad label")
+
+
+class FailingSink(LabelSink):
+    """Answers status requests, but reports `responses` after a label."""
+
+    responses = []
+
+    def write(self, data):
+        super().write(data)
+        if data.endswith(b"\x1a"):
+            self._responses = list(FailingSink.responses)
+
+
+class TestPrintOutcome(TestCase):
+    def setUp(self):
+        backend = {**sink_backend(), "backend_class": FailingSink}
+        patcher = mock.patch.object(printer, "_printer_handle", PrinterHandle("null", backend=backend))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.spooler = Spooler(render=lambda name, second_line: b"label\x1a", send=send_raster).start()
+
+    def test_printer_error_fails_the_job(self):
+        FailingSink.responses = [status_response(0x02, error_info=0x02)]
+        status = wait_for_state(self.spooler, self.spooler.submit("a", None), (DONE, FAILED))
+        self.assertEqual(status["state"], FAILED)
+        self.assertIn("End of media", status["error"])
+
+    def test_unconfirmed_print_fails_the_job(self):
+        FailingSink.responses = []
+        with mock.patch("nametags.printerhandle.RESPONSE_TIMEOUT", 0.1):
+            status = wait_for_state(self.spooler, self.spooler.submit("a", None), (DONE, FAILED))
+        self.assertEqual(status["state"], FAILED)
+        self.assertIn("didn't confirm", status["error"])
+
+
+class TestSpoolerServer(TestCase):
+    def test_submit_and_status_over_socket(self):
+        spooler = Spooler(render=lambda name, second_line: b"", send=lambda qr_data: None).start()
+        with TemporaryDirectory() as tmp_dir:
+            socket_path = path.join(tmp_dir, "spooler.sock")
+            with SpoolerServer(socket_path, spooler) as server:
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                client = SpoolerClient(socket_path)
+                job_id = client.submit("Testy", "she/her")
+                wait_for_state(client, job_id, (DONE,))
+                self.assertIsNone(client.status("nonexistent"))
+                server.shutdown()
+
+
+class TestSpoolerSocket(TestCase):
+    def test_running_spooler_keeps_its_socket(self):
+        spooler = Spooler(render=lambda name, second_line: b"", send=lambda qr_data: None)
+        with TemporaryDirectory() as tmp_dir:
+            socket_path = path.join(tmp_dir, "spooler.sock")
+            with SpoolerServer(socket_path, spooler) as server:
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                with self.assertRaises(OSError):
+                    SpoolerServer(socket_path, spooler)
+                self.assertIsNotNone(SpoolerClient(socket_path).metrics())
+                server.shutdown()
+
+            # The stale socket left behind is replaced
+            with SpoolerServer(socket_path, spooler):
+                pass
+
+
+class TestServedSpooler(TestCase):
+    def tearDown(self):
+        spooler_module._served_spooler = None
+
+    def test_jobs_from_this_process_skip_the_socket(self):
+        printed = []
+        spooler = Spooler(render=lambda name, second_line: name.encode(), send=printed.append).start()
+        with TemporaryDirectory() as tmp_dir:
+            server = start_server(spooler, path.join(tmp_dir, "spooler.sock"))
+            with mock.patch.object(SpoolerClient, "submit", side_effect=AssertionError("used the socket")):
+                job_id = submit_print("Testy", None)
+            wait_for_state(spooler, job_id, (DONE,))
+            self.assertEqual(get_job_status(job_id)["state"], DONE)
+            self.assertEqual(printed, [b"Testy"])
+            server.shutdown()
+            server.server_close()
+
+
+class TestDaemon(TestCase):
+    def test_jobs_queue_while_warming_up(self):
+        warmed_up = threading.Event()
+        printed = []
+        servers = []
+
+        class RecordedServer(SpoolerServer):
+            def __init__(self, socket_path, spooler):
+                super().__init__(socket_path, spooler)
+                servers.append(self)
+
+        def make_spooler():
+            return Spooler(render=lambda name, second_line: name.encode(), send=printed.append)
+
+        with TemporaryDirectory() as tmp_dir, \
+             mock.patch.object(spooler_module, "Spooler", make_spooler), \
+             mock.patch.object(spooler_module, "SpoolerServer", RecordedServer), \
+             mock.patch("nametags.warmup.warm_up", side_effect=lambda **steps: warmed_up.wait(5)), \
+             mock.patch("nametags.keepalive.keep_printer_awake"), \
+             mock.patch("nametags.metrics.start_scrape_file_writer"):
+            socket_path = path.join(tmp_dir, "spooler.sock")
+            threading.Thread(target=serve_forever, args=(socket_path,), daemon=True).start()
+            deadline = time.monotonic() + 5
+            while not spooler_is_running(socket_path) and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            # Listening before the printer is ready, so nobody else opens it
+            client = SpoolerClient(socket_path)
+            job_id = client.submit("Testy", None)
+            time.sleep(0.1)
+            self.assertEqual(client.status(job_id)["state"], "queued")
+            self.assertEqual(printed, [])
+
+            warmed_up.set()
+            wait_for_state(client, job_id, (DONE,))
+            self.assertEqual(printed, [b"Testy"])
+            servers[0].shutdown()
+            servers[0].server_close()
+
+
+class TestClientFallback(TestCase):
+    def test_waits_for_a_configured_daemon(self):
+        with mock.patch.object(spooler_module, "SPOOLER_DAEMON", True), \
+             mock.patch.object(SpoolerClient, "submit", side_effect=[FileNotFoundError(), "job123"]), \
+             mock.patch("nametags.spooler.time.sleep"), \
+             mock.patch("nametags.spooler.get_local_spooler") as get_local_spooler:
+            self.assertEqual(submit_print("Testy", None), "job123")
+        get_local_spooler.assert_not_called()
+
+    def test_never_prints_here_with_a_configured_daemon(self):
+        with mock.patch.object(spooler_module, "SPOOLER_DAEMON", True), \
+             mock.patch.object(spooler_module, "SPOOLER_WAIT", 0), \
+             mock.patch.object(SpoolerClient, "submit", side_effect=ConnectionRefusedError()), \
+             mock.patch("nametags.spooler.get_local_spooler") as get_local_spooler:
+            with self.assertRaises(SpoolerError):
+                submit_print("Testy", None)
+        get_local_spooler.assert_not_called()
+
+    def test_prints_here_without_a_daemon(self):
+        with mock.patch.object(spooler_module, "SPOOLER_DAEMON", False), \
+             mock.patch.object(SpoolerClient, "submit", side_effect=FileNotFoundError()), \
+             mock.patch("nametags.spooler.get_local_spooler") as get_local_spooler:
+            get_local_spooler.return_value.submit.return_value = "local-job"
+            self.assertEqual(submit_print("Testy", None), "local-job")
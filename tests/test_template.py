@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+from helpers import fake_wand
+from PIL import Image, ImageChops
+
+from nametags.printer import make_image
+from nametags.template import clear_template_cache, get_label_template
+
+# Labels drawn from scratch by make_image before templates existed, with the
+# stand-in logo. Both names fit at the largest font size, so the font fitting
+# that came later doesn't change them.
+GOLDEN_DIR = Path(__file__).parent / "golden"
+GOLDEN_LABELS = {"bob.png": ("Bob", None), "ada-she-her.png": ("Ada", "she/her")}
+
+
+class TestLabelTemplate(TestCase):
+    def setUp(self):
+        patcher = patch.dict(sys.modules, fake_wand())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clear_template_cache()
+        self.addCleanup(clear_template_cache)
+
+    def test_template_is_built_once(self):
+        self.assertIs(get_label_template("62x100"), get_label_template("62x100"))
+
+    def test_label_from_template_matches_one_drawn_from_scratch(self):
+        # After drawing other names on copies of the template
+        make_image("Maximilian Bartholomew", "Woodshop")
+        for (file_name, (name, second_line)) in GOLDEN_LABELS.items():
+            with self.subTest(name):
+                with Image.open(GOLDEN_DIR / file_name) as golden:
+                    from_template = make_image(name, second_line)
+                    self.assertEqual(golden.size, from_template.size)
+                    self.assertIsNone(ImageChops.difference(golden.convert("RGB"), from_template).getbbox())
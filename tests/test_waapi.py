@@ -0,0 +1,108 @@
+"""
+WaApiClient against a local stand-in for the Wild Apricot API.
+"""
+import copy
+import datetime
+import json
+import pickle
+import time
+from unittest import TestCase
+
+from nametags.fakewa import FakeWildApricot
+from nametags.WaApi import ApiException, ApiObject
+
+
+class TestWaApiClient(TestCase):
+    def setUp(self):
+        self.fake = FakeWildApricot().start()
+        self.addCleanup(self.fake.stop)
+
+    def test_requests_reuse_connection(self):
+        api = self.fake.make_client()
+        self.addCleanup(api.close)
+        for _ in range(5):
+            accounts = api.execute_request("/v2/accounts/")
+            self.assertEqual(accounts[0].Id, 1)
+        self.assertEqual(self.fake.connections, 1)
+
+    def test_bad_request_raises_api_exception(self):
+        api = self.fake.make_client()
+        self.addCleanup(api.close)
+        self.fake.fail_next(status=400)
+        with self.assertRaises(ApiException):
+            api.execute_request("/v2/accounts/")
+
+    def test_expired_token_is_refreshed(self):
+        api = self.fake.make_client(refresh_in_background=False)
+        self.addCleanup(api.close)
+        api.execute_request("/v2/accounts/")
+        self.assertEqual(self.count_token_requests(), 1)
+
+        # Token retrieved two hours ago, in any timezone
+        api._token.retrieved_at -= datetime.timedelta(hours=2)
+        api.execute_request("/v2/accounts/")
+        self.assertEqual(self.count_token_requests(), 2)
+
+    def test_fresh_token_is_not_refreshed(self):
+        api = self.fake.make_client(refresh_in_background=False)
+        self.addCleanup(api.close)
+        for _ in range(3):
+            api.execute_request("/v2/accounts/")
+        self.assertEqual(self.count_token_requests(), 1)
+
+    def test_token_is_refreshed_in_background(self):
+        self.fake.token_lifetime = 0.2
+        api = self.fake.make_client()
+        self.addCleanup(api.close)
+        deadline = time.monotonic() + 5
+        while self.count_token_requests() < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(self.count_token_requests(), 2)
+
+    def count_token_requests(self):
+        return sum(1 for (_, path) in self.fake.requests if path == "/auth/token")
+
+
+class TestApiObject(TestCase):
+    def setUp(self):
+        self.contact = ApiObject({
+            "Id": 1,
+            "Organization": {"Name": "PS:1"},
+            "FieldValues": [
+                {"SystemCode": "FirstName", "Value": "Testy"},
+                {"SystemCode": "custom-1", "Value": {"Id": 5, "Label": "Yes"}},
+            ],
+        })
+
+    def test_nested_values_are_wrapped(self):
+        self.assertEqual(self.contact.Organization.Name, "PS:1")
+        self.assertEqual(self.contact.FieldValues[0].SystemCode, "FirstName")
+        self.assertEqual(len(self.contact.FieldValues), 2)
+
+    def test_missing_attribute(self):
+        self.assertFalse(hasattr(self.contact, "Contacts"))
+
+    def test_get_field_value(self):
+        self.assertEqual(self.contact.get_field_value("FirstName"), "Testy")
+        self.assertEqual(self.contact.get_field_value("custom-1").Label, "Yes")
+        self.assertIsNone(self.contact.get_field_value("custom-2"))
+
+    def test_field_value_sees_changed_entries(self):
+        self.assertEqual(self.contact.get_field_value("FirstName"), "Testy")
+        self.contact.FieldValues[0].Value = "Changed"
+        self.assertEqual(self.contact.get_field_value("FirstName"), "Changed")
+
+    def test_copy_and_pickle(self):
+        copies = {
+            "copy": copy.copy(self.contact),
+            "deepcopy": copy.deepcopy(self.contact),
+            "pickle": pickle.loads(pickle.dumps(self.contact)),
+        }
+        for (how, copied) in copies.items():
+            with self.subTest(how):
+                self.assertEqual(copied.to_dict(), self.contact.to_dict())
+                self.assertEqual(copied.get_field_value("FirstName"), "Testy")
+
+    def test_set_attribute_round_trips_to_json(self):
+        self.contact.Email = "testy@example.com"
+        self.assertEqual(json.loads(str(self.contact))["Email"], "testy@example.com")
@@ -0,0 +1,146 @@
+"""
+Call the ASGI app directly, with the spooler replaced by a fake.
+"""
+import asyncio
+import json
+import threading
+import time
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock, patch
+
+from nametags import webserver
+from nametags.preview import PreviewCache
+from nametags.spooler import SpoolerError
+
+
+async def call(method, path, body=b"", query_string=b"", headers=()):
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": [(b"content-type", b"application/x-www-form-urlencoded"), *headers],
+    }
+    await webserver.asgi_app(scope, receive, send)
+    body = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+    return (sent[0]["status"], body, dict(sent[0]["headers"]))
+
+
+class TestPrintEndpoint(IsolatedAsyncioTestCase):
+    async def test_post_returns_job_id(self):
+        with patch("nametags.webserver.submit_print_async", AsyncMock(return_value="job123")) as submit:
+            (status, body, _) = await call("POST", "/", b"name=Testy&second_line=she%2Fher")
+        self.assertEqual(status, 200)
+        self.assertIn(b'"job123"', body)
+        submit.assert_awaited_once_with("Testy", "she/her")
+
+    async def test_post_without_name_is_rejected(self):
+        with patch("nametags.webserver.submit_print_async", AsyncMock()) as submit:
+            (status, _, _) = await call("POST", "/", b"second_line=x")
+        self.assertEqual(status, 400)
+        submit.assert_not_awaited()
+
+    async def test_post_without_spooler_is_unavailable(self):
+        with patch("nametags.webserver.submit_print_async", AsyncMock(side_effect=SpoolerError("down"))):
+            (status, _, _) = await call("POST", "/", b"name=Testy&second_line=")
+        self.assertEqual(status, 503)
+
+    async def test_job_status(self):
+        job = {"job_id": "job123", "state": "printing", "error": None}
+        with patch("nametags.webserver.get_job_status_async", AsyncMock(return_value=job)):
+            (status, body, _) = await call("GET", "/jobs/job123")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["state"], "printing")
+
+    async def test_unknown_job(self):
+        with patch("nametags.webserver.get_job_status_async", AsyncMock(return_value=None)):
+            (status, _, _) = await call("GET", "/jobs/nope")
+        self.assertEqual(status, 404)
+
+
+class TestPreviewEndpoint(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.renders = []
+        self.rendering = threading.Event()
+
+        def render(name, second_line):
+            self.renders.append(name)
+            self.rendering.set()
+            time.sleep(0.3)
+            return b"png of " + name.encode()
+
+        patcher = patch("nametags.webserver.preview_cache", PreviewCache(render=render))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_concurrent_previews_render_once_without_blocking(self):
+        job = {"job_id": "job123", "state": "done", "error": None}
+        with patch("nametags.webserver.get_job_status_async", AsyncMock(return_value=job)):
+            previews = [
+                asyncio.create_task(call("GET", "/preview.png", query_string=b"name=Testy&second_line="))
+                for _ in range(5)
+            ]
+            await asyncio.to_thread(self.rendering.wait, 5)
+
+            # Other pages are answered while the preview renders
+            start = time.monotonic()
+            (status, _, _) = await call("GET", "/jobs/job123")
+            self.assertEqual(status, 200)
+            self.assertLess(time.monotonic() - start, 0.2)
+
+            results = await asyncio.gather(*previews)
+        self.assertEqual(self.renders, ["Testy"])
+        self.assertEqual({body for (_, body, _) in results}, {b"png of Testy"})
+
+    async def test_revalidation_skips_rendering(self):
+        (status, _, headers) = await call("GET", "/preview.png", query_string=b"name=Testy")
+        self.assertEqual(status, 200)
+        (status, body, _) = await call(
+            "GET", "/preview.png", query_string=b"name=Testy", headers=[(b"if-none-match", headers[b"etag"])]
+        )
+        self.assertEqual((status, body), (304, b""))
+        self.assertEqual(self.renders, ["Testy"])
+
+
+class TestLifespan(IsolatedAsyncioTestCase):
+    async def test_warms_up_before_startup_completes(self):
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        with patch("nametags.webserver.warm_up_webserver") as warm_up:
+            await webserver.asgi_app({"type": "lifespan"}, receive, send)
+        warm_up.assert_called_once()
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
+
+class TestMetricsEndpoint(TestCase):
+    def setUp(self):
+        self.client = webserver.app.test_client()
+
+    def test_metrics_include_spooler(self):
+        snapshot = {"nametag_spooler_jobs": {"type": "counter", "help": "Jobs", "labelnames": [], "series": [[[], 2]]}}
+        with patch("nametags.webserver.SpoolerClient.metrics", return_value=snapshot):
+            response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'nametag_spooler_jobs{process="spooler"} 2', response.data)
+
+    def test_metrics_without_spooler(self):
+        with patch("nametags.webserver.SpoolerClient.metrics", side_effect=FileNotFoundError):
+            response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'process="spooler"', response.data)